@@ -0,0 +1,60 @@
+'''
+Cost of writing many drinks: one transaction per drink, as POST /drinks
+does, against POST /drinks/bulk and the NDJSON export
+
+    python -m benchmarks.bench_bulk [count]
+
+    run from the backend directory, count defaults to 5000
+'''
+
+import sys
+import time
+
+from src.database import models
+
+from .common import ALL_PERMISSIONS, LocalIssuer, load_app
+
+RECIPE = [{'name': 'espresso', 'color': 'brown', 'parts': 1},
+          {'name': 'milk', 'color': 'white', 'parts': 3}]
+
+
+def drinks(prefix, count):
+    return [{'title': f'{prefix} {i}', 'recipe': RECIPE} for i in range(count)]
+
+
+def measure(name, count, fn):
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    print(f'{name:<40} {seconds:>8.2f} s {count / seconds:>10.0f} drinks/s')
+
+
+def main(count=5000):
+    issuer = LocalIssuer()
+    app = load_app(issuer)
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + issuer.mint(ALL_PERMISSIONS)}
+
+    def one_by_one():
+        with app.app_context():
+            for item in drinks('single', count):
+                models.Drink(**models.validate_drink(item)).insert()
+
+    def bulk(upsert=False):
+        response = client.post('/drinks/bulk', headers=headers, json={
+            'drinks': drinks('bulk', count), 'upsert': upsert})
+        assert not response.get_json()['errors']
+
+    def export():
+        response = client.get('/drinks/export', headers=headers)
+        assert len(response.get_data().splitlines()) == 2 * count
+
+    measure('one transaction per drink', count, one_by_one)
+    measure('POST /drinks/bulk (insert)', count, bulk)
+    measure('POST /drinks/bulk (upsert, all exist)', count,
+            lambda: bulk(upsert=True))
+    measure('GET /drinks/export', 2 * count, export)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
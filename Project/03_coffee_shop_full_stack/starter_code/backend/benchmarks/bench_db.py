@@ -0,0 +1,120 @@
+'''
+Concurrent reads and writes against SQLite, with the rollback journal
+settings SQLite ships with and with the WAL profile of setup_db
+
+    python -m benchmarks.bench_db [seconds] [readers]
+
+    run from the backend directory, defaults to 5 seconds and 8 readers
+    each profile runs in its own process, its settings passed through the
+    SQLITE_* env vars read by setup_db
+'''
+
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from sqlalchemy.exc import OperationalError
+
+from src.database.models import Drink, db
+
+from .common import LocalIssuer, generate_drinks, load_app, percentile
+
+RECIPE = '[{"name": "milk", "color": "white", "parts": 1}]'
+
+PROFILES = (
+    ('rollback journal (SQLite defaults)', {
+        'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL',
+        'SQLITE_MMAP_SIZE': '0', 'SQLITE_CACHE_SIZE': '-2000'
+    }),
+    ('WAL profile', {}),
+)
+
+
+def run(seconds, readers):
+    app = load_app(LocalIssuer())
+    generate_drinks(app, 10000)
+
+    deadline = time.perf_counter() + seconds
+    reads, writes, errors = [], [], []
+
+    # Straight through the session: the request handling around it would
+    # otherwise take most of the single GIL.
+    def read(index):
+        cursor = index * 1000
+
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+
+                try:
+                    db.session.query(Drink.id, Drink.title, Drink.recipe)\
+                        .filter(Drink.id > cursor).order_by(Drink.id)\
+                        .limit(100).all()
+                    db.session.commit()
+                except OperationalError:
+                    db.session.rollback()
+                    errors.append('read')
+
+                reads.append(time.perf_counter() - start)
+                cursor = (cursor + 100) % 9900
+
+    def write():
+        number = 0
+
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+
+                try:
+                    Drink(title=f'new {number}', recipe=RECIPE).insert()
+                except OperationalError:
+                    db.session.rollback()
+                    errors.append('write')
+
+                writes.append(time.perf_counter() - start)
+                number += 1
+
+    threads = [threading.Thread(target=read, args=(index,))
+               for index in range(readers)]
+    threads.append(threading.Thread(target=write))
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        'reads/s': len(reads) / seconds,
+        'read p99 ms': percentile(reads, 99) * 1e3,
+        'writes/s': len(writes) / seconds,
+        'write p99 ms': percentile(writes, 99) * 1e3,
+        'errors': len(errors)
+    }))
+
+
+def main(seconds=5, readers=8):
+    print(f'{readers} reader threads, 1 writer thread, {seconds} s')
+
+    for name, env in PROFILES:
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.bench_db', '--run',
+             str(seconds), str(readers)],
+            env=dict(os.environ, **env), capture_output=True, text=True,
+            check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+
+        print(name)
+
+        for metric, value in result.items():
+            print(f'    {metric:<16} {value:>10.1f}')
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--run']:
+        run(*[int(arg) for arg in sys.argv[2:4]])
+    else:
+        main(*[int(arg) for arg in sys.argv[1:3]])
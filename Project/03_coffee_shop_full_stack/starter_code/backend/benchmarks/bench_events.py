@@ -0,0 +1,159 @@
+'''
+Cost of the GET /drinks/events streams, over HTTP against a threaded server
+running in this process
+    the CPU time the whole process uses while subscribers sit idle
+    the time from a POST /drinks to its event reaching every subscriber
+    a reconnection with Last-Event-ID getting the events it missed
+
+    python -m benchmarks.bench_events [subscribers] [--idle SECONDS]
+
+    run from the backend directory, subscribers default to 300
+    the content of the events and of the replay is checked by
+    tests/test_events.py
+'''
+
+import argparse
+import http.client
+import json
+import logging
+import selectors
+import socket
+import threading
+import time
+
+from werkzeug.serving import make_server
+
+from .common import ALL_PERMISSIONS, LocalIssuer, load_app, percentile
+
+
+class Stream:
+    """
+    A raw GET /drinks/events connection, read without blocking.
+    """
+
+    def __init__(self, port, token, last_event_id=None):
+        self.sock = socket.create_connection(('127.0.0.1', port))
+        headers = f'Authorization: Bearer {token}\r\n'
+
+        if last_event_id:
+            headers += f'Last-Event-ID: {last_event_id}\r\n'
+
+        self.sock.sendall(f'GET /drinks/events HTTP/1.1\r\nHost: bench\r\n'
+                          f'{headers}\r\n'.encode('ascii'))
+        self.buffer = b''
+        self.events = []
+
+    def read(self):
+        data = self.sock.recv(65536)
+        self.buffer += data
+
+        # Frames end with a blank line, the first one follows the headers.
+        *frames, self.buffer = self.buffer.split(b'\n\n')
+
+        for frame in frames:
+            fields = dict(line.split(': ', 1) for line in
+                          frame.decode('utf-8').split('\n')
+                          if ': ' in line and not line.startswith(':'))
+
+            if 'event' in fields:
+                self.events.append(fields)
+
+        return data
+
+    def wait(self, count, timeout=10):
+        deadline = time.monotonic() + timeout
+        self.sock.settimeout(timeout)
+
+        while len(self.events) < count and time.monotonic() < deadline:
+            self.read()
+
+    def close(self):
+        self.sock.close()
+
+
+def post_drink(port, token, title):
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('POST', '/drinks', json.dumps({
+        'title': title,
+        'recipe': [{'name': 'espresso', 'color': 'brown', 'parts': 1}]
+    }), {'Authorization': 'Bearer ' + token,
+         'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    assert response.status == 200, response.status
+
+
+def main(subscribers=300, idle=5.0, posts=20):
+    issuer = LocalIssuer()
+    app = load_app(issuer)
+    events = app.extensions['drink_events']
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    port = server.server_port
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    token = issuer.mint(ALL_PERMISSIONS)
+    short_token = issuer.mint(('get:drinks', 'post:drinks'))
+    streams = [Stream(port, token if i % 2 else short_token)
+               for i in range(subscribers)]
+
+    while len(events) < subscribers:
+        time.sleep(0.05)
+
+    print(f'{subscribers} subscribers connected')
+
+    time.sleep(0.5)
+    start_cpu, start = time.process_time(), time.perf_counter()
+    time.sleep(idle)
+    cpu = time.process_time() - start_cpu
+    print(f'idle for {time.perf_counter() - start:.1f} s: '
+          f'{cpu * 1000:.1f} ms of CPU ({cpu / idle * 100:.2f} % of a core)')
+
+    selector = selectors.DefaultSelector()
+
+    for stream in streams:
+        stream.sock.setblocking(False)
+        selector.register(stream.sock, selectors.EVENT_READ, stream)
+
+    latencies = []
+
+    for n in range(posts):
+        pending = set(streams)
+        start = time.perf_counter()
+        post_drink(port, token, f'event drink {n}')
+
+        while pending:
+            for key, _ in selector.select(timeout=10):
+                stream = key.data
+                stream.read()
+
+                if len(stream.events) > n:
+                    pending.discard(stream)
+
+        latencies.append(time.perf_counter() - start)
+
+    print(f'POST /drinks to all {subscribers} subscribers: '
+          f'p50 {percentile(latencies, 50) * 1000:.1f} ms, '
+          f'p95 {percentile(latencies, 95) * 1000:.1f} ms')
+
+    # Reconnecting after the first event: the other ones are replayed.
+    first_id = streams[0].events[0]['id']
+    replay = Stream(port, token, last_event_id=first_id)
+    replay.wait(posts - 1)
+    print(f'Last-Event-ID replay: {len(replay.events)} missed events')
+
+    for stream in streams + [replay]:
+        stream.close()
+
+    events.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('subscribers', nargs='?', type=int, default=300)
+    parser.add_argument('--idle', type=float, default=5.0)
+    args = parser.parse_args()
+    main(args.subscribers, args.idle)
@@ -0,0 +1,76 @@
+'''
+Cost of JSON on large /drinks-detail payloads, with Flask's default provider
+and with src.codec (orjson): the response body alone, the recipe parsing
+and the whole request
+
+    python -m benchmarks.bench_json [sizes...]
+
+    run from the backend directory, sizes default to 10000 50000
+'''
+
+import json
+import sys
+
+from flask.json.provider import DefaultJSONProvider
+
+from src import codec
+from src.database.models import Drink, db, format_drink
+
+from .common import (ALL_PERMISSIONS, LocalIssuer, generate_drinks, load_app,
+                     report, timeit)
+
+
+def main(sizes=(10000, 50000)):
+    issuer = LocalIssuer()
+    app = load_app(issuer)
+    app.config['DRINKS_CACHE_ENABLED'] = False
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + issuer.mint(ALL_PERMISSIONS)}
+    providers = (('json', DefaultJSONProvider(app)),
+                 ('orjson', codec.JSONProvider(app)))
+
+    if codec.orjson is None:
+        print('orjson is not installed, src.codec falls back to json')
+
+    generated = 0
+
+    for size in sizes:
+        generate_drinks(app, size, first=generated)
+        generated = size
+        print(f'{size} drinks')
+
+        with app.app_context():
+            rows = db.session.query(Drink.id, Drink.title, Drink.recipe).all()
+            body = {'success': True,
+                    'drinks': [format_drink(row, 'long') for row in rows]}
+            recipes = [row.recipe for row in rows]
+
+        bodies = {}
+
+        with app.test_request_context():
+            for name, provider in providers:
+                bodies[name] = provider.response(body).get_data()
+                report(f'  response body ({name})',
+                       timeit(lambda: provider.response(body), 5))
+
+        assert bodies['json'] == bodies['orjson'], 'the bodies differ'
+        print(f'  {len(bodies["json"])} bytes, identical')
+
+        report('  recipe parsing (json)',
+               timeit(lambda: [json.loads(r) for r in recipes], 5))
+        report('  recipe parsing (codec)',
+               timeit(lambda: [codec.loads(r) for r in recipes], 5))
+
+        for name, provider in providers:
+            app.json = provider
+
+            def get():
+                response = client.get('/drinks-detail', headers=headers)
+                response.get_data()
+                assert response.status_code == 200, response.status_code
+
+            report(f'  GET /drinks-detail ({name})', timeit(get, 3))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or (10000, 50000))
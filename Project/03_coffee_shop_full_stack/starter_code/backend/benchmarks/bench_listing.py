@@ -0,0 +1,50 @@
+'''
+Latency of the drink listings on large menus: full list, a page, a
+projection and a streamed body
+
+    python -m benchmarks.bench_listing [sizes...]
+
+    run from the backend directory, sizes default to 10000 100000
+'''
+
+import sys
+
+from .common import (ALL_PERMISSIONS, LocalIssuer, generate_drinks, load_app,
+                     report, timeit)
+
+QUERIES = (
+    ('full list', '/drinks'),
+    ('page of 100', '/drinks?limit=100&cursor=5000'),
+    ('fields=id,title', '/drinks?fields=id,title'),
+    ('stream=true', '/drinks?stream=true'),
+    ('detail, full list', '/drinks-detail'),
+    ('detail, stream=true', '/drinks-detail?stream=true'),
+)
+
+
+def main(sizes=(10000, 100000)):
+    issuer = LocalIssuer()
+    app = load_app(issuer)
+    app.config['DRINKS_CACHE_ENABLED'] = False
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + issuer.mint(ALL_PERMISSIONS)}
+
+    generated = 0
+
+    for size in sizes:
+        generate_drinks(app, size, first=generated)
+        generated = size
+        print(f'{size} drinks')
+
+        for name, url in QUERIES:
+            def get():
+                response = client.get(url, headers=headers)
+                response.get_data()
+                assert response.status_code == 200, response.status_code
+
+            iterations = 3 if 'page' not in url else 200
+            report(f'  {name}', timeit(get, iterations))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or (10000, 100000))
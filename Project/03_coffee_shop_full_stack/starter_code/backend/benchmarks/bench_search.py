@@ -0,0 +1,92 @@
+'''
+Latency of GET /drinks/search on large generated menus, against a LIKE scan
+of the drink table
+
+    python -m benchmarks.bench_search [sizes...]
+
+    run from the backend directory, sizes default to 10000 100000
+'''
+
+import json
+import random
+import sys
+
+from sqlalchemy import select
+
+from src.database import models
+
+from .common import ALL_PERMISSIONS, LocalIssuer, load_app, report, timeit
+
+WORDS = ('almond', 'caramel', 'cinnamon', 'espresso', 'hazelnut', 'honey',
+         'lavender', 'matcha', 'mocha', 'oat', 'pumpkin', 'vanilla')
+COLORS = ('brown', 'white', 'green', 'cream')
+
+QUERIES = (
+    ('common ingredient', 'vanilla'),
+    ('title prefix', 'Matcha Caramel'),
+    ('rare substring', 'drink 4242'),
+    ('no match', 'gingerbread'),
+)
+
+
+def generate_menu(app, count, first=0, batch_size=5000):
+    rng = random.Random(first)
+
+    def drink(i):
+        names = rng.sample(WORDS, 3)
+
+        return {
+            'title': f'{names[0].title()} {names[1].title()} drink {i}',
+            'recipe': json.dumps([{'name': name, 'color': rng.choice(COLORS),
+                                   'parts': rng.randint(1, 3)}
+                                  for name in names])
+        }
+
+    with app.app_context():
+        table = models.Drink.__table__
+
+        for start in range(first, count, batch_size):
+            models.db.session.execute(table.insert(), [
+                drink(i) for i in range(start, min(start + batch_size, count))
+            ])
+
+        models.db.session.commit()
+
+
+def like_scan(query):
+    # What a naive implementation does: every row, matched as text.
+    table = models.Drink.__table__
+    pattern = f'%{query}%'
+
+    return models.db.session.execute(select(table).where(
+        table.c.title.ilike(pattern) | table.c.recipe.ilike(pattern))).all()
+
+
+def main(sizes=(10000, 100000)):
+    issuer = LocalIssuer()
+    app = load_app(issuer)
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + issuer.mint(ALL_PERMISSIONS)}
+
+    generated = 0
+
+    for size in sizes:
+        generate_menu(app, size, first=generated)
+        generated = size
+        print(f'{size} drinks')
+
+        for name, query in QUERIES:
+            def search():
+                response = client.get('/drinks/search', headers=headers,
+                                      query_string={'q': query})
+                assert response.status_code == 200
+
+            with app.app_context():
+                report(f'  {name}: LIKE scan',
+                       timeit(lambda: like_scan(query), 5))
+
+            report(f'  {name}: /drinks/search', timeit(search, 20))
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or (10000, 100000))
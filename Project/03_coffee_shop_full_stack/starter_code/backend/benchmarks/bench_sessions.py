@@ -0,0 +1,85 @@
+'''
+Concurrent mixed traffic (reads, writes, 404s and 422s) through the request
+unit of work, then the state of the connection pool
+
+    python -m benchmarks.bench_sessions [threads] [requests per thread]
+
+    run from the backend directory, defaults to 8 threads of 200 requests
+    that every connection goes back to the pool is checked by
+    tests/test_sessions.py
+'''
+
+import re
+import sys
+import threading
+import time
+
+from src.database import models
+
+from .common import (ALL_PERMISSIONS, LocalIssuer, generate_drinks, load_app,
+                     percentile)
+
+RECIPE = [{'name': 'milk', 'color': 'white', 'parts': 1}]
+
+
+def main(threads=8, requests=200):
+    issuer = LocalIssuer()
+    app = load_app(issuer)
+    app.config['DRINKS_CACHE_ENABLED'] = False
+    generate_drinks(app, 1000)
+    headers = {'Authorization': 'Bearer ' + issuer.mint(ALL_PERMISSIONS)}
+
+    db_times, query_counts, statuses = [], [], {}
+
+    def worker(index):
+        client = app.test_client()
+
+        for number in range(requests):
+            title = f'drink {index}-{number}'
+            kind = number % 5
+
+            if kind == 0:
+                response = client.post('/drinks', headers=headers, json={
+                    'title': title, 'recipe': RECIPE})
+            elif kind == 1:
+                # Taken title: rolled back with a 422.
+                response = client.post('/drinks', headers=headers, json={
+                    'title': 'drink 1', 'recipe': RECIPE})
+            elif kind == 2:
+                response = client.delete('/drinks/0', headers=headers)
+            else:
+                response = client.get('/drinks?limit=50', headers=headers)
+
+            statuses[response.status_code] = \
+                statuses.get(response.status_code, 0) + 1
+            timing = re.match(r'db;dur=([\d.]+);desc="(\d+)',
+                              response.headers['Server-Timing'])
+            db_times.append(float(timing.group(1)))
+            query_counts.append(int(timing.group(2)))
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(index,))
+               for index in range(threads)]
+
+    for thread in workers:
+        thread.start()
+
+    for thread in workers:
+        thread.join()
+
+    seconds = time.perf_counter() - start
+    total = threads * requests
+
+    with app.app_context():
+        pool = models.db.engine.pool
+
+        print(f'{total} requests in {seconds:.2f} s ({total / seconds:.0f}/s)')
+        print(f'statuses           {dict(sorted(statuses.items()))}')
+        print(f'db time p50/p99    {percentile(db_times, 50):.2f} / '
+              f'{percentile(db_times, 99):.2f} ms')
+        print(f'queries / request  {sum(query_counts) / total:.2f}')
+        print(f'pool               {pool.status()}')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,127 @@
+'''
+Verified tokens and signing keys with several worker processes on one box,
+with a cache per process and with the AUTH_SHARED_CACHE file
+    every worker sends the same kind of traffic: tokens picked at random from
+    a common pool, as a load balancer spreading the users of the API would
+    hits are split between the LRU of the worker (local) and the shared file
+
+    python -m benchmarks.bench_shared_cache [workers] [--tokens 1000]
+        [--requests 4000]
+
+    run from the backend directory
+'''
+
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from src.auth import auth, local_issuer
+from src.auth.cache import TokenCache
+from src.auth.config import AuthConfig
+from src.auth.jwks import JWKSStore, shared_fetcher
+
+
+def worker(number, jwks, tokens, requests, shared_path, downloads, results):
+    config = AuthConfig(shared_cache=shared_path)
+
+    def fetch():
+        with downloads.get_lock():
+            downloads.value += 1
+
+        return jwks, None
+
+    fetcher = fetch
+
+    if config.shared_cache is not None:
+        fetcher = shared_fetcher(config.shared_cache, config.jwks_url, fetch)
+
+    config.add_issuer(config.issuer, JWKSStore(
+        fetcher, key_loader=config.verifier.load_key))
+
+    cache = config.token_cache
+    rng = random.Random(number)
+    times = {'local': [], 'shared': [], 'verified': []}
+
+    for _ in range(requests):
+        token = rng.choice(tokens)
+        start = time.perf_counter()
+
+        # What requires_auth does, split by where the principal came from.
+        if TokenCache.get(cache, token) is not None:
+            source = 'local'
+        elif cache.get(token) is not None:
+            source = 'shared'
+        else:
+            payload = auth.verify_decode_jwt(token, config)
+            cache.put(token, auth.Principal(payload), payload.get('exp'))
+            source = 'verified'
+
+        times[source].append(time.perf_counter() - start)
+
+    results.put({source: (len(samples), sum(samples))
+                 for source, samples in times.items()})
+
+
+def run(jwks, tokens, workers, requests, shared_path):
+    context = multiprocessing.get_context('fork')
+    downloads = context.Value('i', 0)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(
+        number, jwks, tokens, requests, shared_path, downloads, results))
+        for number in range(workers)]
+    start = time.perf_counter()
+
+    for process in processes:
+        process.start()
+
+    totals = {}
+
+    for _ in processes:
+        for source, (count, seconds) in results.get().items():
+            previous = totals.get(source, (0, 0.0))
+            totals[source] = (previous[0] + count, previous[1] + seconds)
+
+    for process in processes:
+        process.join()
+
+    elapsed = time.perf_counter() - start
+    total = workers * requests
+
+    print(f'  {total} requests in {elapsed:.2f} s, '
+          f'{downloads.value} key set downloads')
+
+    for source, (count, seconds) in totals.items():
+        mean = seconds / count * 1e6 if count else 0
+        print(f'  {source:<10} {count / total * 100:>6.1f} % of requests '
+              f'{mean:>10.1f} us each')
+
+
+def main(workers=4, tokens=1000, requests=4000):
+    # Tokens as Auth0 would issue them, signed by a local RSA key.
+    config = AuthConfig()
+    private_key = local_issuer.generate_key('RS256')
+    jwks = {'keys': [local_issuer.public_jwk(private_key)]}
+    pool = [local_issuer.mint(private_key, config.issuer, config.audience,
+                              f'bench|user{i}', ['get:drinks'])
+            for i in range(tokens)]
+
+    print(f'{workers} workers, {tokens} tokens, {requests} requests each')
+    print('cache per process')
+    run(jwks, pool, workers, requests, None)
+
+    with tempfile.TemporaryDirectory() as directory:
+        print('shared cache file')
+        run(jwks, pool, workers, requests,
+            os.path.join(directory, 'auth-cache.db'))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('workers', nargs='?', type=int, default=4)
+    parser.add_argument('--tokens', type=int, default=1000)
+    parser.add_argument('--requests', type=int, default=4000)
+    args = parser.parse_args()
+    main(args.workers, args.tokens, args.requests)
@@ -0,0 +1,123 @@
+'''
+Startup of the backend in fresh processes, against a stub identity provider
+    import of src.api, create_app(), then the first and second requests, with
+    lazy initialization (the default) and with PREWARM=1
+    then several processes at once, each on its own in-memory database, as
+    pytest-xdist workers would run
+
+    python -m benchmarks.bench_startup [runs] [--delay SECONDS]
+        [--workers 4]
+
+    run from the backend directory, --delay is the time each key set
+    download takes (default 0.05)
+    that apps never see each other's drinks is checked by tests/test_apps.py
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+COLUMNS = ('import', 'create_app', 'first request', 'second request')
+
+
+def child():
+    # Timed before anything else of the backend is imported.
+    start = time.perf_counter()
+    from src.api import create_app
+    imported = time.perf_counter()
+
+    app = create_app()
+    created = time.perf_counter()
+
+    client = app.test_client()
+    headers = {'Authorization': 'Bearer ' + os.environ['BENCH_TOKEN']}
+    requests = []
+
+    for _ in range(2):
+        before = time.perf_counter()
+        response = client.get('/drinks', headers=headers)
+        requests.append(time.perf_counter() - before)
+        assert response.status_code in (200, 404), response.status_code
+
+    writes = int(os.environ.get('BENCH_WRITES', 0))
+
+    for n in range(writes):
+        response = client.post('/drinks', headers=headers, json={
+            'title': f'drink {n}',
+            'recipe': [{'name': 'espresso', 'color': 'brown', 'parts': 1}]
+        })
+        assert response.status_code == 200, response.status_code
+
+    print(json.dumps(dict(zip(COLUMNS, (imported - start, created - imported,
+                                        *requests)))))
+
+
+def spawn(env):
+    return subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.bench_startup', '--child'],
+        env=env, stdout=subprocess.PIPE)
+
+
+def collect(process):
+    output, _ = process.communicate()
+    assert process.returncode == 0, process.returncode
+
+    return json.loads(output)
+
+
+def main(runs=5, delay=0.05, workers=4):
+    from .common import ALL_PERMISSIONS, LocalIssuer
+    from .stub_idp import STUB_DOMAIN, StubIdentityProvider
+
+    issuer = LocalIssuer(domain=STUB_DOMAIN)
+    stub = StubIdentityProvider(issuer, delay=delay).start()
+    env = dict(os.environ, BENCH_TOKEN=issuer.mint(ALL_PERMISSIONS),
+               **stub.env())
+
+    print(f'{"median of " + str(runs) + " runs, ms":<24}' +
+          ''.join(f'{column:>16}' for column in COLUMNS))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, extra in (('lazy', {}), ('PREWARM=1', {'PREWARM': '1'})):
+            samples = []
+
+            for run in range(runs):
+                database = os.path.join(directory, f'{mode}-{run}.db')
+                samples.append(collect(spawn(dict(
+                    env, DATABASE_URL='sqlite:///' + database, **extra))))
+
+            medians = [statistics.median(sample[column] for sample in samples)
+                       for column in COLUMNS]
+            print(f'{mode:<24}' + ''.join(f'{seconds * 1000:>16.1f}'
+                                          for seconds in medians))
+
+    start = time.perf_counter()
+    processes = [spawn(dict(env, DATABASE_URL='sqlite://', BENCH_WRITES='20'))
+                 for _ in range(workers)]
+
+    for process in processes:
+        collect(process)
+
+    print(f'{workers} workers in parallel on sqlite:// (20 writes each): '
+          f'{time.perf_counter() - start:.2f} s')
+    print(f'key set downloads: {stub.fetches}')
+    stub.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('runs', nargs='?', type=int, default=5)
+    parser.add_argument('--delay', type=float, default=0.05)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+    else:
+        main(args.runs, args.delay, args.workers)
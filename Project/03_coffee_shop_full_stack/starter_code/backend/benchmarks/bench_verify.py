@@ -0,0 +1,106 @@
+'''
+Per-verification cost of verify_decode_jwt, for every verifier backend and
+every algorithm of the local issuer, and the cost of turning down bad tokens
+
+    python -m benchmarks.bench_verify [iterations]
+
+    run from the backend directory
+'''
+
+import sys
+
+from jose import jwt
+
+from src.auth import auth, local_issuer
+from src.auth.config import AuthConfig
+from src.auth.jwks import JWKSStore
+from src.auth.verifiers import VERIFIERS
+
+from .common import LocalIssuer, report, timeit
+
+
+def verify_with_jwk_dict(token, jwks, config):
+    # What verify_decode_jwt used to do on every request: scan the key set
+    # for the kid and hand python-jose a JWK dict to parse again.
+    unverified_header = jwt.get_unverified_header(token)
+    rsa_key = {}
+
+    for key in jwks['keys']:
+        if key['kid'] == unverified_header['kid']:
+            rsa_key = {
+                'kty': key['kty'], 'kid': key['kid'], 'use': key['use'],
+                'n': key['n'], 'e': key['e']
+            }
+
+    return jwt.decode(token, rsa_key, algorithms=list(config.algorithms),
+                      audience=config.audience,
+                      issuer='https://' + config.domain + '/')
+
+
+def main(iterations=200):
+    issuer = LocalIssuer()
+    token = issuer.mint(['get:drinks'])
+
+    report('jwk dict per request',
+           timeit(lambda: verify_with_jwk_dict(token, issuer.jwks,
+                                               auth.auth_config), iterations))
+
+    for name in VERIFIERS:
+        config = bench_config(issuer, name)
+
+        seconds = timeit(lambda: auth.verify_decode_jwt(token, config),
+                         iterations)
+        report(f'precompiled key object ({config.verifier.name})', seconds)
+        print(f'{"":<40} {1 / seconds:>12.0f} verifications/s')
+
+    for alg in local_issuer.ALGORITHMS:
+        private_key = local_issuer.generate_key(alg)
+        jwks = {'keys': [local_issuer.public_jwk(private_key)]}
+        config.add_issuer(config.local_issuer, JWKSStore(
+            lambda: (jwks, None), key_loader=config.verifier.load_key), [alg])
+        local_token = local_issuer.mint(private_key, config.local_issuer,
+                                        config.audience, 'bench|service',
+                                        ['get:drinks'])
+
+        seconds = timeit(lambda: auth.verify_decode_jwt(local_token, config),
+                         iterations)
+        report(f'local issuer {alg} ({config.verifier.name})', seconds)
+
+    header, payload, signature = token.split('.')
+    forged = f'{header}.{payload}.{signature[:-8]}AAAAAAAA'
+    bad_tokens = {
+        'malformed': 'not-a-token',
+        'expired': issuer.mint(['get:drinks'], expires_in=-60),
+        'forged signature': forged,
+    }
+
+    for name, bad_token in bad_tokens.items():
+        report(f'reject {name} (first time)',
+               timeit(lambda: rejection(bad_token, config, remembered=False),
+                      iterations))
+        report(f'reject {name} (remembered)',
+               timeit(lambda: rejection(bad_token, config), iterations))
+
+
+def bench_config(issuer, backend):
+    config = AuthConfig(domain=issuer.domain, backend=backend)
+    config.add_issuer(issuer.url, JWKSStore(
+        issuer.fetcher, key_loader=config.verifier.load_key))
+
+    return config
+
+
+def rejection(token, config, remembered=True):
+    if not remembered:
+        config.rejected_tokens.clear()
+
+    try:
+        auth.verify_decode_jwt(token, config)
+    except auth.AuthError:
+        return
+
+    raise AssertionError('The token was accepted.')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
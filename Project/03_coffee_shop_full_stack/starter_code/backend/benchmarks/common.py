@@ -0,0 +1,138 @@
+import base64
+import os
+import tempfile
+import time
+
+import rsa
+from jose import jwt
+
+from src.auth import auth
+from src.auth.jwks import JWKSStore
+from src.database import models
+
+'''
+Helpers shared by the benchmarks
+    a locally generated RSA keypair, its JWKS and tokens signed with it
+    nothing here talks to Auth0
+'''
+
+
+def b64_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+class LocalIssuer:
+    def __init__(self, kid='bench-key', bits=2048, domain=None):
+        self.kid = kid
+        self.domain = domain or auth.auth_config.domain
+        public_key, private_key = rsa.newkeys(bits)
+        self.private_pem = private_key.save_pkcs1().decode('ascii')
+        self.jwks = {'keys': [{
+            'kty': 'RSA', 'kid': kid, 'use': 'sig', 'alg': 'RS256',
+            'n': b64_uint(public_key.n), 'e': b64_uint(public_key.e)
+        }]}
+
+    @property
+    def url(self):
+        return 'https://' + self.domain + '/'
+
+    def fetcher(self):
+        return self.jwks, None
+
+    def mint(self, permissions=(), expires_in=3600, kid=None, **claims):
+        now = int(time.time())
+        payload = {
+            'iss': self.url,
+            'aud': auth.auth_config.audience,
+            'sub': 'bench|user',
+            'iat': now,
+            'exp': now + expires_in,
+            'permissions': list(permissions)
+        }
+        payload.update(claims)
+
+        return jwt.encode(payload, self.private_pem, algorithm='RS256',
+                          headers={'kid': kid or self.kid})
+
+
+ALL_PERMISSIONS = ('get:drinks', 'get:drinks-detail', 'post:drinks',
+                   'patch:drinks', 'delete:drinks')
+
+
+def load_app(issuer, database_path=None, **config):
+    """
+    Builds an app with src.api.create_app(config) on a scratch SQLite
+    database (a fresh temp file by default), with auth pointed at issuer.
+    """
+
+    if database_path is None:
+        handle, database_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+
+    auth_config = auth.default_config()
+    auth_config.add_issuer(issuer.url, JWKSStore(
+        issuer.fetcher, key_loader=auth_config.verifier.load_key))
+
+    from src.api import create_app
+
+    app = create_app(dict(config, AUTH_CONFIG=auth_config,
+                          SQLALCHEMY_DATABASE_URI='sqlite:///' +
+                          database_path))
+
+    with app.app_context():
+        models.db.drop_all()
+        models.db.create_all()
+
+    return app
+
+
+def generate_drinks(app, count, first=0, batch_size=5000):
+    """
+    Inserts drinks number first to count - 1.
+    """
+
+    with app.app_context():
+        table = models.Drink.__table__
+
+        for start in range(first, count, batch_size):
+            models.db.session.execute(table.insert(), [{
+                'title': f'drink {i}',
+                'recipe': '[{"name": "espresso", "color": "brown", '
+                          '"parts": 1}, {"name": "milk", "color": "white", '
+                          '"parts": 3}]'
+            } for i in range(start, min(start + batch_size, count))])
+
+        models.TableVersion.bump(table.name)
+        models.db.session.commit()
+
+
+def timeit(fn, iterations):
+    """
+    Runs fn iterations times, returns the mean cost of one call in seconds.
+    """
+
+    fn()
+    start = time.perf_counter()
+
+    for _ in range(iterations):
+        fn()
+
+    return (time.perf_counter() - start) / iterations
+
+
+def percentile(samples, pct):
+    """
+    The pct-th percentile of samples, 0 if there are none.
+    """
+
+    if not samples:
+        return 0
+
+    ordered = sorted(samples)
+
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, seconds):
+    print(f'{name:<40} {seconds * 1e6:>12.1f} us/op')
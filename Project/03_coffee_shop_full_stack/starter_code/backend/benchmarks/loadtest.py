@@ -0,0 +1,464 @@
+'''
+Load test of the backend over HTTP, against a stub identity provider
+
+    python -m benchmarks.loadtest [scenario ...] [--threads 8]
+        [--requests 250] [--drinks 1000] [--jwks-delay 0] [--auth-modes]
+        [--output FILE]
+    python -m benchmarks.loadtest --compare BASE.json NEW.json
+
+    run from the backend directory
+    scenarios: read-heavy, write-heavy, mixed, invalid-token-storm (all by
+    default), each against a fresh server and database
+    every client thread sends a fixed, seeded sequence of requests, so two
+    runs of the same commit send the same requests
+    --auth-modes runs each scenario twice, with the sync views and with
+    AUTH_ASYNC=1, and ends with their p95/p99 side by side (e.g. with
+    --jwks-delay, to see what a slow identity provider costs each way)
+    --output saves the results as JSON, --compare prints the change in RPS
+    and latency between two saved runs
+'''
+
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from .common import ALL_PERMISSIONS, LocalIssuer, percentile
+from .stub_idp import STUB_DOMAIN, StubIdentityProvider
+
+RECIPE = [{'name': 'espresso', 'color': 'brown', 'parts': 1},
+          {'name': 'milk', 'color': 'white', 'parts': 2}]
+SEARCH_WORDS = ('drink 1', 'espresso', 'milk', 'drink 99', 'nothing here')
+INVALID_TOKENS = ('expired', 'bad_signature', 'unknown_kid', 'garbage',
+                  'missing')
+
+
+'''
+Requests
+    each one picks what to send from the state of its worker and returns
+    (method, path, json body, token name, expected statuses, callback)
+    the callback, if any, gets the parsed response body
+'''
+
+
+def get_drinks(worker):
+    return 'GET', '/drinks', None, 'reader', (200,), None
+
+
+def get_drinks_page(worker):
+    cursor = worker.rng.randrange(worker.drinks)
+
+    return ('GET', f'/drinks?limit=50&cursor={cursor}', None, 'reader',
+            (200,), None)
+
+
+def get_drinks_detail(worker):
+    return 'GET', '/drinks-detail', None, 'admin', (200,), None
+
+
+def search_drinks(worker):
+    query = worker.rng.choice(SEARCH_WORDS).replace(' ', '+')
+
+    return 'GET', f'/drinks/search?q={query}', None, 'reader', (200,), None
+
+
+def export_drinks(worker):
+    return 'GET', '/drinks/export', None, 'admin', (200,), None
+
+
+def get_metrics(worker):
+    return 'GET', '/metrics', None, None, (200,), None
+
+
+def post_drink(worker):
+    body = {'title': worker.title(), 'recipe': RECIPE}
+
+    def created(response):
+        worker.created.extend(drink['id'] for drink in response['drinks'])
+
+    return 'POST', '/drinks', body, 'admin', (200,), created
+
+
+def patch_drink(worker):
+    drink_id = worker.rng.choice(worker.created) if worker.created \
+        else worker.rng.randrange(1, worker.drinks)
+    body = {'recipe': [dict(RECIPE[0], parts=worker.rng.randint(1, 3))]}
+
+    # A seeded drink may have been deleted by another thread.
+    return 'PATCH', f'/drinks/{drink_id}', body, 'admin', (200, 404), None
+
+
+def delete_drink(worker):
+    if not worker.created:
+        return post_drink(worker)
+
+    drink_id = worker.created.pop()
+
+    return 'DELETE', f'/drinks/{drink_id}', None, 'admin', (200,), None
+
+
+def post_drinks_bulk(worker):
+    body = {'drinks': [{'title': worker.title(), 'recipe': RECIPE}
+                       for _ in range(20)]}
+
+    return 'POST', '/drinks/bulk', body, 'admin', (200,), None
+
+
+def delete_drinks_bulk(worker):
+    ids, worker.created = worker.created[:20], worker.created[20:]
+
+    return 'DELETE', '/drinks/bulk', {'ids': ids}, 'admin', (200,), None
+
+
+def invalid_token(worker):
+    token = worker.rng.choice(INVALID_TOKENS)
+
+    return 'GET', '/drinks', None, token, (401,), None
+
+
+SCENARIOS = {
+    'read-heavy': (
+        (70, get_drinks), (10, get_drinks_page), (10, get_drinks_detail),
+        (10, search_drinks)),
+    'write-heavy': (
+        (40, post_drink), (25, patch_drink), (20, delete_drink),
+        (5, post_drinks_bulk), (5, delete_drinks_bulk), (5, get_drinks)),
+    'mixed': (
+        (30, get_drinks), (10, get_drinks_page), (10, get_drinks_detail),
+        (10, search_drinks), (2, export_drinks), (2, get_metrics),
+        (12, post_drink), (10, patch_drink), (8, delete_drink),
+        (3, post_drinks_bulk), (3, delete_drinks_bulk)),
+    'invalid-token-storm': (
+        (90, invalid_token), (10, get_drinks)),
+}
+
+
+class Worker:
+    def __init__(self, index, host, port, tokens, drinks, seed):
+        self.index = index
+        self.tokens = tokens
+        self.drinks = drinks
+        self.rng = random.Random(seed * 1000 + index)
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+
+        self.created = []
+        self.count = 0
+        self.samples = []
+
+    def title(self):
+        self.count += 1
+
+        return f'load {self.index}-{self.count}'
+
+    def run(self, requests, scenario):
+        weights = [weight for weight, _ in scenario]
+        builders = [builder for _, builder in scenario]
+
+        for _ in range(requests):
+            builder = self.rng.choices(builders, weights)[0]
+            method, path, body, token, expected, callback = builder(self)
+            status, payload, seconds = self.send(method, path, body,
+                                                 self.tokens.get(token))
+            self.samples.append((builder.__name__, seconds,
+                                 status in expected))
+
+            if callback is not None and status == 200:
+                callback(json.loads(payload))
+
+        self.connection.close()
+
+    def send(self, method, path, body, token):
+        headers = {}
+
+        if token is not None:
+            headers['Authorization'] = 'Bearer ' + token
+
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        start = time.perf_counter()
+
+        try:
+            self.connection.request(method, path, body, headers)
+            response = self.connection.getresponse()
+            payload = response.read()
+            status = response.status
+        except (http.client.HTTPException, OSError):
+            self.connection.close()
+            payload, status = b'', None
+
+        return status, payload, time.perf_counter() - start
+
+
+def mint_tokens(issuer):
+    now = int(time.time())
+    valid = issuer.mint(ALL_PERMISSIONS)
+    header, payload, signature = valid.split('.')
+    # Same header and payload, signature of another token.
+    other = issuer.mint(['get:drinks'])
+
+    return {
+        'reader': issuer.mint(['get:drinks']),
+        'admin': valid,
+        'expired': issuer.mint(ALL_PERMISSIONS, expires_in=-60,
+                               iat=now - 3600),
+        'bad_signature': f'{header}.{payload}.{other.split(".")[2]}',
+        'unknown_kid': issuer.mint(ALL_PERMISSIONS, kid='rotated-key'),
+        'garbage': 'not-a-token',
+        'missing': None,
+    }
+
+
+'''
+Server
+    src.api served by a threaded werkzeug server in a child process, on a
+    fresh database seeded with --drinks drinks
+'''
+
+
+def serve(port, drinks):
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    from src.api import create_app
+    from src.database import models
+
+    from .common import generate_drinks
+
+    app = create_app()
+
+    with app.app_context():
+        models.db.drop_all()
+        models.db.create_all()
+
+    generate_drinks(app, drinks)
+
+    # Keep-alive connections, as behind a real server.
+    WSGIRequestHandler.protocol_version = 'HTTP/1.1'
+    WSGIRequestHandler.log_request = lambda *args, **kwargs: None
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+
+        return sock.getsockname()[1]
+
+
+def start_server(stub, drinks, settings=None):
+    port = free_port()
+    handle, database = tempfile.mkstemp(suffix='.db')
+    os.close(handle)
+
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database,
+               **stub.env(), **(settings or {}))
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.loadtest', '--serve', str(port),
+         '--drinks', str(drinks)], env=env)
+
+    deadline = time.monotonic() + 60
+
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', '/metrics')
+            connection.getresponse().read()
+            connection.close()
+
+            return process, port, database
+        except OSError:
+            time.sleep(0.2)
+
+    process.kill()
+    raise RuntimeError('The server did not start.')
+
+
+def run_scenario(name, stub, tokens, args, settings=None):
+    process, port, database = start_server(stub, args.drinks, settings)
+
+    try:
+        workers = [Worker(index, '127.0.0.1', port, tokens, args.drinks,
+                          args.seed) for index in range(args.threads)]
+        threads = [threading.Thread(target=worker.run,
+                                    args=(args.requests, SCENARIOS[name]))
+                   for worker in workers]
+        start = time.perf_counter()
+
+        for thread in threads:
+            thread.start()
+
+        for thread in threads:
+            thread.join()
+
+        seconds = time.perf_counter() - start
+    finally:
+        process.terminate()
+        process.wait()
+        os.remove(database)
+
+    samples = [sample for worker in workers for sample in worker.samples]
+
+    return summarize(samples, seconds)
+
+
+def summarize(samples, seconds):
+    def stats(group):
+        latencies = [latency for _, latency, _ in group]
+
+        return {
+            'requests': len(group),
+            'errors': sum(1 for _, _, ok in group if not ok),
+            'p50_ms': percentile(latencies, 50) * 1e3,
+            'p95_ms': percentile(latencies, 95) * 1e3,
+            'p99_ms': percentile(latencies, 99) * 1e3,
+        }
+
+    result = stats(samples)
+    result['seconds'] = seconds
+    result['rps'] = len(samples) / seconds
+    result['by_request'] = {
+        name: stats([sample for sample in samples if sample[0] == name])
+        for name in sorted({sample[0] for sample in samples})
+    }
+
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_result(name, result):
+    print(f'{name}: {result["requests"]} requests in '
+          f'{result["seconds"]:.2f} s, {result["rps"]:.0f} req/s, '
+          f'{result["errors"]} errors')
+    print(f'    {"request":<22} {"count":>7} {"p50 ms":>9} {"p95 ms":>9} '
+          f'{"p99 ms":>9} {"errors":>7}')
+
+    for request, stats in result['by_request'].items():
+        print(f'    {request:<22} {stats["requests"]:>7} '
+              f'{stats["p50_ms"]:>9.2f} {stats["p95_ms"]:>9.2f} '
+              f'{stats["p99_ms"]:>9.2f} {stats["errors"]:>7}')
+
+    print(f'    {"all":<22} {result["requests"]:>7} '
+          f'{result["p50_ms"]:>9.2f} {result["p95_ms"]:>9.2f} '
+          f'{result["p99_ms"]:>9.2f} {result["errors"]:>7}')
+
+
+def print_auth_modes(results):
+    print(f'{"scenario":<28} {"sync p95":>10} {"async p95":>10} '
+          f'{"sync p99":>10} {"async p99":>10}')
+
+    for name in SCENARIOS:
+        sync, async_ = results.get(f'{name} (sync)'), \
+            results.get(f'{name} (async)')
+
+        if sync is None or async_ is None:
+            continue
+
+        print(f'{name:<28} {sync["p95_ms"]:>10.2f} {async_["p95_ms"]:>10.2f} '
+              f'{sync["p99_ms"]:>10.2f} {async_["p99_ms"]:>10.2f}')
+
+
+def compare(base_path, new_path):
+    with open(base_path) as base_file, open(new_path) as new_file:
+        base, new = json.load(base_file), json.load(new_file)
+
+    print(f'{base.get("commit")} -> {new.get("commit")}')
+
+    for name, result in new['scenarios'].items():
+        before = base['scenarios'].get(name)
+
+        if before is None:
+            continue
+
+        print(name)
+
+        for metric in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            change = (result[metric] - before[metric]) / before[metric] * 100 \
+                if before[metric] else 0
+            print(f'    {metric:<8} {before[metric]:>10.2f} '
+                  f'{result[metric]:>10.2f} {change:>+8.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Backend load test.')
+    parser.add_argument('scenarios', nargs='*',
+                        help=', '.join(SCENARIOS) + ' (default: all)')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=250,
+                        help='requests sent by each thread')
+    parser.add_argument('--drinks', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--jwks-delay', type=float, default=0,
+                        help='seconds each key set download takes')
+    parser.add_argument('--auth-modes', action='store_true',
+                        help='run each scenario with the sync views and '
+                             'with AUTH_ASYNC=1')
+    parser.add_argument('--output')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'))
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        return serve(args.serve, args.drinks)
+
+    if args.compare:
+        return compare(*args.compare)
+
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f'unknown scenario {name!r}')
+
+    issuer = LocalIssuer(domain=STUB_DOMAIN)
+    stub = StubIdentityProvider(issuer, delay=args.jwks_delay).start()
+    tokens = mint_tokens(issuer)
+    results = {}
+
+    # The same seeded requests each way.
+    modes = ((' (sync)', {'AUTH_ASYNC': '0'}),
+             (' (async)', {'AUTH_ASYNC': '1'})) if args.auth_modes \
+        else (('', {}),)
+
+    try:
+        for name in args.scenarios or list(SCENARIOS):
+            for suffix, settings in modes:
+                results[name + suffix] = run_scenario(name, stub, tokens,
+                                                      args, settings)
+                print_result(name + suffix, results[name + suffix])
+    finally:
+        stub.stop()
+
+    print(f'key set downloads: {stub.fetches}')
+
+    if args.auth_modes:
+        print_auth_modes(results)
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'commit': git_commit(),
+                'date': datetime.now(timezone.utc).isoformat(),
+                'config': {name: getattr(args, name) for name in (
+                    'threads', 'requests', 'drinks', 'seed', 'jwks_delay',
+                    'auth_modes')},
+                'scenarios': results
+            }, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
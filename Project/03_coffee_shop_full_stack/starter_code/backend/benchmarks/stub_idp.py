@@ -0,0 +1,98 @@
+'''
+A stub identity provider serving the key set of a LocalIssuer at
+/.well-known/jwks.json, so the backend verifies locally minted tokens the
+way it verifies Auth0 ones
+
+    python -m benchmarks.stub_idp [port]
+
+    run from the backend directory: prints the env vars pointing the backend
+    at the stub and a token with every permission, then serves until Ctrl-C
+'''
+
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .common import ALL_PERMISSIONS, LocalIssuer
+
+STUB_DOMAIN = 'stub-idp.local'
+
+
+class StubIdentityProvider:
+    def __init__(self, issuer, port=0, delay=0, max_age=600):
+        self.issuer = issuer
+        # Seconds each key set download takes, to simulate a slow provider.
+        self.delay = delay
+        self.max_age = max_age
+        self.fetches = 0
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != '/.well-known/jwks.json':
+                    self.send_error(404)
+                    return
+
+                stub.fetches += 1
+                time.sleep(stub.delay)
+                body = json.dumps(stub.issuer.jwks).encode('utf-8')
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Cache-Control', f'max-age={stub.max_age}')
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+
+    @property
+    def jwks_url(self):
+        host, port = self.server.server_address[:2]
+
+        return f'http://{host}:{port}/.well-known/jwks.json'
+
+    def env(self):
+        """
+        The env vars pointing the backend at this provider.
+        """
+
+        return {'AUTH0_DOMAIN': self.issuer.domain,
+                'AUTH0_JWKS_URL': self.jwks_url}
+
+    def start(self):
+        self.thread.start()
+
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(port=8765):
+    issuer = LocalIssuer(domain=STUB_DOMAIN)
+    stub = StubIdentityProvider(issuer, port=port).start()
+
+    for name, value in stub.env().items():
+        print(f'export {name}={value}')
+
+    print(f'\n# expires in 24 hours, with {", ".join(ALL_PERMISSIONS)}')
+    print(issuer.mint(ALL_PERMISSIONS, expires_in=24 * 3600))
+
+    try:
+        stub.thread.join()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
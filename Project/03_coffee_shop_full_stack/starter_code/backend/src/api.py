@@ -1,24 +1,252 @@
-import sys
-
-from flask import Flask, jsonify, abort, request
+import hashlib
+import json
+import logging
+import os
+import time
+from datetime import datetime
+
+import click
+from flask import Blueprint, Flask, jsonify, abort, current_app, g, request
+from flask.cli import AppGroup
 from flask_cors import CORS
+from sqlalchemy.exc import IntegrityError
+from werkzeug.http import is_resource_modified
+from werkzeug.local import LocalProxy
+
+from . import metrics
+from .cache import ResponseCache
+from .codec import JSONProvider, loads
+from .events import EventBroker
+from .database.models import (setup_db, db_drop_and_create_all, db, Drink,
+                              TableVersion, DRINK_FIELDS, format_drink,
+                              bulk_save_drinks, bulk_delete_drinks,
+                              iter_drinks_ndjson, read_session_for,
+                              search_drinks, validate_drink, write_pins,
+                              after_commit, request_db_stats, prepare_db)
+from .auth import auth
+from .auth.auth import AuthError, current_config, init_app
+from .auth.verifiers import is_numeric_date
+
+logger = logging.getLogger(__name__)
+
+# Every route, request hook and error handler of the app, see create_app.
+api = Blueprint('api', __name__)
+
+# Serialized /drinks and /drinks-detail bodies of the current app, dropped on
+# every write.
+drinks_cache = LocalProxy(lambda: current_app.extensions['drinks_cache'])
+
+# Every committed drink write of the current app, pushed to the
+# GET /drinks/events streams.
+drink_events = LocalProxy(lambda: current_app.extensions['drink_events'])
+
+'''
+@requires_auth(*permissions, any_of)
+    auth.requires_auth on the routes, with the auth.requires_auth_async view
+    of the same route kept as its async_view
+    create_app serves the async views when AUTH_ASYNC is set: JWKS refreshes
+    and signature checks then run on background threads instead of the
+    request thread
+'''
+
+
+def requires_auth(*permissions, any_of=False):
+    def requires_auth_decorator(f):
+        view = auth.requires_auth(*permissions, any_of=any_of)(f)
+        view.async_view = auth.requires_auth_async(*permissions,
+                                                   any_of=any_of)(f)
+
+        return view
+
+    return requires_auth_decorator
 
-from .database.models import setup_db, db_drop_and_create_all, db, Drink
-from .auth.auth import requires_auth, AuthError
 
-app = Flask(__name__)
-setup_db(app)
-CORS(app)
+# Largest ?limit= accepted by the drink listings.
+MAX_PAGE_SIZE = 1000
+# Rows fetched at a time when a listing is streamed.
+STREAM_BATCH_SIZE = 500
+# Results of GET /drinks/search, by default and at most.
+SEARCH_LIMIT = 20
+MAX_SEARCH_LIMIT = 100
 
 '''
-Uncommenting the following lines initializes the database
-!! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
-!! NOTE THIS MUST BE UNCOMMENTED ON FIRST RUN
-!! Running this function will add two
+Request metrics
+    every request is timed from before_request to the end of its body, by
+    route pattern, method and status, along with the time it spent in the
+    database
+        a streamed body is sent after the teardown of the request: its
+        request is timed once the server closes the response (an event
+        stream only until it starts)
+    GET /metrics renders every metric in the Prometheus text format
 '''
 
-# with app.app_context():
-#     db_drop_and_create_all()
+
+@api.before_app_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+
+@api.after_app_request
+def record_status(response):
+    g.response_status = response.status_code
+
+    # Event streams stay open: they are timed until they start.
+    if response.is_streamed and 'request_started' in g and \
+            response.mimetype != 'text/event-stream':
+        started = g.request_started
+        labels = {'route': request_route(), 'method': request.method,
+                  'status': response.status_code}
+        g.response_streamed = True
+        response.call_on_close(lambda: metrics.request_duration.observe(
+            time.perf_counter() - started, **labels))
+
+    return response
+
+
+@api.teardown_app_request
+def record_request(exception=None):
+    started = g.pop('request_started', None)
+
+    if started is None:
+        return
+
+    route = request_route()
+    status = 500 if exception else g.get('response_status', 500)
+    queries, seconds = request_db_stats()
+
+    # Streamed bodies are timed by record_status.
+    if not g.get('response_streamed'):
+        metrics.request_duration.observe(time.perf_counter() - started,
+                                         route=route, method=request.method,
+                                         status=status)
+
+    metrics.db_duration.observe(seconds, route=route)
+    metrics.db_queries.inc(queries, route=route)
+
+
+def request_route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@api.route('/metrics', methods=['GET'])
+def get_metrics():
+    return current_app.response_class(metrics.registry.render(),
+                                      content_type=metrics.CONTENT_TYPE)
+
+
+'''
+create_app(config)
+    builds an app serving the routes of api, with config (a mapping) on top
+    of the settings from the environment (see settings_from_env)
+        SQLALCHEMY_DATABASE_URI: e.g. sqlite:// (in memory) or a temp file, so
+            each test worker gets its own database
+        AUTH_CONFIG: the AuthConfig of the app, built from the AUTH0_DOMAIN,
+            API_AUDIENCE, ... settings (see ./auth/config.py) by default
+        AUTH_ASYNC: serve the routes as Flask async views (env var
+            AUTH_ASYNC=1), see requires_auth
+        DRINKS_CACHE_ENABLED, DRINK_EVENTS_HISTORY, DRINK_EVENTS_QUEUE,
+            DRINK_EVENTS_MAX_SUBSCRIBERS, DRINK_EVENTS_HEARTBEAT
+        PREWARM
+    every app has its own database engine, auth config and caches
+    importing this module builds nothing: the first request connects to the
+    database (see prepare_db) and downloads the signing keys, unless PREWARM
+    (env var PREWARM=1) does both before create_app returns
+    flask run finds create_app on its own (FLASK_APP=api.py)
+'''
+
+
+def settings_from_env():
+    return {
+        'AUTH_ASYNC': os.environ.get('AUTH_ASYNC') == '1',
+        # DRINKS_CACHE=0 turns the cache of the listings off.
+        'DRINKS_CACHE_ENABLED': os.environ.get('DRINKS_CACHE', '1') != '0',
+        # Events kept for Last-Event-ID replays.
+        'DRINK_EVENTS_HISTORY': int(
+            os.environ.get('DRINK_EVENTS_HISTORY', 1000)),
+        # Events a stream may fall behind before it is closed.
+        'DRINK_EVENTS_QUEUE': int(os.environ.get('DRINK_EVENTS_QUEUE', 100)),
+        # Open streams before GET /drinks/events answers 503.
+        'DRINK_EVENTS_MAX_SUBSCRIBERS': int(
+            os.environ.get('DRINK_EVENTS_MAX_SUBSCRIBERS', 1000)),
+        # Seconds between two keep-alive comments on an idle stream.
+        'DRINK_EVENTS_HEARTBEAT': int(
+            os.environ.get('DRINK_EVENTS_HEARTBEAT', 15)),
+        'PREWARM': os.environ.get('PREWARM') == '1',
+    }
+
+
+def create_app(config=None):
+    # LOG_LEVEL=INFO logs every write and rejected token, nothing below
+    # WARNING is formatted or written by default.
+    logging.basicConfig(
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    logging.getLogger(__package__).setLevel(
+        os.environ.get('LOG_LEVEL', 'WARNING'))
+
+    app = Flask(__name__)
+    # jsonify and request.get_json() through orjson when it is installed,
+    # with the same output as Flask's own provider (see ./codec.py).
+    app.json = JSONProvider(app)
+
+    app.config.update(settings_from_env())
+    app.config.update(config or {})
+
+    setup_db(app)
+    CORS(app)
+    init_app(app, app.config.get('AUTH_CONFIG'))
+
+    app.extensions['drinks_cache'] = ResponseCache()
+    app.extensions['drink_events'] = EventBroker(
+        history_size=app.config['DRINK_EVENTS_HISTORY'],
+        queue_size=app.config['DRINK_EVENTS_QUEUE'],
+        max_subscribers=app.config['DRINK_EVENTS_MAX_SUBSCRIBERS'])
+
+    app.register_blueprint(api)
+
+    if app.config['AUTH_ASYNC']:
+        # The views of this app only, api keeps the sync ones.
+        for endpoint, view in app.view_functions.items():
+            app.view_functions[endpoint] = getattr(view, 'async_view', view)
+
+    app.cli.add_command(drinks_cli)
+    app.cli.add_command(auth_cli)
+
+    '''
+    Uncommenting the following lines initializes the database
+    !! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
+    !! NOTE THIS MUST BE UNCOMMENTED ON FIRST RUN
+    !! Running this function will add two
+    '''
+
+    # with app.app_context():
+    #     db_drop_and_create_all()
+
+    if app.config['PREWARM']:
+        prewarm(app)
+
+    return app
+
+
+'''
+prewarm(app)
+    does at boot what the first request would do: brings the database schema
+    up to date (opening the first pooled connection) and fetches the signing
+    keys of every trusted issuer
+    an issuer whose keys cannot be fetched is logged and left for the first
+    request to try again
+'''
+
+
+def prewarm(app):
+    with app.app_context():
+        prepare_db()
+
+        for issuer in current_config().issuers.values():
+            try:
+                issuer.jwks_store.refresh()
+            except Exception:
+                logger.warning('Could not fetch the signing keys of %s',
+                               issuer.url, exc_info=True)
 
 
 # ROUTES
@@ -32,18 +260,11 @@ Implementation of endpoint
 '''
 
 
-@app.route('/drinks', methods=['GET'])
+@api.route('/drinks', methods=['GET'])
 @requires_auth("get:drinks")
 def get_drinks(jwt):
-    drinks = db.session.query(Drink).all()
-
-    if len(drinks) == 0:
-        abort(404)
-
-    drinks = [drink.short() for drink in drinks]  # Format each drink to a
-    # short description.
-
-    return jsonify({'success': True, "drinks": drinks})
+    # Format each drink to a short description.
+    return drinks_response('short', jwt)
 
 
 '''
@@ -56,18 +277,336 @@ Implementation of endpoint
 '''
 
 
-@app.route('/drinks-detail', methods=['GET'])
+@api.route('/drinks-detail', methods=['GET'])
 @requires_auth("get:drinks-detail")
 def get_drinks_detail(jwt):
-    drinks = db.session.query(Drink).all()
+    # Format each drink to a long description.
+    return drinks_response('long', jwt)
+
+
+'''
+Implementation of endpoint
+    GET /drinks/search?q=<text>&limit=<n>
+        it requires the 'get:drinks' permission
+        it matches q anywhere in the drink titles and ingredient names,
+            case insensitive, best matches first (titles starting with q,
+            then title matches before ingredient matches)
+        it contains only the drink.short() data representation
+    returns status code 200 and json {"success": True, "drinks": drinks} where drinks
+        holds at most limit (default 20, up to 100) drinks, possibly none
+        or status code 400 if q is missing or limit is out of range
+'''
+
+
+@api.route('/drinks/search', methods=['GET'])
+@requires_auth("get:drinks")
+def search(jwt):
+    query = request.args.get('q', '').strip()
+
+    try:
+        limit = int_param(request.args.get('limit')) or SEARCH_LIMIT
+    except ValueError:
+        abort(400)
+
+    if not 0 < len(query) <= 100 or limit > MAX_SEARCH_LIMIT:
+        abort(400)
+
+    rows = search_drinks(query, limit, read_session_for(subject_of(jwt)))
+
+    with metrics.serialization_duration.timer(representation='short'):
+        return jsonify({'success': True,
+                        "drinks": [format_drink(row, 'short') for row in rows]})
 
-    if len(drinks) == 0:
+
+'''
+drinks_response(representation, principal)
+    the {"success": True, "drinks": drinks} response, with each drink in its
+    'short' or 'long' representation
+    it reads from the replica, if any, unless principal just wrote
+    it accepts the listing parameters
+        ?limit=N&cursor=C   keyset pagination on Drink.id: at most N drinks with id > C
+                            the response gains "next_cursor" (null on the last page)
+        ?fields=id,title    only these columns are selected and returned
+        ?stream=true        the body is written drink by drink instead of built in memory
+    it carries a strong ETag and a Last-Modified taken from the drinks table version
+        (the ETag also names the epoch of the database, see TableVersion)
+        a request whose If-None-Match / If-Modified-Since still matches gets a
+        304 Not Modified without any drink being read or serialized
+        If-None-Match wins when both are sent: the ETag names the exact version
+        Last-Modified has one-second resolution, and two writes within the
+        same second share it: it is only sent (and If-Modified-Since only
+        honoured) once the second of the last write is over
+    the body of the plain listing is served from drinks_cache when enabled,
+        skipping the drink rows and the recipe parsing: a hit still runs the
+        TableVersion lookup, to know the cached body is current (same epoch
+        and version)
+'''
+
+
+def drinks_response(representation, principal):
+    limit, cursor, fields, stream = listing_params()
+    plain = request.query_string == b''
+    enabled = current_app.config['DRINKS_CACHE_ENABLED'] and plain
+    generation = drinks_cache.generation
+
+    # The version has to come from the database the drinks are read from.
+    session = read_session_for(subject_of(principal))
+    version, updated_at, epoch = TableVersion.get(Drink.__tablename__,
+                                                  session)
+    # The same version number in a reset or replaced database is another
+    # version of the drinks.
+    etag = f'drinks-{representation}-{version}' + (f'-{epoch}' if epoch
+                                                   else '')
+    last_modified = updated_at if updated_at is not None and \
+        updated_at < datetime.utcnow().replace(microsecond=0) else None
+
+    if not plain:
+        etag += '-' + hashlib.sha1(request.query_string).hexdigest()[:16]
+
+    if not is_resource_modified(request.environ, etag=etag,
+                                last_modified=last_modified):
+        response = current_app.response_class(status=304)
+    else:
+        cached = drinks_cache.get(representation) if enabled else None
+        hit = cached is not None and cached[0] == (epoch, version)
+
+        if enabled:
+            metrics.cache_requests.inc(cache='drinks',
+                                       result='hit' if hit else 'miss')
+
+        if hit:
+            response = current_app.response_class(cached[1],
+                                                  mimetype=cached[2])
+        else:
+            # The cursor of the next page is the id of the last drink.
+            columns = fields if limit is None or 'id' in fields \
+                else ('id',) + fields
+            query = session.query(
+                *[getattr(Drink, column) for column in columns]
+            ).order_by(Drink.id)
+
+            if cursor is not None:
+                query = query.filter(Drink.id > cursor)
+
+            if limit is not None:
+                query = query.limit(limit)
+
+            if stream:
+                response = stream_drinks(query, representation, fields)
+            else:
+                response = list_drinks(query, representation, fields, limit,
+                                       cursor)
+
+            if enabled and not stream:
+                drinks_cache.put(representation, generation, (
+                    (epoch, version), response.get_data(),
+                    response.mimetype))
+
+    response.set_etag(etag)
+
+    # Set to None, werkzeug would send the current date.
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    return response
+
+
+def subject_of(principal):
+    return getattr(principal, 'subject', None)
+
+
+'''
+drinks_changed(principal, kind, drink)
+    called after every write to the drinks: once the request is committed,
+    drops the cached listings, sends the next reads of principal to the
+    primary and publishes a drink event (see GET /drinks/events)
+        kind is 'insert', 'update' or 'delete' of drink, or 'reset' when
+        too many drinks changed to list them (bulk writes)
+'''
+
+
+def drinks_changed(principal, kind='reset', drink=None):
+    subject = subject_of(principal)
+    # Encoded now: once committed, the attributes of drink are expired.
+    event = {
+        form: current_app.json.dumps({} if drink is None else
+                                     {'drink': format_drink(drink, form)},
+                                     separators=(',', ':'))
+        for form in EventBroker.FORMS
+    }
+
+    def changed():
+        drinks_cache.invalidate()
+        write_pins.pin(subject)
+        drink_events.publish(kind, event)
+
+    # Once committed: a read before that would cache the old drinks again.
+    after_commit(changed)
+
+
+def listing_params():
+    args = request.args
+
+    try:
+        limit = int_param(args.get('limit'))
+        cursor = int_param(args.get('cursor'))
+        fields = fields_param(args.get('fields'))
+    except ValueError:
+        abort(400)
+
+    if limit is not None and not 0 < limit <= MAX_PAGE_SIZE:
+        abort(400)
+
+    # Pages are small enough to be built in memory.
+    stream = limit is None and args.get('stream', '').lower() in ('1', 'true')
+
+    return limit, cursor, fields, stream
+
+
+def int_param(value):
+    if value is None:
+        return None
+
+    if not value.isdigit():
+        raise ValueError(value)
+
+    return int(value)
+
+
+def fields_param(value):
+    if value is None:
+        return DRINK_FIELDS
+
+    fields = tuple(field for field in DRINK_FIELDS
+                   if field in value.split(','))
+
+    if not fields:
+        raise ValueError(value)
+
+    return fields
+
+
+def list_drinks(query, representation, fields, limit, cursor):
+    rows = query.all()
+
+    if len(rows) == 0 and cursor is None:
+        abort(404)
+
+    with metrics.serialization_duration.timer(representation=representation):
+        drinks = [format_drink(row, representation, fields) for row in rows]
+        body = {'success': True, "drinks": drinks}
+
+        if limit is not None:
+            body['next_cursor'] = rows[-1].id if len(rows) == limit else None
+
+        return jsonify(body)
+
+
+def stream_drinks(query, representation, fields):
+    # Not the session of the request: it is closed at the teardown of the
+    # app context, before the body is sent (and async views have no request
+    # context left for stream_with_context to keep).
+    connection = query.session.get_bind(mapper=Drink).connect()
+
+    try:
+        rows = connection.execution_options(
+            yield_per=STREAM_BATCH_SIZE).execute(query.statement)
+        first = rows.fetchone()
+    except Exception:
+        connection.close()
+        raise
+
+    if first is None:
+        connection.close()
         abort(404)
 
-    drinks = [drink.long() for drink in drinks]  # Format each drink to a
-    # long description.
+    dumps = current_app.json.dumps
+
+    def encode(row):
+        return dumps(format_drink(row, representation, fields),
+                     separators=(',', ':'))
+
+    def generate():
+        try:
+            # Timed batch by batch, leaving out the time spent reading rows
+            # and writing to the client.
+            started = time.perf_counter()
+            # One chunk per batch of rows rather than one per drink.
+            chunk = ['{"drinks":[', encode(first)]
+            serializing = time.perf_counter() - started
+
+            for row in rows:
+                started = time.perf_counter()
+                chunk.append(',' + encode(row))
+                serializing += time.perf_counter() - started
+
+                if len(chunk) >= STREAM_BATCH_SIZE:
+                    yield ''.join(chunk)
+                    chunk = []
+
+            chunk.append('],"success":true}\n')
+            metrics.serialization_duration.observe(
+                serializing, representation=representation)
+            yield ''.join(chunk)
+        finally:
+            rows.close()
+            connection.close()
 
-    return jsonify({'success': True, "drinks": drinks})
+    response = current_app.response_class(generate(),
+                                          mimetype='application/json')
+    # A generator never started does not run its finally when closed.
+    response.call_on_close(connection.close)
+
+    return response
+
+
+'''
+Implementation of endpoint
+    GET /drinks/events
+        it requires the 'get:drinks' or the 'get:drinks-detail' permission
+        it streams every drink change as a Server-Sent Event:
+            event: insert, update or delete, data: {"drink": drink}
+                drink is in its drink.long() representation with the
+                'get:drinks-detail' permission, drink.short() otherwise
+            event: reset, data: {}, when the changes could not be listed
+                (bulk writes, or a client too far behind): reload the drinks
+            event: expired, data: {}, last of the stream, once the token
+                expires: reconnect with a new token
+        a client reconnecting with a Last-Event-ID header (or a
+            last_event_id query parameter) first gets the events it missed
+    returns status code 200 and a text/event-stream body that stays open
+        or status code 503 if there are already too many streams
+'''
+
+
+@api.route('/drinks/events', methods=['GET'])
+@requires_auth('get:drinks', 'get:drinks-detail', any_of=True)
+def drink_event_stream(jwt):
+    form = 'long' if 'get:drinks-detail' in jwt.permissions else 'short'
+    # The stream outlives the app context of the request.
+    events = current_app.extensions['drink_events']
+    subscription, missed = events.subscribe(
+        form, request.headers.get('Last-Event-ID') or
+        request.args.get('last_event_id'))
+
+    if subscription is None:
+        abort(503)
+
+    # Checked once, at connect: the stream ends when the token expires.
+    expires_at = jwt.claims.get('exp')
+    response = current_app.response_class(
+        events.stream(subscription, missed,
+                      current_app.config['DRINK_EVENTS_HEARTBEAT'],
+                      expires_at=expires_at if is_numeric_date(expires_at)
+                      else None),
+        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stops nginx from buffering the events.
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Also when the client is gone before the stream started.
+    response.call_on_close(lambda: events.unsubscribe(subscription))
+
+    return response
 
 
 '''
@@ -82,33 +621,20 @@ Implementation of endpoint
 '''
 
 
-@app.route('/drinks', methods=['POST'])
+@api.route('/drinks', methods=['POST'])
 @requires_auth("post:drinks")
 def post_drinks(jwt):
-    print("IN POST /drink => ", request.get_json())
-    drink = []
-
-    title = request.get_json()['title']
-    recipe = request.get_json()['recipe']
-
     try:
-        # new_drink = Drink(title=title, recipe=recipe)
+        new_drink = Drink(**validate_drink(request.get_json(silent=True)))
+    except ValueError:
+        abort(422)
 
-        new_drink = Drink(
-            title='coca cola',
-            recipe='[{"name": "coca cola", "color": "black", "parts": 1}]'
-        )
+    new_drink.insert()
+    drinks_changed(jwt, 'insert', new_drink)
+    current_app.logger.info('Drink created: id=%s title=%r', new_drink.id,
+                            new_drink.title)
 
-        new_drink.insert()
-        drink.append(new_drink.long())
-
-        return jsonify({'success': True, "drinks": drink})
-    except:
-        abort(422)
-        db.session.rollback()
-        print(sys.exc_info())
-    finally:
-        db.session.close()
+    return jsonify({'success': True, "drinks": [new_drink.long()]})
 
 
 '''
@@ -124,39 +650,36 @@ Implementation of endpoint
 '''
 
 
-@app.route('/drinks/<id>', methods=['PATCH'])
+@api.route('/drinks/<id>', methods=['PATCH'])
 @requires_auth("patch:drinks")
 def patch_drinks(jwt, id):
-    print("PATCH /drinks => ", request.get_json())
-    drink = []
-
-    title = request.get_json()['title']
-    recipe = request.get_json()['recipe']
+    body = request.get_json(silent=True)
 
-    # title = 'espresso',
-    # recipe = '[{"name": "espresso", "color": "black", "parts": 1}]'
+    updated_drink = db.session.query(Drink).filter(Drink.id == id).first()
 
-    try:
-        updated_drink = db.session.query(Drink).filter(Drink.id == id).first()
-
-        if updated_drink is None:
-            abort(404)
+    if updated_drink is None:
+        abort(404)
 
-        updated_drink = updated_drink.long()
+    if not isinstance(body, dict):
+        abort(422)
 
-        updated_drink['title'] = title
-        updated_drink['recipe'] = recipe
+    # Either field can be left out to keep its current value.
+    try:
+        changes = validate_drink({
+            'title': body.get('title', updated_drink.title),
+            'recipe': body.get('recipe', updated_drink.parsed_recipe)
+        })
+    except ValueError:
+        abort(422)
 
-        updated_drink.update()
-        drink.append(updated_drink)
+    updated_drink.title = changes['title']
+    updated_drink.recipe = changes['recipe']
+    updated_drink.update()
+    drinks_changed(jwt, 'update', updated_drink)
+    current_app.logger.info('Drink updated: id=%s title=%r',
+                            updated_drink.id, updated_drink.title)
 
-        return jsonify({'success': True, "drinks": drink})
-    except:
-        abort(422)
-        db.session.rollback()
-        print(sys.exc_info())
-    finally:
-        db.session.close()
+    return jsonify({'success': True, "drinks": [updated_drink.long()]})
 
 
 '''
@@ -171,30 +694,227 @@ Implementation of endpoint
 '''
 
 
-@app.route('/drinks/<id>', methods=['DELETE'])
+@api.route('/drinks/<id>', methods=['DELETE'])
 @requires_auth("delete:drinks")
 def delete_drinks(jwt, id):
+    drink = db.session.query(Drink).filter(Drink.id == id).first()
+
+    if drink is None:
+        abort(404)
+
+    drink.delete()
+    drinks_changed(jwt, 'delete', drink)
+    current_app.logger.info('Drink deleted: id=%s', id)
+
+    return jsonify({'success': True, "delete": id})
+
+
+'''
+Implementation of endpoint
+    POST /drinks/bulk
+        it requires the 'post:drinks' permission
+        it takes json {"drinks": [{"title": title, "recipe": recipe}, ...], "upsert": false}
+            drinks whose title already exists are updated when "upsert" is true
+        rows are written in chunks, each chunk in a single transaction
+    returns status code 200 and json {"success": True, "inserted": n, "updated": n, "errors": errors}
+        where errors lists {"index": i, "message": m} for every drink that was not written
+        or status code 400 if the body is not of the expected shape
+'''
+
+
+@api.route('/drinks/bulk', methods=['POST'])
+@requires_auth("post:drinks")
+def post_drinks_bulk(jwt):
+    body = request.get_json(silent=True)
+
+    if not isinstance(body, dict) or not isinstance(body.get('drinks'), list):
+        abort(400)
+
+    result = bulk_save_drinks(body['drinks'], upsert=bool(body.get('upsert')))
+    drinks_changed(jwt)
+
+    return jsonify({'success': True, **result})
+
+
+'''
+Implementation of endpoint
+    DELETE /drinks/bulk
+        it requires the 'delete:drinks' permission
+        it takes json {"ids": [id, ...]}
+    returns status code 200 and json {"success": True, "deleted": n, "errors": errors}
+        where errors lists {"id": id, "message": m} for every id that was not deleted
+        or status code 400 if the body is not of the expected shape
+'''
+
+
+@api.route('/drinks/bulk', methods=['DELETE'])
+@requires_auth("delete:drinks")
+def delete_drinks_bulk(jwt):
+    body = request.get_json(silent=True)
+
+    if not isinstance(body, dict) or not isinstance(body.get('ids'), list):
+        abort(400)
+
+    result = bulk_delete_drinks(body['ids'])
+    drinks_changed(jwt)
+
+    return jsonify({'success': True, **result})
+
+
+'''
+Implementation of endpoint
+    GET /drinks/export
+        it requires the 'get:drinks-detail' permission
+    returns status code 200 and every drink in its drink.long() representation,
+        one json document per line (application/x-ndjson), streamed
+'''
+
+
+@api.route('/drinks/export', methods=['GET'])
+@requires_auth("get:drinks-detail")
+def export_drinks(jwt):
+    app = current_app._get_current_object()
+    subject = subject_of(jwt)
+
+    # The lines are read after the teardown of the app context of the
+    # request (and of its session): the export runs in an app context of
+    # its own, with its own session.
+    def generate():
+        with app.app_context():
+            yield from iter_drinks_ndjson(session=read_session_for(subject))
+
+    return current_app.response_class(generate(),
+                                      mimetype='application/x-ndjson')
+
+
+'''
+Command line import / export, in the format of GET /drinks/export
+    flask drinks import FILE [--upsert]
+    flask drinks export [FILE]
+'''
+
+drinks_cli = AppGroup('drinks', help='Bulk import and export of drinks.')
+
+
+@drinks_cli.command('import')
+@click.argument('file', type=click.File('r'))
+@click.option('--upsert', is_flag=True,
+              help='Update the recipe of drinks that already exist.')
+def import_drinks_command(file, upsert):
+    def read(lines):
+        for line in lines:
+            if line.strip():
+                try:
+                    yield loads(line)
+                except ValueError:
+                    # Reported as an invalid drink at its index.
+                    yield None
+
+    prepare_db()
+    result = bulk_save_drinks(read(file), upsert=upsert)
+    drinks_cache.invalidate()
+
+    for error in result['errors']:
+        click.echo(f'drink {error["index"]}: {error["message"]}', err=True)
+
+    click.echo(f'{result["inserted"]} inserted, {result["updated"]} updated, '
+               f'{len(result["errors"])} rejected')
+
+
+@drinks_cli.command('export')
+@click.argument('file', type=click.File('w'), default='-')
+def export_drinks_command(file):
+    prepare_db()
+
+    for line in iter_drinks_ndjson():
+        file.write(line)
+
+
+'''
+Command line tokens for internal service traffic, see the local issuer in
+./auth/local_issuer.py
+    flask auth keygen PRIVATE_KEY [--alg RS256] [--jwks FILE]
+    flask auth mint --subject SUB [--permission P]... [--key PRIVATE_KEY]
+'''
+
+auth_cli = AppGroup('auth', help='Keys and tokens of the local issuer.')
+
+
+@auth_cli.command('keygen')
+@click.argument('private_key', type=click.Path(dir_okay=False))
+@click.option('--alg', type=click.Choice(['RS256', 'ES256', 'EdDSA']),
+              default='RS256', show_default=True,
+              help='RS256 tokens are the fastest to verify, ES256 and EdDSA '
+                   'ones the smallest and fastest to sign.')
+@click.option('--jwks', 'jwks_file', type=click.Path(dir_okay=False),
+              help='Key set the public key is added to '
+                   '[default: AUTH_LOCAL_JWKS_FILE].')
+def keygen_command(private_key, alg, jwks_file):
+    from .auth import local_issuer
+
+    # Not an option default: those are read before the app context is
+    # pushed, and would miss the AUTH_CONFIG of the app.
+    jwks_file = jwks_file or current_config().local_jwks_file
+
+    if not jwks_file:
+        raise click.UsageError('Pass --jwks or set AUTH_LOCAL_JWKS_FILE.')
+
+    key = local_issuer.generate_key(alg)
+    local_issuer.save_private_key(key, private_key)
+    jwk = local_issuer.public_jwk(key)
+    local_issuer.add_to_jwks(jwks_file, jwk)
+
+    click.echo(f'{alg} key {jwk["kid"]} written to {private_key}, public key '
+               f'added to {jwks_file}')
+
+
+@auth_cli.command('mint')
+@click.option('--subject', required=True, help='sub claim, e.g. svc|batch.')
+@click.option('--permission', 'permissions', multiple=True,
+              help='Granted permission, can be repeated.')
+@click.option('--expires-in', type=int, default=3600, show_default=True,
+              help='Lifetime in seconds.')
+@click.option('--key', 'private_key', type=click.Path(exists=True,
+                                                      dir_okay=False),
+              default=lambda: os.environ.get('AUTH_LOCAL_SIGNING_KEY'),
+              help='Private key file [default: AUTH_LOCAL_SIGNING_KEY].')
+def mint_command(subject, permissions, expires_in, private_key):
+    from .auth import local_issuer
+
+    if not private_key:
+        raise click.UsageError('Pass --key or set AUTH_LOCAL_SIGNING_KEY.')
+
+    config = current_config()
+    issuer = config.issuers.get(config.local_issuer)
+
+    # The token would be turned down by every route.
+    if issuer is None:
+        raise click.UsageError('Local issuing is not enabled: set '
+                               'AUTH_LOCAL_JWKS_FILE (see flask auth keygen).')
+
+    key = local_issuer.load_private_key(private_key)
+
     try:
-        drink = db.session.query(Drink).filter(Drink.id == id).first()
-        print("DELETE /drink => ", drink)
+        with open(config.local_jwks_file) as file:
+            kids = {jwk.get('kid') for jwk in json.load(file).get('keys', [])}
+    except OSError:
+        kids = set()
 
-        if drink is None:
-            abort(404)
+    if local_issuer.public_jwk(key)['kid'] not in kids:
+        raise click.UsageError(f'The public key of {private_key} is not in '
+                               f'{config.local_jwks_file}.')
 
-        drink.delete()
+    if local_issuer.key_algorithm(key) not in issuer.algorithms:
+        raise click.UsageError(f'{local_issuer.key_algorithm(key)} is not in '
+                               f'AUTH_LOCAL_ALGORITHMS.')
 
-        return jsonify({'success': True, "delete": id})
-    except:
-        abort(422)
-        db.session.rollback()
-        print(sys.exc_info())
-    finally:
-        db.session.close()
+    click.echo(local_issuer.mint(key, config.local_issuer, config.audience,
+                                 subject, permissions, expires_in))
 
 
 # Error Handling
 '''
-Implementation of error handlers using the @app.errorhandler(error) decorator
+Implementation of error handlers using the @api.app_errorhandler(error) decorator
     each error handler returns (with appropriate messages):
              For example:
              jsonify({
@@ -205,12 +925,24 @@ Implementation of error handlers using the @app.errorhandler(error) decorator
 
 '''
 
+'''
+Implementation of error handler for 400
+'''
+
+
+@api.app_errorhandler(400)
+def bad_request(error):
+    return jsonify({
+        "success": False, "error": 400, "message": "Bad request"
+    }), 400
+
+
 '''
 Implementation of error handler for 404
 '''
 
 
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     return jsonify({
         "success": False, "error": 404, "message": "Resource not found"
@@ -222,7 +954,7 @@ Implementation of error handler for 405
 '''
 
 
-@app.errorhandler(405)
+@api.app_errorhandler(405)
 def not_allowed(error):
     return jsonify({
         "success": False, "error": 405, "message": "Method not allowed"
@@ -234,7 +966,7 @@ Implementation of error handler for 422
 '''
 
 
-@app.errorhandler(422)
+@api.app_errorhandler(422)
 def unprocessable(error):
     return jsonify({
         "success": False, "error": 422, "message": "Unprocessable entity"
@@ -246,19 +978,44 @@ Implementation of error handler for 500
 '''
 
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def server_error(error):
     return jsonify({
         "success": False, "error": 500, "message": "Internal server error"
     }), 500
 
 
+'''
+Implementation of error handler for 503
+'''
+
+
+@api.app_errorhandler(503)
+def unavailable(error):
+    return jsonify({
+        "success": False, "error": 503, "message": "Service unavailable"
+    }), 503
+
+
+'''
+Implementation of error handler for IntegrityError
+    a write the database refused (e.g. a title already taken) is a 422
+'''
+
+
+@api.app_errorhandler(IntegrityError)
+def integrity_error(error):
+    db.session.rollback()
+
+    return unprocessable(error)
+
+
 '''
 Implement of error handler for AuthError
 '''
 
 
-@app.errorhandler(AuthError)
+@api.app_errorhandler(AuthError)
 def auth_error(error):
     return jsonify({
         "success": False, "error": error.status_code, "message": error.error
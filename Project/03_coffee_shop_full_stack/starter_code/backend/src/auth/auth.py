@@ -1,13 +1,80 @@
-import json
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
 
-from flask import abort, request
+from flask import abort, current_app, has_app_context, request
+from werkzeug.local import LocalProxy
+
+from ..metrics import auth_duration, auth_failures, cache_requests
+from .config import AuthConfig
+from .principal import Principal
+from .verifiers import (ExpiredTokenError, InvalidClaimsError,
+                        InvalidTokenError, inspect_token)
+
+logger = logging.getLogger(__name__)
+
+'''
+default_config()
+    the config built from the environment (AUTH0_DOMAIN, API_AUDIENCE, ...,
+    see ./config.py) on first use, used unless the app or the decorator is
+    given another one
+    auth_config stands for it, importing this module builds nothing
+'''
+
+_default_config = None
+_default_config_lock = threading.Lock()
+
+
+def default_config():
+    global _default_config
+
+    if _default_config is None:
+        with _default_config_lock:
+            if _default_config is None:
+                _default_config = AuthConfig.from_env()
+
+    return _default_config
+
+
+auth_config = LocalProxy(default_config)
+
+# Threads running signature checks for requires_auth_async, so they do not
+# block the event loop.
+verify_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('AUTH_VERIFY_WORKERS', 4)),
+    thread_name_prefix='jwt-verify')
+
+'''
+init_app(app, config)
+    makes config (by default built from app.config, see AuthConfig) the one
+    requires_auth uses for the routes of app
+current_config()
+    the config of the current app, or default_config() outside of one
+'''
+
+
+def init_app(app, config=None):
+    config = config or AuthConfig.from_mapping(app.config)
+    app.extensions['auth_config'] = config
+
+    return config
+
+
+def current_config():
+    if has_app_context():
+        config = current_app.extensions.get('auth_config')
+
+        if config is not None:
+            return config
+
+    return default_config()
 
-AUTH0_DOMAIN = 'dev-4ezltnbcex7uvmp5.us.auth0.com'
-ALGORITHMS = ['RS256']
-API_AUDIENCE = 'ffsnd'
 
 # AuthError Exception
 '''
@@ -73,32 +140,40 @@ def get_token_auth_header():
 
     token = parts[1]
 
-    print("***** TOKEN ***** ")
-    print(token)
-
     return token
 
 
 '''
 Implementation of check_permissions(permission, payload) method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
-        payload: decoded jwt payload
+        permission: string permission (i.e. 'post:drink'), or a collection of them
+        payload: Principal (or decoded jwt payload)
+        any_of: if True one of the permissions is enough, otherwise all are required
 
     it raises an AuthError if permissions are not included in the payload
-    it raises an AuthError if the requested permission string is not in the payload permissions array
+    it raises an AuthError if the requested permission strings are not in the payload permissions
     returns true otherwise
 '''
 
 
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
+def check_permissions(permission, payload, any_of=False):
+    if not isinstance(payload, Principal):
+        payload = Principal(payload)
+
+    if payload.permissions is None:
         raise AuthError({
             'code': 'invalid_claims',
             'description': 'Permissions not included in JWT.'
         }, 400)
 
-    if permission not in payload['permissions']:
+    required = required_permissions(permission)
+
+    if any_of:
+        granted = not required or not required.isdisjoint(payload.permissions)
+    else:
+        granted = required <= payload.permissions
+
+    if not granted:
         raise AuthError({
             'code': 'unauthorized', 'description': 'Permission not found.'
         }, 403)
@@ -106,51 +181,161 @@ def check_permissions(permission, payload):
     return True
 
 
+def required_permissions(permission):
+    if isinstance(permission, frozenset):
+        return permission
+
+    if isinstance(permission, str):
+        permission = (permission,)
+
+    # An empty permission string means no permission is required.
+    return frozenset(p for p in permission if p)
+
+
 '''
-Implementation of verify_decode_jwt(token) method
+Implementation of verify_decode_jwt(token, config) method
     @INPUTS
         token: a json web token (string)
-
-    it should be an Auth0 token with key id (kid)
-    function verifies the token using Auth0 /.well-known/jwks.json
+        config: the AuthConfig to verify with (current_config() by default)
+
+    it should be a token with key id (kid) from one of the config issuers:
+        Auth0, or the local issuer of internal service tokens if configured
+    tokens rejected in the last rejected_cache_ttl seconds fail straight away
+        with the same error
+    the checks needing no key come first (see inspect_token): malformed,
+        expired or wrongly signed (alg) tokens never cause a key set download
+    function verifies the token using the key set of its issuer
+        Auth0 /.well-known/jwks.json, or the AUTH_LOCAL_JWKS_FILE
+        the key set is served from a JWKSStore, not downloaded per request
+        the key matching the token kid is a ready-built public key object
+    the signature and claims are checked by the configured verifier backend
     it decodes the payload from the token
     it validates the claims
     returns the decoded payload
+
+    verify_decode_jwt_async does the same from an event loop: a JWKS refresh
+    and the signature check run on background threads
 '''
 
 
-def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
+def verify_decode_jwt(token, config=None):
+    config = config or current_config()
+    check_rejected(token, config)
+
+    with auth_duration.timer(stage='jwks'):
+        with remember_rejection(token, config):
+            issuer, kid = get_token_issuer(token, config)
+
+        rsa_key = issuer.jwks_store.get_key(kid)
+
+    return verify_with_key(token, rsa_key, issuer, config)
+
+
+async def verify_decode_jwt_async(token, config=None):
+    config = config or current_config()
+    check_rejected(token, config)
+
+    with auth_duration.timer(stage='jwks'):
+        with remember_rejection(token, config):
+            issuer, kid = get_token_issuer(token, config)
+
+        rsa_key = await issuer.jwks_store.get_key_async(kid)
+
+    loop = asyncio.get_running_loop()
+
+    return await loop.run_in_executor(verify_executor, verify_with_key,
+                                      token, rsa_key, issuer, config)
 
-    if 'kid' not in unverified_header:
+
+def verify_with_key(token, rsa_key, issuer, config):
+    if rsa_key is None:
+        # Not remembered: the key may be published by the next refresh.
+        return decode_with_key(token, rsa_key, issuer, config)
+
+    with auth_duration.timer(stage='verify'), \
+            remember_rejection(token, config):
+        return decode_with_key(token, rsa_key, issuer, config)
+
+
+def check_rejected(token, config):
+    error = config.rejected_tokens.get(token)
+    cache_requests.inc(cache='rejected', result='miss'
+                       if error is None else 'hit')
+
+    if error is not None:
+        # A new exception each time, the cached one may be raised by several
+        # threads at once.
+        raise AuthError(error.error, error.status_code)
+
+
+@contextmanager
+def remember_rejection(token, config):
+    try:
+        yield
+    except AuthError as error:
+        config.rejected_tokens.put(token, error,
+                                   time.time() + config.rejected_cache_ttl)
+        raise
+
+
+def get_token_issuer(token, config):
+    """
+    Returns the issuer named by the token and the kid of its signing key.
+    """
+
+    try:
+        unverified_header, unverified_claims = inspect_token(
+            token, leeway=config.leeway)
+    except ExpiredTokenError:
+        raise AuthError({
+            'code': 'token_expired', 'description': 'Token expired.'
+        }, 401)
+    except InvalidTokenError:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+
+    issuer = config.issuers.get(unverified_claims.get('iss'))
+
+    if issuer is None:
+        raise AuthError({
+            'code': 'invalid_claims',
+            'description': 'Incorrect claims. Please, check the audience '
+                           'and issuer. '
+        }, 401)
+
+    if unverified_header.get('alg') not in issuer.algorithms:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Unable to parse authentication token.'
+        }, 400)
+
+    if not isinstance(unverified_header.get('kid'), str):
         raise AuthError({
             'code': 'invalid_header', 'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'], 'kid': key['kid'], 'use': key['use'],
-                'n': key['n'], 'e': key['e']
-            }
+    return issuer, unverified_header['kid']
 
-    if rsa_key:
+
+def decode_with_key(token, rsa_key, issuer, config):
+    if rsa_key is not None:
         try:
-            payload = jwt.decode(token, rsa_key, algorithms=ALGORITHMS,
-                                 audience=API_AUDIENCE,
-                                 issuer='https://' + AUTH0_DOMAIN + '/')
+            payload = config.verifier.decode(token, rsa_key,
+                                             algorithms=issuer.algorithms,
+                                             audience=config.audience,
+                                             issuer=issuer.url,
+                                             leeway=config.leeway)
 
             return payload
 
-        except jwt.ExpiredSignatureError:
+        except ExpiredTokenError:
             raise AuthError({
                 'code': 'token_expired', 'description': 'Token expired.'
             }, 401)
 
-        except jwt.JWTClaimsError:
+        except InvalidClaimsError:
             raise AuthError({
                 'code': 'invalid_claims',
                 'description': 'Incorrect claims. Please, check the audience '
@@ -170,29 +355,157 @@ def verify_decode_jwt(token):
 
 
 '''
-Implementation of @requires_auth(permission) decorator method
+Implementation of @requires_auth(*permissions) decorator method
     @INPUTS
-        permission: string permission (i.e. 'post:drink')
+        permissions: string permissions (i.e. 'post:drink')
+        any_of: if True one of the permissions is enough, otherwise all are required
+        config: the AuthConfig of these routes, e.g. for a second audience
+            (current_config() of each request by default)
 
+    Clients over the failure limit of the config get a 429 (check_failure_limit)
     Uses the get_token_auth_header method to get the token
     It uses the verify_decode_jwt method to decode the jwt
-    It uses the check_permissions method validate claims and check the requested permission
-    returns the decorator which passes the decoded payload to the decorated method
+        unless the token was already verified and is still in the config token_cache
+    It uses the check_permissions method validate claims and check the requested permissions
+    returns the decorator which passes the Principal of the token to the decorated method
 '''
 
 
-def requires_auth(permission=''):
+def requires_auth(*permissions, any_of=False, config=None):
+    required = required_permissions(permissions)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
+            request_config = config or current_config()
+            token = authenticate_request(request_config)
+
             try:
-                payload = verify_decode_jwt(token)
-                check_permissions(permission, payload)
-            except:
+                principal = cached_principal(request_config, token)
+                cache_requests.inc(cache='token', result='miss'
+                                   if principal is None else 'hit')
+
+                if principal is None:
+                    payload = verify_decode_jwt(token, request_config)
+                    principal = Principal(payload)
+                    cache_principal(request_config, token, principal,
+                                    payload.get('exp'))
+
+                check_permissions(required, principal, any_of=any_of)
+            except Exception as error:
+                auth_failed(error, request_config)
                 abort(401)
 
-            return f(payload, *args, **kwargs)
+            return f(principal, *args, **kwargs)
+
+        return wrapper
+
+    return requires_auth_decorator
+
+
+def authenticate_request(config):
+    """
+    Returns the bearer token of the request, once the failure limit is
+    checked.
+    """
+
+    check_failure_limit(config)
+
+    try:
+        return get_token_auth_header()
+    except AuthError as error:
+        auth_failed(error, config)
+        raise
+
+
+'''
+cached_principal(config, token), cache_principal(config, token, principal, exp)
+    the token cache of config, when a SharedCache file cannot be read or
+    written (locked past its timeout, disk full) the token is verified as if
+    it was not cached: a failing cache is not a failed authentication
+'''
+
+
+def cached_principal(config, token):
+    try:
+        return config.token_cache.get(token)
+    except sqlite3.OperationalError as error:
+        logger.warning('Shared token cache unavailable: %s', error)
+
+        return None
+
+
+def cache_principal(config, token, principal, exp):
+    try:
+        config.token_cache.put(token, principal, exp)
+    except sqlite3.OperationalError as error:
+        logger.warning('Shared token cache unavailable: %s', error)
+
+
+def auth_failed(error, config):
+    # Counted by code in auth_failures_total, see GET /metrics.
+    code = error.error.get('code') if isinstance(error, AuthError) else None
+    auth_failures.inc(code=code or 'unknown')
+    logger.info('Authentication failed: %s', code or repr(error))
+
+    # A valid token lacking a permission is not a failed authentication.
+    if config.failure_limiter is not None and code != 'unauthorized':
+        config.failure_limiter.failed(request.remote_addr)
+
+
+def check_failure_limit(config):
+    if config.failure_limiter is None:
+        return
+
+    retry_after = config.failure_limiter.retry_after(request.remote_addr)
+
+    if retry_after:
+        auth_failures.inc(code='too_many_failures')
+        raise AuthError({
+            'code': 'too_many_failures',
+            'description': 'Too many failed authentications, retry in '
+                           f'{retry_after} seconds.'
+        }, 429)
+
+
+'''
+Implementation of @requires_auth_async(*permissions) decorator method
+    same as requires_auth, for Flask async views or an ASGI server
+    the wrapper is a coroutine function: it verifies the token with
+        verify_decode_jwt_async and then calls (or awaits) the decorated method
+'''
+
+
+def requires_auth_async(*permissions, any_of=False, config=None):
+    required = required_permissions(permissions)
+
+    def requires_auth_decorator(f):
+        @wraps(f)
+        async def wrapper(*args, **kwargs):
+            request_config = config or current_config()
+            token = authenticate_request(request_config)
+
+            try:
+                principal = cached_principal(request_config, token)
+                cache_requests.inc(cache='token', result='miss'
+                                   if principal is None else 'hit')
+
+                if principal is None:
+                    payload = await verify_decode_jwt_async(token,
+                                                            request_config)
+                    principal = Principal(payload)
+                    cache_principal(request_config, token, principal,
+                                    payload.get('exp'))
+
+                check_permissions(required, principal, any_of=any_of)
+            except Exception as error:
+                auth_failed(error, request_config)
+                abort(401)
+
+            if asyncio.iscoroutinefunction(f):
+                return await f(principal, *args, **kwargs)
+
+            return f(principal, *args, **kwargs)
 
         return wrapper
 
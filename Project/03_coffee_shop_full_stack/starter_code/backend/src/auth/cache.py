@@ -0,0 +1,131 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from .. import codec
+
+DEFAULT_MAXSIZE = 1024
+
+'''
+token_digest(token)
+    the cache key of a token
+    raw bearer tokens are never kept in memory as keys
+'''
+
+
+def token_digest(token):
+    return hashlib.sha256(token.encode('utf-8')).digest()
+
+
+'''
+TokenCache
+    a bounded, thread-safe LRU cache of what was built from tokens
+    entries are keyed by the token digest and expire at the given time
+        (the token exp claim for verified tokens)
+    auth.py keeps one for the tokens that passed full verification and one
+        for the tokens it recently rejected
+'''
+
+
+class TokenCache:
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        """
+        Returns the cached value for token, or None if absent or expired.
+        """
+
+        digest = token_digest(token)
+
+        with self._lock:
+            entry = self._entries.get(digest)
+
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+
+            if self.clock() >= expires_at:
+                del self._entries[digest]
+                return None
+
+            self._entries.move_to_end(digest)
+
+            return value
+
+    def put(self, token, value, expires_at):
+        # Tokens without an exp claim are never cached: there is no point
+        # in time after which they would have to be verified again.
+        if not isinstance(expires_at, (int, float)) or self.maxsize <= 0:
+            return
+
+        digest = token_digest(token)
+
+        with self._lock:
+            self._entries[digest] = (value, expires_at)
+            self._entries.move_to_end(digest)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+'''
+SharedTokenCache
+    a TokenCache backed by a SharedCache, so a token verified by one worker
+    process is served from the cache by the others
+    entries missing from the LRU of the process are looked up in the shared
+        file, and every entry put is written to both
+    clear() only empties the LRU of the process
+    encode(value) turns a value into JSON data for the file, decode(data)
+        turns it back, e.g. the claims of a Principal and Principal itself
+    namespace sets the entries of one cache apart from those of another
+        cache sharing the file
+'''
+
+
+class SharedTokenCache(TokenCache):
+    def __init__(self, shared, namespace, maxsize=DEFAULT_MAXSIZE,
+                 encode=None, decode=None, clock=time.time):
+        super().__init__(maxsize, clock)
+        self.shared = shared
+        self.namespace = namespace.encode('utf-8') + b':'
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda data: data)
+
+    def get(self, token):
+        value = super().get(token)
+
+        if value is not None:
+            return value
+
+        entry = self.shared.get(self.namespace + token_digest(token))
+
+        if entry is None:
+            return None
+
+        data, expires_at = entry
+        value = self.decode(codec.loads(data))
+        super().put(token, value, expires_at)
+
+        return value
+
+    def put(self, token, value, expires_at):
+        if not isinstance(expires_at, (int, float)):
+            return
+
+        super().put(token, value, expires_at)
+        self.shared.put(self.namespace + token_digest(token),
+                        codec.dumps(self.encode(value)), expires_at)
@@ -0,0 +1,171 @@
+import os
+from operator import attrgetter
+
+from .cache import SharedTokenCache, TokenCache
+from .jwks import JWKSStore, file_fetcher, shared_fetcher, url_fetcher
+from .limits import FailureLimiter, parse_limit
+from .principal import Principal
+from .shared import SharedCache
+from .verifiers import DEFAULT_BACKEND, get_verifier
+
+DEFAULT_DOMAIN = 'dev-4ezltnbcex7uvmp5.us.auth0.com'
+DEFAULT_AUDIENCE = 'ffsnd'
+DEFAULT_LOCAL_ISSUER = 'https://coffee-shop.internal/'
+
+'''
+Issuer
+    a token issuer trusted by verify_decode_jwt: its iss claim value, the
+    store of its signing keys and the algorithms its tokens may use
+'''
+
+
+class Issuer:
+    __slots__ = ('url', 'jwks_store', 'algorithms')
+
+    def __init__(self, url, jwks_store, algorithms=('RS256',)):
+        self.url = url
+        self.jwks_store = jwks_store
+        self.algorithms = frozenset(algorithms)
+
+    def __repr__(self):
+        return f'<Issuer {self.url!r}>'
+
+
+'''
+AuthConfig
+    everything requires_auth needs to verify tokens, built once at startup
+        the Auth0 domain, its issuer string and the API audience
+        the allowed algorithms and the clock skew leeway (seconds)
+        the verifier backend, the cache sizes and TTLs, the failure limit
+        the optional local issuer of internal service tokens
+        the optional SharedCache file of the worker processes
+    a config owns its key stores and caches: a token accepted for one
+        audience is never served from the cache of another, so several
+        configs (e.g. one per tenant) can run side by side in one process
+    issuers maps iss claims to issuers, the issuer of a token is the one its
+        iss claim names
+    from_env() reads the settings below from the environment,
+        from_mapping(app.config) from a Flask config, falling back to the
+        environment for missing ones
+'''
+
+SETTINGS = {
+    # name: (AuthConfig argument, default)
+    'AUTH0_DOMAIN': ('domain', DEFAULT_DOMAIN),
+    'API_AUDIENCE': ('audience', DEFAULT_AUDIENCE),
+    'AUTH0_JWKS_URL': ('jwks_url', None),
+    'AUTH_ALGORITHMS': ('algorithms', 'RS256'),
+    'AUTH_LEEWAY': ('leeway', 0),
+    'AUTH_JWT_BACKEND': ('backend', DEFAULT_BACKEND),
+    'AUTH_TOKEN_CACHE_SIZE': ('token_cache_size', 1024),
+    'AUTH_REJECTED_CACHE_SIZE': ('rejected_cache_size', 4096),
+    'AUTH_REJECTED_CACHE_TTL': ('rejected_cache_ttl', 60),
+    'AUTH_FAILURE_LIMIT': ('failure_limit', None),
+    'AUTH_LOCAL_ISSUER': ('local_issuer', DEFAULT_LOCAL_ISSUER),
+    'AUTH_LOCAL_JWKS_FILE': ('local_jwks_file', None),
+    'AUTH_LOCAL_ALGORITHMS': ('local_algorithms', 'RS256,ES256,EdDSA'),
+    'AUTH_SHARED_CACHE': ('shared_cache', None),
+    'AUTH_SHARED_CACHE_SIZE': ('shared_cache_size', 100000),
+}
+
+
+def as_list(value):
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+
+    return list(value)
+
+
+class AuthConfig:
+    def __init__(self, domain=DEFAULT_DOMAIN, audience=DEFAULT_AUDIENCE,
+                 jwks_url=None, algorithms=('RS256',), leeway=0,
+                 backend=DEFAULT_BACKEND, token_cache_size=1024,
+                 rejected_cache_size=4096, rejected_cache_ttl=60,
+                 failure_limit=None, local_issuer=DEFAULT_LOCAL_ISSUER,
+                 local_jwks_file=None,
+                 local_algorithms=('RS256', 'ES256', 'EdDSA'),
+                 shared_cache=None, shared_cache_size=100000):
+        self.domain = domain
+        self.issuer = 'https://' + domain + '/'
+        self.audience = audience
+        self.jwks_url = jwks_url or f'https://{domain}/.well-known/jwks.json'
+        self.algorithms = frozenset(as_list(algorithms))
+        self.leeway = int(leeway)
+        self.rejected_cache_ttl = int(rejected_cache_ttl)
+        self.local_issuer = local_issuer
+        self.local_jwks_file = local_jwks_file
+
+        # Library doing the signature checks: 'cryptography' or 'jose'.
+        self.verifier = get_verifier(backend)
+
+        # Path of a SQLite file holding the verified tokens and the Auth0
+        # key set for every worker process of the machine.
+        self.shared_cache = (SharedCache(shared_cache, int(shared_cache_size))
+                             if shared_cache else None)
+
+        fetcher = url_fetcher(self.jwks_url)
+
+        if self.shared_cache is not None:
+            fetcher = shared_fetcher(self.shared_cache, self.jwks_url, fetcher)
+
+        # Signing keys are fetched once, turned into public key objects by
+        # the verifier and shared by every request.
+        self.jwks_store = JWKSStore(fetcher, key_loader=self.verifier.load_key)
+
+        # Principals of tokens that already passed verification, until they
+        # expire.
+        if self.shared_cache is not None:
+            # A token is only served to configs trusting the same issuers
+            # for the same audience.
+            namespace = ' '.join([audience, self.issuer] + (
+                [local_issuer] if local_jwks_file else []))
+            self.token_cache = SharedTokenCache(
+                self.shared_cache, namespace, int(token_cache_size),
+                encode=attrgetter('claims'), decode=Principal)
+        else:
+            self.token_cache = TokenCache(int(token_cache_size))
+
+        # Errors of recently rejected tokens, so a token replayed over and
+        # over is turned down without being parsed or verified again.
+        self.rejected_tokens = TokenCache(int(rejected_cache_size))
+
+        # e.g. '20/60': a client address with 20 failed authentications
+        # within 60 seconds gets a 429 until the 60 seconds are over.
+        if isinstance(failure_limit, str):
+            failure_limit = parse_limit(failure_limit)
+
+        self.failure_limiter = (FailureLimiter(*failure_limit)
+                                if failure_limit else None)
+
+        self.issuers = {}
+        self.add_issuer(self.issuer, self.jwks_store, self.algorithms)
+
+        if local_jwks_file:
+            # Read again when the file is edited, at most every 30 seconds.
+            self.add_issuer(local_issuer,
+                            JWKSStore(file_fetcher(local_jwks_file),
+                                      key_loader=self.verifier.load_key),
+                            as_list(local_algorithms))
+
+    @classmethod
+    def from_mapping(cls, mapping, fallback=os.environ):
+        kwargs = {}
+
+        for name, (argument, default) in SETTINGS.items():
+            value = mapping.get(name, fallback.get(name))
+            kwargs[argument] = default if value in (None, '') else value
+
+        return cls(**kwargs)
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        return cls.from_mapping(environ, fallback={})
+
+    def add_issuer(self, url, jwks_store, algorithms=None):
+        issuer = Issuer(url, jwks_store, algorithms or self.algorithms)
+        self.issuers[url] = issuer
+
+        return issuer
+
+    def __repr__(self):
+        return f'<AuthConfig {self.issuer!r} {self.audience!r}>'
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+from .. import codec
+
+# Used when the identity provider sends no usable Cache-Control max-age.
+DEFAULT_TTL = 600
+# Lower bound between two fetches, whatever triggered them. Stops a flood of
+# tokens carrying forged kids from turning into a flood of JWKS downloads.
+MIN_REFRESH_INTERVAL = 30
+
+MAX_AGE_RE = re.compile(r'max-age=(\d+)')
+
+'''
+Fetchers
+    a fetcher is a zero-argument callable returning (jwks, max_age)
+        jwks: the decoded JSON Web Key Set ({"keys": [...]})
+        max_age: seconds the set may be cached for, or None if unknown
+    it raises on any failure to obtain the key set
+'''
+
+
+def parse_max_age(cache_control):
+    if not cache_control:
+        return None
+
+    match = MAX_AGE_RE.search(cache_control)
+    return int(match.group(1)) if match else None
+
+
+def url_fetcher(url, timeout=5):
+    def fetch():
+        with urlopen(url, timeout=timeout) as response:
+            jwks = json.loads(response.read())
+            max_age = parse_max_age(response.headers.get('Cache-Control'))
+
+        return jwks, max_age
+
+    return fetch
+
+
+def file_fetcher(path):
+    def fetch():
+        with open(path) as jwks_file:
+            return json.load(jwks_file), None
+
+    return fetch
+
+
+'''
+shared_fetcher(shared, name, fetcher)
+    fetcher, with its key sets kept in a SharedCache under name until their
+    max-age (or DEFAULT_TTL) is over, so the worker processes of a machine
+    download a key set once and see a rotation at the same time
+    a copy this process already got is never returned twice: a second call
+        means the store wants newer keys (expiry, unknown kid), so it gets
+        the copy another process wrote since, or a fresh download
+'''
+
+
+def shared_fetcher(shared, name, fetcher, ttl=DEFAULT_TTL):
+    key = ('jwks:' + name).encode('utf-8')
+    seen = None
+
+    def fetch():
+        nonlocal seen
+        entry = shared.get(key)
+
+        if entry is not None:
+            data, expires_at = entry
+            cached = codec.loads(data)
+
+            if seen is None or cached['fetched_at'] > seen:
+                seen = cached['fetched_at']
+                return cached['jwks'], max(0, int(expires_at - time.time()))
+
+        jwks, max_age = fetcher()
+        now = time.time()
+        shared.put(key, codec.dumps({'jwks': jwks, 'fetched_at': now}),
+                   now + (ttl if max_age is None else max_age))
+        seen = now
+
+        return jwks, max_age
+
+    return fetch
+
+
+'''
+JWKSStore
+    an in-process cache of the identity provider signing keys, indexed by kid
+    each JWK is passed through key_loader once, when the key set is loaded,
+        and get_key returns what key_loader built (e.g. a public key object)
+        keys key_loader rejects (raises for) are left out of the store
+    keys are fetched once and kept for max-age (or DEFAULT_TTL) seconds
+    an unknown kid triggers at most one refresh per MIN_REFRESH_INTERVAL
+    if the provider is unreachable the previously fetched keys keep being served
+    get_key_async is the event-loop friendly get_key: fetches run on a
+        background thread and concurrent callers, from any thread or event
+        loop, wait on the same in-flight fetch
+'''
+
+
+class JWKSStore:
+    def __init__(self, fetcher, key_loader=None, ttl=DEFAULT_TTL,
+                 min_refresh_interval=MIN_REFRESH_INTERVAL,
+                 clock=time.monotonic):
+        self.fetcher = fetcher
+        self.key_loader = key_loader
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.clock = clock
+
+        self._keys = {}
+        self._expires_at = 0
+        self._last_fetch = None
+        self._lock = threading.Lock()
+
+        self._inflight = None
+        self._inflight_lock = threading.Lock()
+        self._executor = None
+
+    def get_key(self, kid):
+        """
+        Returns the loaded key for kid, or None if the provider does not
+        publish it.
+        """
+
+        if self.clock() >= self._expires_at:
+            self.refresh()
+
+        key = self._keys.get(kid)
+
+        # Unknown kid: the provider may have rotated its keys.
+        if key is None and self.refresh(force=True):
+            key = self._keys.get(kid)
+
+        return key
+
+    async def get_key_async(self, kid):
+        if self.clock() >= self._expires_at:
+            await asyncio.wrap_future(self.refresh_in_background())
+
+        key = self._keys.get(kid)
+
+        if key is None and await asyncio.wrap_future(
+                self.refresh_in_background(force=True)):
+            key = self._keys.get(kid)
+
+        return key
+
+    def refresh_in_background(self, force=False):
+        """
+        Starts refresh on a background thread, unless one is already running.
+        Returns the concurrent.futures.Future of the running refresh.
+        """
+
+        with self._inflight_lock:
+            started = self._inflight is None
+
+            if started:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=1, thread_name_prefix='jwks-refresh')
+
+                self._inflight = self._executor.submit(self.refresh, force)
+
+            future = self._inflight
+
+        if started:
+            # Outside of the lock: a refresh already done runs the callback
+            # right here.
+            future.add_done_callback(self._refresh_done)
+
+        return future
+
+    def _refresh_done(self, future):
+        with self._inflight_lock:
+            if self._inflight is future:
+                self._inflight = None
+
+    def refresh(self, force=False):
+        """
+        Fetches the key set again. Returns True if new keys were loaded.
+        """
+
+        with self._lock:
+            now = self.clock()
+
+            # Another thread refreshed while this one waited for the lock.
+            if not force and now < self._expires_at:
+                return False
+
+            if (self._last_fetch is not None and
+                    now - self._last_fetch < self.min_refresh_interval):
+                return False
+
+            self._last_fetch = now
+
+            try:
+                jwks, max_age = self.fetcher()
+            except Exception:
+                if not self._keys:
+                    raise
+
+                # Keep serving the stale keys, try again later.
+                self._expires_at = now + self.min_refresh_interval
+                return False
+
+            self._keys = self._load_keys(jwks)
+
+            ttl = self.ttl if max_age is None else max_age
+            self._expires_at = now + max(ttl, self.min_refresh_interval)
+
+            return True
+
+    def _load_keys(self, jwks):
+        keys = {}
+
+        for key in jwks.get('keys', []):
+            if 'kid' not in key:
+                continue
+
+            if self.key_loader is None:
+                keys[key['kid']] = key
+                continue
+
+            try:
+                keys[key['kid']] = self.key_loader(key)
+            except Exception:
+                continue
+
+        return keys
@@ -0,0 +1,91 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 10000
+
+'''
+parse_limit(spec)
+    turns '<failures>/<seconds>' (e.g. '20/60') into (failures, seconds)
+'''
+
+
+def parse_limit(spec):
+    try:
+        limit, window = spec.split('/')
+        limit, window = int(limit), float(window)
+    except ValueError:
+        raise ValueError(f'Invalid limit {spec!r}, expected '
+                         f'<failures>/<seconds>.')
+
+    if limit <= 0 or window <= 0:
+        raise ValueError(f'Invalid limit {spec!r}, both numbers must be '
+                         f'positive.')
+
+    return limit, window
+
+
+'''
+FailureLimiter
+    counts authentication failures per client (e.g. its address) in fixed
+    windows of window seconds
+    a client with limit failures in its current window is blocked until the
+        window ends
+    at most maxsize clients are tracked, the least recently failing ones
+        are forgotten first
+'''
+
+
+class FailureLimiter:
+    def __init__(self, limit, window, maxsize=DEFAULT_MAXSIZE,
+                 clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self.clock = clock
+
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def retry_after(self, client):
+        """
+        Returns the whole seconds client stays blocked for, 0 if it is not.
+        """
+
+        with self._lock:
+            entry = self._clients.get(client)
+
+            if entry is None:
+                return 0
+
+            failures, window_end = entry
+            left = window_end - self.clock()
+
+            if left <= 0:
+                del self._clients[client]
+                return 0
+
+            return math.ceil(left) if failures >= self.limit else 0
+
+    def failed(self, client):
+        now = self.clock()
+
+        with self._lock:
+            failures, window_end = self._clients.get(client, (0, 0))
+
+            if now >= window_end:
+                failures, window_end = 0, now + self.window
+
+            self._clients[client] = (failures + 1, window_end)
+            self._clients.move_to_end(client)
+
+            while len(self._clients) > self.maxsize:
+                self._clients.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
@@ -0,0 +1,170 @@
+import base64
+import hashlib
+import json
+import os
+import time
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa
+from cryptography.hazmat.primitives.asymmetric.utils import \
+    decode_dss_signature
+
+'''
+Local issuer
+    signing side of the tokens for internal service traffic
+    the private key stays in a PEM file next to the service minting tokens
+    the matching public keys go into a JWKS file the backend reads
+        (AUTH_LOCAL_JWKS_FILE), so verifying needs no network access
+    each key is named (kid) by its RFC 7638 thumbprint, so minting only needs
+        the private key file
+    needs the cryptography package
+'''
+
+ALGORITHMS = ('RS256', 'ES256', 'EdDSA')
+
+
+def base64url_encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def encode_uint(value, length=None):
+    length = length or (value.bit_length() + 7) // 8
+    return base64url_encode(value.to_bytes(length, 'big'))
+
+
+def generate_key(alg='RS256'):
+    if alg == 'RS256':
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    if alg == 'ES256':
+        return ec.generate_private_key(ec.SECP256R1())
+
+    if alg == 'EdDSA':
+        return ed25519.Ed25519PrivateKey.generate()
+
+    raise ValueError(f'Unsupported algorithm {alg!r}, expected one of '
+                     f'{", ".join(ALGORITHMS)}.')
+
+
+def key_algorithm(private_key):
+    if isinstance(private_key, rsa.RSAPrivateKey):
+        return 'RS256'
+
+    if isinstance(private_key, ec.EllipticCurvePrivateKey) and \
+            isinstance(private_key.curve, ec.SECP256R1):
+        return 'ES256'
+
+    if isinstance(private_key, ed25519.Ed25519PrivateKey):
+        return 'EdDSA'
+
+    raise ValueError('Unsupported key, expected RSA, P-256 or Ed25519.')
+
+
+def save_private_key(private_key, path):
+    pem = private_key.private_bytes(serialization.Encoding.PEM,
+                                    serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+
+    # Readable by its owner only.
+    descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+
+    with os.fdopen(descriptor, 'wb') as key_file:
+        key_file.write(pem)
+
+
+def load_private_key(path):
+    with open(path, 'rb') as key_file:
+        private_key = serialization.load_pem_private_key(key_file.read(),
+                                                         password=None)
+
+    key_algorithm(private_key)
+
+    return private_key
+
+
+def public_jwk(private_key):
+    """
+    Returns the public JWK of private_key, with its thumbprint as kid.
+    """
+
+    alg = key_algorithm(private_key)
+    public_key = private_key.public_key()
+
+    if alg == 'RS256':
+        numbers = public_key.public_numbers()
+        key = {'kty': 'RSA', 'e': encode_uint(numbers.e),
+               'n': encode_uint(numbers.n)}
+    elif alg == 'ES256':
+        numbers = public_key.public_numbers()
+        key = {'kty': 'EC', 'crv': 'P-256', 'x': encode_uint(numbers.x, 32),
+               'y': encode_uint(numbers.y, 32)}
+    else:
+        raw = public_key.public_bytes(serialization.Encoding.Raw,
+                                      serialization.PublicFormat.Raw)
+        key = {'kty': 'OKP', 'crv': 'Ed25519', 'x': base64url_encode(raw)}
+
+    # RFC 7638: the required members only, sorted, without whitespace.
+    thumbprint = hashlib.sha256(json.dumps(
+        key, sort_keys=True, separators=(',', ':')).encode('utf-8')).digest()
+
+    return dict(key, kid=base64url_encode(thumbprint), use='sig', alg=alg)
+
+
+def add_to_jwks(path, jwk):
+    """
+    Adds jwk to the key set in path (created if missing), replacing any key
+    with the same kid. Older keys stay, so tokens they signed keep verifying.
+    """
+
+    try:
+        with open(path) as jwks_file:
+            jwks = json.load(jwks_file)
+    except FileNotFoundError:
+        jwks = {'keys': []}
+
+    jwks['keys'] = [key for key in jwks['keys'] if key.get('kid') !=
+                    jwk['kid']] + [jwk]
+
+    with open(path, 'w') as jwks_file:
+        json.dump(jwks, jwks_file, indent=2)
+
+    return jwks
+
+
+def sign(claims, private_key):
+    alg = key_algorithm(private_key)
+    header = {'alg': alg, 'typ': 'JWT', 'kid': public_jwk(private_key)['kid']}
+
+    signing_input = '.'.join(
+        base64url_encode(json.dumps(part, separators=(',', ':'))
+                         .encode('utf-8'))
+        for part in (header, claims))
+    data = signing_input.encode('ascii')
+
+    if alg == 'RS256':
+        signature = private_key.sign(data, padding.PKCS1v15(),
+                                     hashes.SHA256())
+    elif alg == 'ES256':
+        r, s = decode_dss_signature(
+            private_key.sign(data, ec.ECDSA(hashes.SHA256())))
+        signature = r.to_bytes(32, 'big') + s.to_bytes(32, 'big')
+    else:
+        signature = private_key.sign(data)
+
+    return f'{signing_input}.{base64url_encode(signature)}'
+
+
+def mint(private_key, issuer, audience, subject, permissions=(),
+         expires_in=3600, **claims):
+    now = int(time.time())
+    payload = {
+        'iss': issuer,
+        'aud': audience,
+        'sub': subject,
+        'iat': now,
+        'exp': now + expires_in,
+        'permissions': list(permissions)
+    }
+    payload.update(claims)
+
+    return sign(payload, private_key)
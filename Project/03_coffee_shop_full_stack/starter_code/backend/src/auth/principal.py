@@ -0,0 +1,28 @@
+'''
+Principal
+    the caller identified by a verified token, handed to decorated routes
+    permissions is a frozenset built once per token (None if the claim is absent)
+    the raw claims stay reachable with principal['claim'] or principal.claims
+'''
+
+
+class Principal:
+    __slots__ = ('subject', 'permissions', 'claims')
+
+    def __init__(self, claims):
+        self.claims = claims
+        self.subject = claims.get('sub')
+
+        permissions = claims.get('permissions')
+        self.permissions = (
+            None if permissions is None else frozenset(permissions)
+        )
+
+    def __getitem__(self, claim):
+        return self.claims[claim]
+
+    def __contains__(self, claim):
+        return claim in self.claims
+
+    def __repr__(self):
+        return f'<Principal {self.subject!r}>'
@@ -0,0 +1,109 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+
+# Writes between two removals of expired and surplus entries.
+PRUNE_EVERY = 1000
+
+# Pragmas of every connection to the shared file.
+#   journal_mode=WAL     reads never wait for a write, nor block one
+#   synchronous=NORMAL   no fsync per write, the file only holds caches
+#   mmap_size            bytes of the file read through memory mapping
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': str(64 * 1024 * 1024)
+}
+
+'''
+SharedCache
+    a cache shared by every worker process of a machine, in a SQLite file
+    keys are bytes, values are text, each entry expires at a given time
+        (seconds since the epoch: the processes share the wall clock)
+    every write is a single statement, committed atomically, and reads run
+        on a snapshot of the file without taking any lock (WAL mode)
+    entries are indexed by expiry: expired ones, then the ones closest to
+        expiring beyond maxsize, are removed every PRUNE_EVERY writes of a
+        process
+    each thread of each process opens its own connection on first use
+        (creating the file if needed), a connection is never used again
+        after a fork (e.g. in the workers of gunicorn --preload)
+    the file only holds caches: deleting it while no process runs is safe
+'''
+
+
+class SharedCache:
+    def __init__(self, path, maxsize=100000, timeout=5, clock=time.time):
+        self.path = path
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.clock = clock
+
+        self._local = threading.local()
+        # next() of a count is atomic, a += of an int is not: threads of a
+        # process would lose writes, and skip or repeat prunes.
+        self._writes = itertools.count(1)
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                     isolation_level=None)
+
+        for name, value in PRAGMAS.items():
+            connection.execute(f'PRAGMA {name} = {value}')
+
+        connection.execute('CREATE TABLE IF NOT EXISTS entries ('
+                           'key BLOB PRIMARY KEY, value TEXT NOT NULL, '
+                           'expires_at REAL NOT NULL) WITHOUT ROWID')
+        connection.execute('CREATE INDEX IF NOT EXISTS entries_expiry '
+                           'ON entries (expires_at)')
+
+        return connection
+
+    @property
+    def connection(self):
+        local = self._local
+
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self.connect()
+            local.pid = os.getpid()
+
+        return local.connection
+
+    def get(self, key):
+        """
+        Returns (value, expires_at) for key, or None if absent or expired.
+        """
+
+        return self.connection.execute(
+            'SELECT value, expires_at FROM entries '
+            'WHERE key = ? AND expires_at > ?',
+            (key, self.clock())).fetchone()
+
+    def put(self, key, value, expires_at):
+        self.connection.execute(
+            'INSERT OR REPLACE INTO entries (key, value, expires_at) '
+            'VALUES (?, ?, ?)', (key, value, expires_at))
+
+        if next(self._writes) % PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        connection = self.connection
+        connection.execute('DELETE FROM entries WHERE expires_at <= ?',
+                           (self.clock(),))
+
+        surplus = len(self) - self.maxsize
+
+        if surplus > 0:
+            connection.execute(
+                'DELETE FROM entries WHERE key IN (SELECT key FROM entries '
+                'ORDER BY expires_at LIMIT ?)', (surplus,))
+
+    def clear(self):
+        self.connection.execute('DELETE FROM entries')
+
+    def __len__(self):
+        return self.connection.execute(
+            'SELECT count(*) FROM entries').fetchone()[0]
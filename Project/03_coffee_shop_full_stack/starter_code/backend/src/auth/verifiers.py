@@ -0,0 +1,328 @@
+import base64
+import json
+import re
+import time
+
+try:
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import (ec, ed25519,
+                                                           padding, rsa)
+    from cryptography.hazmat.primitives.asymmetric.utils import \
+        encode_dss_signature
+except ImportError:
+    rsa = None
+
+DEFAULT_BACKEND = 'cryptography'
+
+'''
+Verifier errors
+    raised by every verifier, whatever library does the work underneath
+    verify_decode_jwt turns them into AuthError
+'''
+
+
+class InvalidTokenError(Exception):
+    pass
+
+
+class ExpiredTokenError(InvalidTokenError):
+    pass
+
+
+class InvalidClaimsError(InvalidTokenError):
+    pass
+
+
+'''
+Verifier
+    the interface verify_decode_jwt talks to
+        get_unverified_header(token): the token header, not verified
+        load_key(jwk): turns a JWK from the key set into a verification key
+            called once per key when the key set is loaded
+        decode(token, key, algorithms, audience, issuer, leeway): verifies
+            the signature and the claims (exp and nbf with leeway seconds of
+            clock skew), returns the payload
+'''
+
+
+class Verifier:
+    name = None
+
+    def get_unverified_header(self, token):
+        raise NotImplementedError
+
+    def load_key(self, key):
+        raise NotImplementedError
+
+    def decode(self, token, key, algorithms, audience=None, issuer=None,
+               leeway=0):
+        raise NotImplementedError
+
+
+'''
+JoseVerifier
+    verification through python-jose, kept as a fallback
+    RS256 and ES256 keys only, EdDSA keys are left out of the key set
+'''
+
+
+class JoseVerifier(Verifier):
+    name = 'jose'
+
+    def __init__(self):
+        # Imported here: python-jose takes longer to import than the rest
+        # of the auth package, and only this backend uses it.
+        from jose import jwk, jwt
+
+        self.jwk = jwk
+        self.jwt = jwt
+
+    def get_unverified_header(self, token):
+        jwt = self.jwt
+
+        try:
+            return jwt.get_unverified_header(token)
+        except jwt.JWTError as error:
+            raise InvalidTokenError(str(error))
+
+    def load_key(self, key):
+        return self.jwk.construct(key, key.get('alg', 'RS256'))
+
+    def decode(self, token, key, algorithms, audience=None, issuer=None,
+               leeway=0):
+        jwt = self.jwt
+
+        try:
+            return jwt.decode(token, key, algorithms=algorithms,
+                              audience=audience, issuer=issuer,
+                              options={'leeway': leeway})
+        except jwt.ExpiredSignatureError as error:
+            raise ExpiredTokenError(str(error))
+        except jwt.JWTClaimsError as error:
+            raise InvalidClaimsError(str(error))
+        except Exception as error:
+            raise InvalidTokenError(str(error))
+
+
+'''
+CryptographyVerifier
+    verification of RS256/RS384/RS512, ES256 and EdDSA (Ed25519) tokens
+    directly with the cryptography package, the claims are validated the
+    same way python-jose does
+    a key only verifies the algorithms of its own type, e.g. an RSA key
+    never verifies an ES256 token
+'''
+
+
+def base64url_decode(segment):
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+def decode_segment(segment):
+    try:
+        return json.loads(base64url_decode(segment))
+    except ValueError:
+        raise InvalidTokenError('Invalid token segment.')
+
+
+def split_token(token):
+    parts = token.split('.')
+
+    if len(parts) != 3:
+        raise InvalidTokenError('Not enough segments.')
+
+    return parts
+
+
+def is_numeric_date(value):
+    # RFC 7519 NumericDates may have a fraction, JSON true is no date.
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_claims(claims, audience=None, issuer=None, leeway=0):
+    now = time.time()
+
+    for claim in ('iat', 'nbf', 'exp'):
+        if claim in claims and not is_numeric_date(claims[claim]):
+            raise InvalidClaimsError(f'{claim} claim must be a number.')
+
+    if 'nbf' in claims and claims['nbf'] > now + leeway:
+        raise InvalidClaimsError('The token is not yet valid (nbf).')
+
+    if 'exp' in claims and claims['exp'] < now - leeway:
+        raise ExpiredTokenError('Signature has expired.')
+
+    if audience is not None and 'aud' in claims:
+        audience_claim = claims['aud']
+
+        if isinstance(audience_claim, str):
+            audience_claim = [audience_claim]
+
+        if audience not in audience_claim:
+            raise InvalidClaimsError('Invalid audience.')
+
+    if issuer is not None and claims.get('iss') != issuer:
+        raise InvalidClaimsError('Invalid issuer.')
+
+
+'''
+inspect_token(token)
+    the checks that need no key, run before any key lookup or signature check
+        at most MAX_TOKEN_LENGTH characters in three base64url segments
+        a JSON header and a JSON payload
+        an exp claim, if any, that has not passed yet
+    nothing is verified: it only rejects what could never pass decode
+    returns the unverified header and claims
+'''
+
+MAX_TOKEN_LENGTH = 8192
+
+SEGMENT_RE = re.compile(r'[A-Za-z0-9_-]+')
+
+
+def inspect_token(token, leeway=0):
+    if len(token) > MAX_TOKEN_LENGTH:
+        raise InvalidTokenError('Token too long.')
+
+    segments = split_token(token)
+
+    if not all(SEGMENT_RE.fullmatch(segment) for segment in segments):
+        raise InvalidTokenError('Invalid token segment.')
+
+    header = decode_segment(segments[0])
+
+    if not isinstance(header, dict):
+        raise InvalidTokenError('Invalid header.')
+
+    claims = decode_segment(segments[1])
+
+    if not isinstance(claims, dict):
+        raise InvalidTokenError('Invalid payload.')
+
+    exp = claims.get('exp')
+
+    if is_numeric_date(exp) and exp < time.time() - leeway:
+        raise ExpiredTokenError('Signature has expired.')
+
+    return header, claims
+
+
+class CryptographyVerifier(Verifier):
+    name = 'cryptography'
+
+    # alg: (key type, hash)
+    ALGORITHMS = {
+        'RS256': ('RSA', 'SHA256'), 'RS384': ('RSA', 'SHA384'),
+        'RS512': ('RSA', 'SHA512'), 'ES256': ('EC', 'SHA256'),
+        'EdDSA': ('OKP', None)
+    }
+
+    def get_unverified_header(self, token):
+        header = decode_segment(split_token(token)[0])
+
+        if not isinstance(header, dict):
+            raise InvalidTokenError('Invalid header.')
+
+        return header
+
+    def load_key(self, key):
+        if key['kty'] == 'RSA':
+            n = int.from_bytes(base64url_decode(key['n']), 'big')
+            e = int.from_bytes(base64url_decode(key['e']), 'big')
+
+            return rsa.RSAPublicNumbers(e, n).public_key()
+
+        if key['kty'] == 'EC' and key.get('crv') == 'P-256':
+            x = int.from_bytes(base64url_decode(key['x']), 'big')
+            y = int.from_bytes(base64url_decode(key['y']), 'big')
+
+            return ec.EllipticCurvePublicNumbers(
+                x, y, ec.SECP256R1()).public_key()
+
+        if key['kty'] == 'OKP' and key.get('crv') == 'Ed25519':
+            return ed25519.Ed25519PublicKey.from_public_bytes(
+                base64url_decode(key['x']))
+
+        raise ValueError(f'Unsupported key type {key["kty"]}.')
+
+    @staticmethod
+    def key_type(key):
+        if isinstance(key, rsa.RSAPublicKey):
+            return 'RSA'
+
+        if isinstance(key, ec.EllipticCurvePublicKey):
+            return 'EC'
+
+        if isinstance(key, ed25519.Ed25519PublicKey):
+            return 'OKP'
+
+        return None
+
+    def decode(self, token, key, algorithms, audience=None, issuer=None,
+               leeway=0):
+        header_segment, payload_segment, signature_segment = split_token(token)
+        header = decode_segment(header_segment)
+        alg = header.get('alg') if isinstance(header, dict) else None
+
+        if alg not in algorithms or alg not in self.ALGORITHMS:
+            raise InvalidTokenError('The specified alg value is not allowed.')
+
+        key_type, digest = self.ALGORITHMS[alg]
+
+        if self.key_type(key) != key_type:
+            raise InvalidTokenError('The key does not match the alg.')
+
+        signing_input = f'{header_segment}.{payload_segment}'.encode('ascii')
+
+        try:
+            signature = base64url_decode(signature_segment)
+
+            if key_type == 'RSA':
+                key.verify(signature, signing_input, padding.PKCS1v15(),
+                           getattr(hashes, digest)())
+            elif key_type == 'EC':
+                # JWS signatures are r and s side by side, not DER.
+                if len(signature) != 64:
+                    raise ValueError('Invalid ES256 signature length.')
+
+                r = int.from_bytes(signature[:32], 'big')
+                s = int.from_bytes(signature[32:], 'big')
+                key.verify(encode_dss_signature(r, s), signing_input,
+                           ec.ECDSA(getattr(hashes, digest)()))
+            else:
+                key.verify(signature, signing_input)
+        except (InvalidSignature, ValueError):
+            raise InvalidTokenError('Signature verification failed.')
+
+        claims = decode_segment(payload_segment)
+
+        if not isinstance(claims, dict):
+            raise InvalidTokenError('Invalid payload.')
+
+        validate_claims(claims, audience=audience, issuer=issuer,
+                        leeway=leeway)
+
+        return claims
+
+
+'''
+get_verifier(name)
+    returns the verifier for the backend called name
+    falls back to python-jose when the cryptography package is not installed
+'''
+
+VERIFIERS = {
+    JoseVerifier.name: JoseVerifier,
+    CryptographyVerifier.name: CryptographyVerifier
+}
+
+
+def get_verifier(name=DEFAULT_BACKEND):
+    if name not in VERIFIERS:
+        raise ValueError(f'Unknown JWT backend {name!r}.')
+
+    if name == CryptographyVerifier.name and rsa is None:
+        name = JoseVerifier.name
+
+    return VERIFIERS[name]()
@@ -0,0 +1,43 @@
+import threading
+
+'''
+ResponseCache
+    serialized responses, shared by every worker thread of the process
+    each entry is only valid for the generation it was built in
+    invalidate() starts a new generation, dropping every cached entry
+        an entry built from data read before invalidate() is never stored
+'''
+
+
+class ResponseCache:
+    def __init__(self):
+        self._generation = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def get(self, name):
+        """
+        Returns the value cached for name, or None.
+        """
+
+        entry = self._entries.get(name)
+
+        if entry is None or entry[0] != self._generation:
+            return None
+
+        return entry[1]
+
+    def put(self, name, generation, value):
+        # generation is the one read before the data was loaded.
+        with self._lock:
+            if generation == self._generation:
+                self._entries[name] = (generation, value)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
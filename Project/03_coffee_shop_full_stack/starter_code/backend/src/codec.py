@@ -0,0 +1,124 @@
+import json
+import re
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+'''
+JSON codec
+    orjson when it is installed, the standard library json module otherwise
+    loads(data) parses str or bytes, anything orjson refuses (e.g. NaN or
+        integers over 64 bits) is parsed again by json.loads, so the result
+        and the errors are the ones of json.loads
+    dumps(obj) writes compact JSON (no spaces, keys in insertion order, UTF-8
+        text left as is), e.g. the recipe column of the drinks
+'''
+
+
+def loads(data):
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except ValueError:
+            pass
+
+    return json.loads(data)
+
+
+def dumps(obj):
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj).decode('utf-8')
+        except TypeError:
+            pass
+
+    return json.dumps(obj, separators=(',', ':'), ensure_ascii=False)
+
+
+'''
+JSONProvider
+    app.json: Flask's DefaultJSONProvider with orjson doing the compact
+    output (responses outside of debug mode, dumps(separators=(',', ':')))
+    and the parsing of request bodies
+    the bytes are the same as DefaultJSONProvider writes for valid data
+        keys sorted when sort_keys is set, same escapes, same numbers
+        dates, decimals, UUIDs and dataclasses still go through default()
+        output orjson would write differently is written by json.dumps:
+            non-ASCII text while ensure_ascii is set
+            floats written with an exponent by either library (1e-05 is
+            0.00001 for orjson)
+            integers over 64 bits and other types orjson refuses
+    NaN and infinities are not valid JSON: orjson writes them as null
+    any other argument to dumps() or loads() (e.g. indent) goes to json too
+'''
+
+# A digit followed by e: a float with an exponent (orjson never writes E).
+# Starting the pattern with the literal e keeps the search fast on large
+# bodies. Small floats are caught by a search for 0.0000 instead.
+EXPONENT_RE = re.compile(rb'e(?<=[0-9]e)')
+COMPACT = {'separators': (',', ':')}
+
+
+class JSONProvider(DefaultJSONProvider):
+    def fast_dumps(self, obj):
+        """
+        Returns obj as compact JSON bytes written by orjson, or None where
+        they would differ from the output of DefaultJSONProvider.
+        """
+
+        if orjson is None:
+            return None
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | \
+            orjson.OPT_PASSTHROUGH_DATACLASS
+
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        try:
+            data = orjson.dumps(obj, default=self.default, option=option)
+        except TypeError:
+            return None
+
+        if EXPONENT_RE.search(data) or b'0.0000' in data:
+            return None
+
+        # json.dumps escapes DEL as well as non-ASCII characters.
+        if self.ensure_ascii and (not data.isascii() or b'\x7f' in data):
+            return None
+
+        return data
+
+    def dumps(self, obj, **kwargs):
+        if kwargs == COMPACT:
+            data = self.fast_dumps(obj)
+
+            if data is not None:
+                return data.decode('utf-8')
+
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        pretty = (self.compact is None and self._app.debug) or \
+            self.compact is False
+
+        if pretty:
+            return super().response(*args, **kwargs)
+
+        obj = self._prepare_response_obj(args, kwargs)
+        data = self.fast_dumps(obj)
+
+        if data is None:
+            data = super().dumps(obj, **COMPACT).encode('utf-8')
+
+        return self._app.response_class(data + b'\n', mimetype=self.mimetype)
@@ -1,26 +1,497 @@
 import os
-from sqlalchemy import Column, String, Integer
+import re
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import (Column, String, Integer, DateTime, Text, bindparam,
+                        case, delete, event, insert, inspect, select, text,
+                        update)
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm import Session, scoped_session, sessionmaker, validates
+from sqlalchemy.pool import QueuePool, StaticPool
+from flask import current_app, g, has_app_context
+from flask.globals import app_ctx
 from flask_sqlalchemy import SQLAlchemy
+from werkzeug.local import LocalProxy
 import json
 
+from .. import codec
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(
-    os.path.join(project_dir, database_filename))
+
+
+def default_database_path():
+    return os.environ.get('DATABASE_URL') or "sqlite:///{}".format(
+        os.path.join(project_dir, database_filename))
+
 
 db = SQLAlchemy()
 
+# Pragmas run on every new SQLite connection, each one can be overridden by
+# an SQLITE_<NAME> env var (e.g. SQLITE_JOURNAL_MODE=DELETE) or by the
+# SQLITE_PRAGMAS app config.
+#   journal_mode=WAL     readers no longer wait for a writer to commit
+#   synchronous=NORMAL   no fsync per commit in WAL mode, still crash safe
+#   busy_timeout         ms a writer waits for the lock before failing
+#   mmap_size            bytes of the file read through memory mapping
+#   cache_size           page cache per connection, negative means KiB
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': '5000',
+    'mmap_size': str(256 * 1024 * 1024),
+    'cache_size': '-65536'
+}
+
+# Bind key of the engine the read-only routes use, when one is configured.
+REPLICA_BIND = 'replica'
+# Seconds a subject that just wrote keeps reading from the primary, so it
+# sees its own writes whatever the replica lag, by default (see setup_db).
+READ_YOUR_WRITES_SECONDS = 5
+
+# Connection pool settings, overridden by DB_POOL_SIZE, DB_MAX_OVERFLOW,
+# DB_POOL_TIMEOUT and DB_POOL_RECYCLE. Size the pool per worker process: a
+# server running N workers opens up to N * (pool_size + max_overflow)
+# connections.
+POOL_OPTIONS = {
+    'pool_size': 5,
+    'max_overflow': 10,
+    'pool_timeout': 30,
+    'pool_recycle': 1800
+}
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    the database is the SQLALCHEMY_DATABASE_URI app config if set, else the
+    DATABASE_URL env var, else ./database.db
+        e.g. sqlite:// for an in-memory database, shared by every thread
+        nothing is connected here: the schema is brought up to date by
+        prepare_db, on the first request
+        SQLite connections get the SQLITE_PRAGMAS profile and a pool of
+        persistent connections
+        other databases (e.g. postgresql://) get a pool sized by POOL_OPTIONS
+    the read-only routes use a replica when SQLALCHEMY_REPLICA_URI or the
+    DATABASE_REPLICA_URL env var is set (see read_session_for)
+        'readonly' opens the primary SQLite file again in mode=ro
+        a subject that wrote reads from the primary for
+        READ_YOUR_WRITES_SECONDS (app config, or the DATABASE_READ_YOUR_WRITES
+        env var), tracked by the WritePins of the app
 '''
 
 
 def setup_db(app):
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+    app.config.setdefault("SQLALCHEMY_DATABASE_URI", default_database_path())
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    options = app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", {})
+
+    for name, value in engine_options(url).items():
+        options.setdefault(name, value)
+
+    replica = app.config.setdefault(
+        "SQLALCHEMY_REPLICA_URI", os.environ.get('DATABASE_REPLICA_URL'))
+
+    if replica == 'readonly':
+        replica = read_only_url(url)
+
+    if replica:
+        replica = make_url(replica)
+        app.config.setdefault("SQLALCHEMY_BINDS", {}).setdefault(
+            REPLICA_BIND, dict(engine_options(replica), url=replica))
+
+    seconds = app.config.setdefault("READ_YOUR_WRITES_SECONDS", float(
+        os.environ.get('DATABASE_READ_YOUR_WRITES', READ_YOUR_WRITES_SECONDS)))
+    app.extensions['write_pins'] = WritePins(float(seconds))
+
     db.app = app
     db.init_app(app)
+    app.teardown_appcontext(remove_read_session)
+    app.before_request(prepare_db)
+    setup_unit_of_work(app)
+
+    with app.app_context():
+        if url.get_backend_name() == 'sqlite':
+            pragmas = sqlite_pragmas(app.config.get('SQLITE_PRAGMAS'))
+            listen_pragmas(db.engine, pragmas)
+            event.listen(db.engine, 'savepoint', begin_before_savepoint)
+
+        if replica and replica.get_backend_name() == 'sqlite':
+            # The replica is never written to, journal_mode included.
+            pragmas = sqlite_pragmas(app.config.get('SQLITE_PRAGMAS'))
+            del pragmas['journal_mode']
+            listen_pragmas(db.engines[REPLICA_BIND],
+                           dict(pragmas, query_only='ON'))
+
+
+'''
+prepare_db()
+    brings the database of the current app to the current schema and creates
+    the tables it is missing (table_versions, drink_search), once per app
+    runs before the first request, and before the command line import and
+    export (or at boot, see PREWARM in create_app)
+    prepare_db and db_drop_and_create_all drop the cached responses of the
+    app, built from the database before
+'''
+
+schema_lock = threading.Lock()
+
+
+def prepare_db():
+    extensions = current_app.extensions
+
+    if extensions.get('database_ready'):
+        return
+
+    with schema_lock:
+        if extensions.get('database_ready'):
+            return
+
+        upgrade_db()
+        # The primary only: the replica is never written to, and the bind
+        # keys of every app ever set up are known to db.
+        db.create_all(bind_key=None)
+
+        with db.engine.begin() as connection:
+            create_search_index(connection)
+
+        extensions['database_ready'] = True
+        drop_cached_responses()
+
+
+def drop_cached_responses():
+    # Built from the database as it was before (see create_app in api.py).
+    cache = current_app.extensions.get('drinks_cache')
+
+    if cache is not None:
+        cache.invalidate()
+
+
+def engine_options(url):
+    pool = {name: int(os.environ.get('DB_' + name.upper(), value))
+            for name, value in POOL_OPTIONS.items()}
+
+    if url.get_backend_name() != 'sqlite':
+        # Drops connections the server closed while they sat in the pool.
+        return dict(pool, pool_pre_ping=True)
+
+    options = {
+        # Async views run on an event loop thread while the session is
+        # closed on the request thread, so a connection may be used by more
+        # than one thread.
+        "connect_args": {"check_same_thread": False}
+    }
+
+    if url.database and url.database != ':memory:':
+        # SQLAlchemy 1.4 opens a new SQLite connection per checkout by
+        # default, running the pragmas again every time.
+        options.update(poolclass=QueuePool, pool_size=pool['pool_size'],
+                       max_overflow=pool['max_overflow'],
+                       pool_timeout=pool['pool_timeout'])
+    else:
+        # An in-memory database only lives in its connection.
+        options.update(poolclass=StaticPool)
+
+    return options
+
+
+def sqlite_pragmas(overrides=None):
+    pragmas = {name: os.environ.get('SQLITE_' + name.upper(), value)
+               for name, value in SQLITE_PRAGMAS.items()}
+    pragmas.update(overrides or {})
+
+    for name, value in pragmas.items():
+        # The values end up in the PRAGMA statements as they are.
+        if not re.fullmatch(r'-?\w+', str(value)):
+            raise ValueError(f'Invalid value {value!r} for pragma {name}.')
+
+    return pragmas
+
+
+def listen_pragmas(engine, pragmas):
+    event.listen(engine, 'connect',
+                 lambda connection, record: apply_pragmas(connection, pragmas))
+
+
+def begin_before_savepoint(connection, name):
+    # The sqlite3 module only opens a transaction before an INSERT, UPDATE
+    # or DELETE: a SAVEPOINT before them would be the transaction itself,
+    # and releasing it would commit. IMMEDIATE, as the savepoints are there
+    # to write.
+    dbapi_connection = connection.connection.dbapi_connection
+
+    if not dbapi_connection.in_transaction:
+        dbapi_connection.execute('BEGIN IMMEDIATE')
+
+
+def apply_pragmas(connection, pragmas):
+    cursor = connection.cursor()
+
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+
+    cursor.close()
+
+
+def read_only_url(url):
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '',
+                                                              ':memory:'):
+        raise ValueError('A read-only replica needs a SQLite database file.')
+
+    return url.set(database='file:' + url.database,
+                   query={'mode': 'ro', 'uri': 'true'})
+
+
+'''
+read_session_for(subject)
+    the session the read-only routes of subject use
+        the replica session when a replica is configured
+        db.session (the primary) when there is none, or when subject wrote
+        in the last READ_YOUR_WRITES_SECONDS of the app (see write_pins)
+    both are scoped to the app context and removed at its teardown
+'''
+
+
+class ReplicaSession(Session):
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        return db.engines[REPLICA_BIND]
+
+
+read_session = scoped_session(
+    sessionmaker(class_=ReplicaSession),
+    scopefunc=lambda: id(app_ctx._get_current_object()))
+
+
+def remove_read_session(exception=None):
+    read_session.remove()
+
+
+'''
+WritePins
+    subjects that wrote recently, with the time until which they are pinned
+    to the primary
+    kept in process: with several workers, a write pins its subject on the
+    worker that served it
+    each app has its own, write_pins is the one of the current app
+'''
+
+
+class WritePins:
+    def __init__(self, seconds=READ_YOUR_WRITES_SECONDS,
+                 clock=time.monotonic):
+        self.seconds = seconds
+        self.clock = clock
+
+        self._until = {}
+        self._lock = threading.Lock()
+
+    def pin(self, subject):
+        if subject is None or self.seconds <= 0:
+            return
+
+        now = self.clock()
+
+        with self._lock:
+            self._until[subject] = now + self.seconds
+
+            if len(self._until) > 1024:
+                self._until = {key: until for key, until in
+                               self._until.items() if until > now}
+
+    def pinned(self, subject):
+        until = self._until.get(subject)
+
+        return until is not None and self.clock() < until
+
+
+write_pins = LocalProxy(lambda: current_app.extensions['write_pins'])
+
+
+def read_session_for(subject=None):
+    if REPLICA_BIND not in db.engines or write_pins.pinned(subject):
+        return db.session
+
+    return read_session
+
+
+'''
+Unit of work
+    every request runs in a single transaction, committed once after the view
+    returned a successful response and rolled back otherwise
+        inside a request, Drink.insert/update/delete only flush their changes
+        (see commit_changes), so a constraint violation still surfaces in
+        the view
+        the bulk helpers write each chunk of rows in a savepoint
+        the session is removed when the app context ends, which gives its
+        connection back to the pool
+    after_commit(callback) runs callback once the changes are committed
+    the database time and query count of each request are sent back in a
+    Server-Timing header (see request_db_stats)
+'''
+
+
+def setup_unit_of_work(app):
+    app.before_request(begin_unit_of_work)
+    app.after_request(end_unit_of_work)
+
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, 'before_cursor_execute', query_started)
+            event.listen(engine, 'after_cursor_execute', query_finished)
+
+
+def begin_unit_of_work():
+    g.unit_of_work = True
+    g.after_commit = []
+    g.db_queries = 0
+    g.db_time = 0.0
+
+
+def end_unit_of_work(response):
+    if not g.get('unit_of_work'):
+        return response
+
+    g.unit_of_work = False
+
+    if response.status_code < 400:
+        db.session.commit()
+
+        for callback in g.after_commit:
+            callback()
+    else:
+        db.session.rollback()
+
+    queries, seconds = request_db_stats()
+    response.headers.add('Server-Timing', 'db;dur={:.2f};desc="{} {}"'.format(
+        seconds * 1e3, queries, 'query' if queries == 1 else 'queries'))
+
+    return response
+
+
+def in_unit_of_work():
+    return has_app_context() and g.get('unit_of_work', False)
+
+
+'''
+commit_changes()
+    commits the session, or only flushes it inside a request: the unit of
+    work commits at the end of the request
+'''
+
+
+def commit_changes():
+    if in_unit_of_work():
+        db.session.flush()
+    else:
+        db.session.commit()
+
+
+'''
+after_commit(callback)
+    calls callback once the changes of the current request are committed
+    (never if they are rolled back), right away outside of a request
+'''
+
+
+def after_commit(callback):
+    if in_unit_of_work():
+        g.after_commit.append(callback)
+    else:
+        callback()
+
+
+'''
+request_db_stats()
+    (queries, seconds) spent in the database by the current request so far
+'''
+
+
+def request_db_stats():
+    return g.get('db_queries', 0), g.get('db_time', 0.0)
+
+
+def query_started(connection, cursor, statement, parameters, context,
+                  executemany):
+    # Kept with the statement: a failed one never reaches query_finished,
+    # and leaves nothing behind on the connection.
+    if context is not None:
+        context.query_started = time.perf_counter()
+
+
+def query_finished(connection, cursor, statement, parameters, context,
+                   executemany):
+    started = getattr(context, 'query_started', None)
+
+    if started is not None and has_app_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_time += time.perf_counter() - started
+
+
+'''
+current_pragmas()
+    the pragma values of a connection of the current app, to check which
+    profile is actually applied
+'''
+
+
+def current_pragmas():
+    with db.engine.connect() as connection:
+        return {name: connection.execute(text(f'PRAGMA {name}')).scalar()
+                for name in SQLITE_PRAGMAS}
+
+
+'''
+upgrade_db()
+    migrates an existing database to the current schema, safe to run repeatedly
+        drink.recipe used to be VARCHAR(180): the table is rebuilt with a TEXT
+        recipe column and every row is copied over
+        table_versions used to have no epoch column: it is added, with a new
+        epoch for the existing rows
+'''
+
+
+def upgrade_db():
+    inspector = inspect(db.engine)
+    upgrade_table_versions(inspector)
+
+    if not inspector.has_table(Drink.__tablename__):
+        return
+
+    recipe = next(column for column in inspector.get_columns(
+        Drink.__tablename__) if column['name'] == 'recipe')
+
+    if getattr(recipe['type'], 'length', None) is None:
+        return
+
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite':
+            # SQLite cannot change the type of a column in place.
+            connection.execute(text('ALTER TABLE drink RENAME TO drink_old'))
+            Drink.__table__.create(connection)
+            connection.execute(text(
+                'INSERT INTO drink (id, title, recipe) '
+                'SELECT id, title, recipe FROM drink_old'))
+            connection.execute(text('DROP TABLE drink_old'))
+        else:
+            connection.execute(text(
+                'ALTER TABLE drink ALTER COLUMN recipe TYPE TEXT'))
+
+
+def upgrade_table_versions(inspector):
+    table = TableVersion.__tablename__
+
+    if not inspector.has_table(table) or 'epoch' in {
+            column['name'] for column in inspector.get_columns(table)}:
+        return
+
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            f'ALTER TABLE {table} ADD COLUMN epoch VARCHAR(16)'))
+        connection.execute(text(f'UPDATE {table} SET epoch = :epoch'),
+                           {'epoch': new_epoch()})
 
 
 '''
@@ -32,8 +503,9 @@ db_drop_and_create_all()
 
 
 def db_drop_and_create_all():
-    db.drop_all()
-    db.create_all()
+    db.drop_all(bind_key=None)
+    db.create_all(bind_key=None)
+    drop_cached_responses()
     # add one demo row which is helping in POSTMAN test
     drink = Drink(title='water',
         recipe='[{"name": "water", "color": "blue", "parts": 1}]')
@@ -47,6 +519,102 @@ def db_drop_and_create_all():
 
 # ROUTES
 
+# Rows written per transaction by the bulk operations.
+BULK_CHUNK_SIZE = 500
+
+# Fields of the short() / long() representations, in output order.
+DRINK_FIELDS = ('id', 'title', 'recipe')
+
+'''
+format_drink(drink, representation, fields)
+    the 'short' or 'long' representation of a drink, limited to fields
+    drink can be a Drink or any row with the same column names
+        (e.g. the result of db.session.query(Drink.id, Drink.recipe))
+'''
+
+
+def format_drink(drink, representation, fields=DRINK_FIELDS):
+    formatted = {}
+
+    for field in fields:
+        if field == 'recipe':
+            # Drink instances keep their recipe parsed, rows are parsed here.
+            value = getattr(drink, 'parsed_recipe', None)
+
+            if value is None:
+                value = codec.loads(drink.recipe)
+
+            if representation == 'short':
+                value = [{'color': r['color'], 'parts': r['parts']}
+                         for r in value]
+        else:
+            value = getattr(drink, field)
+
+        formatted[field] = value
+
+    return formatted
+
+
+'''
+TableVersion
+    a version counter per table, bumped in the same transaction as every write
+    lets readers tell whether a table changed (ETag, Last-Modified, caches)
+        without reading its rows
+    the counter starts over with the table_versions table (a new database
+        file, db_drop_and_create_all): the random epoch written with the row
+        tells a version of this database from the same number in a former one
+'''
+
+
+def new_epoch():
+    return os.urandom(8).hex()
+
+
+class TableVersion(db.Model):
+    __tablename__ = 'table_versions'
+
+    name = Column(String(80), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    epoch = Column(String(16))
+    # UTC, second precision (what Last-Modified can express)
+    updated_at = Column(DateTime, nullable=False)
+
+    '''
+    get(name, session)
+        returns (version, updated_at, epoch) of the table, (0, None, None) if
+        never written
+        read through session (db.session by default), which must be the one
+        the table rows are read from
+    '''
+
+    @classmethod
+    def get(cls, name, session=None):
+        session = session or db.session
+        row = session.query(cls.version, cls.updated_at, cls.epoch).filter(
+            cls.name == name).first()
+
+        return (row.version, row.updated_at, row.epoch) if row else \
+            (0, None, None)
+
+    '''
+    bump(name)
+        increments the table version, inside the current transaction
+    '''
+
+    @classmethod
+    def bump(cls, name):
+        now = datetime.utcnow().replace(microsecond=0)
+
+        result = db.session.execute(
+            update(cls).where(cls.name == name).values(
+                version=cls.version + 1, updated_at=now))
+
+        if result.rowcount == 0:
+            db.session.execute(
+                insert(cls).values(name=name, version=1, updated_at=now,
+                                   epoch=new_epoch()))
+
+
 '''
 Drink
 a persistent drink entity, extends the base SQLAlchemy Model
@@ -60,7 +628,41 @@ class Drink(db.Model):
     title = Column(String(80), unique=True)
     # the ingredients blob - this stores a lazy json blob
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe = Column(String(180), nullable=False)
+    recipe = Column(Text, nullable=False)
+
+    '''
+    recipe assignment
+        the recipe can be assigned as the JSON string or as the list itself
+        either way the parsed list is kept with the instance
+    '''
+
+    @validates('recipe')
+    def validate_recipe(self, key, recipe):
+        if isinstance(recipe, str):
+            self._parsed_recipe = (recipe, codec.loads(recipe))
+            return recipe
+
+        raw = codec.dumps(recipe)
+        self._parsed_recipe = (raw, recipe)
+
+        return raw
+
+    '''
+    parsed_recipe
+        the recipe as a list, parsed at most once per value of the recipe column
+        (a reload from the database gives a new value and is parsed again)
+    '''
+
+    @property
+    def parsed_recipe(self):
+        raw = self.recipe
+        cached = self.__dict__.get('_parsed_recipe')
+
+        if cached is None or cached[0] is not raw:
+            cached = (raw, codec.loads(raw))
+            self._parsed_recipe = cached
+
+        return cached[1]
 
     '''
     short()
@@ -68,12 +670,7 @@ class Drink(db.Model):
     '''
 
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in
-                        json.loads(self.recipe)]
-        return {
-            'id': self.id, 'title': self.title, 'recipe': short_recipe
-        }
+        return format_drink(self, 'short')
 
     '''
     long()
@@ -81,10 +678,7 @@ class Drink(db.Model):
     '''
 
     def long(self):
-        return {
-            'id': self.id, 'title': self.title,
-            'recipe': json.loads(self.recipe)
-        }
+        return format_drink(self, 'long')
 
     '''
     insert()
@@ -98,7 +692,8 @@ class Drink(db.Model):
 
     def insert(self):
         db.session.add(self)
-        db.session.commit()
+        TableVersion.bump(self.__tablename__)
+        commit_changes()
 
     '''
     delete()
@@ -111,7 +706,8 @@ class Drink(db.Model):
 
     def delete(self):
         db.session.delete(self)
-        db.session.commit()
+        TableVersion.bump(self.__tablename__)
+        commit_changes()
 
     '''
     update()
@@ -124,7 +720,392 @@ class Drink(db.Model):
     '''
 
     def update(self):
-        db.session.commit()
+        TableVersion.bump(self.__tablename__)
+        commit_changes()
 
     def __repr__(self):
-        return json.dumps(self.short())
+        return codec.dumps(self.short())
+
+
+'''
+validate_drink(item)
+    checks one drink of a bulk request: {"title": string, "recipe": [...]}
+        each recipe part needs a string name and color and numeric parts
+    returns the row to write ({"title", "recipe"} with recipe as JSON)
+    raises ValueError with a message otherwise
+'''
+
+
+def validate_drink(item):
+    if not isinstance(item, dict):
+        raise ValueError('drink must be an object')
+
+    title = item.get('title')
+
+    if not isinstance(title, str) or not 0 < len(title) <= 80:
+        raise ValueError('title must be a string of 1 to 80 characters')
+
+    recipe = item.get('recipe')
+
+    if isinstance(recipe, str):
+        try:
+            recipe = codec.loads(recipe)
+        except ValueError:
+            raise ValueError('recipe is not valid JSON')
+
+    if not isinstance(recipe, list) or not recipe:
+        raise ValueError('recipe must be a non-empty list')
+
+    for part in recipe:
+        if not (isinstance(part, dict) and
+                isinstance(part.get('name'), str) and
+                isinstance(part.get('color'), str) and
+                isinstance(part.get('parts'), (int, float))):
+            raise ValueError('each recipe part needs a name, color and parts')
+
+    return {'title': title, 'recipe': codec.dumps(recipe)}
+
+
+'''
+bulk_save_drinks(items, upsert, chunk_size)
+    validates and writes many drinks, chunk_size rows per savepoint, each one
+        committed with commit_changes (by the unit of work in a request)
+        new titles are inserted with a single executemany INSERT per chunk
+        existing titles are updated when upsert is True, reported otherwise
+    items can be any iterable (e.g. a generator over a file)
+    returns {"inserted": n, "updated": n, "errors": [{"index": i, "message": m}]}
+'''
+
+
+def bulk_save_drinks(items, upsert=False, chunk_size=BULK_CHUNK_SIZE):
+    result = {'inserted': 0, 'updated': 0, 'errors': []}
+    chunk = []
+
+    for index, item in enumerate(items):
+        try:
+            chunk.append((index, validate_drink(item)))
+        except ValueError as error:
+            result['errors'].append({'index': index, 'message': str(error)})
+
+        if len(chunk) >= chunk_size:
+            save_drinks_chunk(chunk, upsert, result)
+            chunk = []
+
+    if chunk:
+        save_drinks_chunk(chunk, upsert, result)
+
+    result['errors'].sort(key=lambda error: error['index'])
+
+    return result
+
+
+def save_drinks_chunk(chunk, upsert, result):
+    titles = [row['title'] for _, row in chunk]
+    existing = dict(db.session.query(Drink.title, Drink.id).filter(
+        Drink.title.in_(titles)))
+
+    inserts, updates, seen = [], [], set()
+
+    for index, row in chunk:
+        if row['title'] in seen:
+            result['errors'].append({
+                'index': index, 'message': 'duplicate title in request'})
+        elif row['title'] in existing and not upsert:
+            result['errors'].append({
+                'index': index, 'message': 'title already exists'})
+        elif row['title'] in existing:
+            updates.append({'drink_id': existing[row['title']],
+                            'recipe': row['recipe']})
+        else:
+            inserts.append(row)
+
+        seen.add(row['title'])
+
+    try:
+        with db.session.begin_nested():
+            if inserts:
+                db.session.execute(insert(Drink.__table__), inserts)
+
+            if updates:
+                db.session.execute(
+                    update(Drink.__table__)
+                    .where(Drink.__table__.c.id == bindparam('drink_id'))
+                    .values(recipe=bindparam('recipe')), updates)
+
+            TableVersion.bump(Drink.__tablename__)
+    except IntegrityError:
+        # A concurrent writer took one of the titles: fall back to one
+        # savepoint per row to find out which.
+        save_drinks_one_by_one(chunk, upsert, result)
+        return
+
+    commit_changes()
+    result['inserted'] += len(inserts)
+    result['updated'] += len(updates)
+
+
+def save_drinks_one_by_one(chunk, upsert, result):
+    for index, row in chunk:
+        try:
+            with db.session.begin_nested():
+                drink = db.session.query(Drink).filter(
+                    Drink.title == row['title']).first()
+
+                if drink is None:
+                    db.session.add(Drink(**row))
+                    db.session.flush()
+                    result['inserted'] += 1
+                elif upsert:
+                    drink.recipe = row['recipe']
+                    db.session.flush()
+                    result['updated'] += 1
+                else:
+                    raise IntegrityError(None, None, None)
+        except IntegrityError:
+            result['errors'].append({
+                'index': index, 'message': 'title already exists'})
+
+    TableVersion.bump(Drink.__tablename__)
+    commit_changes()
+
+
+'''
+bulk_delete_drinks(ids, chunk_size)
+    deletes many drinks by id, chunk_size ids at a time, each chunk committed
+        with commit_changes (by the unit of work in a request)
+    returns {"deleted": n, "errors": [{"id": id, "message": m}]}
+'''
+
+
+def bulk_delete_drinks(ids, chunk_size=BULK_CHUNK_SIZE):
+    result = {'deleted': 0, 'errors': []}
+    valid = []
+
+    for drink_id in ids:
+        if isinstance(drink_id, int) and not isinstance(drink_id, bool):
+            valid.append(drink_id)
+        else:
+            result['errors'].append({'id': drink_id,
+                                     'message': 'id must be an integer'})
+
+    for start in range(0, len(valid), chunk_size):
+        chunk = valid[start:start + chunk_size]
+        found = {row.id for row in db.session.query(Drink.id).filter(
+            Drink.id.in_(chunk))}
+
+        result['errors'].extend({'id': drink_id, 'message': 'not found'}
+                                for drink_id in chunk if drink_id not in found)
+
+        if found:
+            db.session.execute(delete(Drink.__table__).where(
+                Drink.__table__.c.id.in_(found)))
+            TableVersion.bump(Drink.__tablename__)
+            commit_changes()
+            result['deleted'] += len(found)
+
+    return result
+
+
+'''
+iter_drinks_ndjson(batch_size, session)
+    yields every drink in its long() representation, one JSON document per line
+    rows are read batch_size at a time, through session (db.session by default)
+'''
+
+
+def iter_drinks_ndjson(batch_size=BULK_CHUNK_SIZE, session=None):
+    query = (session or db.session).query(
+        Drink.id, Drink.title, Drink.recipe).order_by(Drink.id)
+
+    # json, not codec: the lines keep the format they always had.
+    for row in query.yield_per(batch_size):
+        yield json.dumps(format_drink(row, 'long')) + '\n'
+
+
+'''
+Drink search
+    drink_search is an FTS5 table with a trigram tokenizer over the title and
+    the ingredient names of every drink, so any substring of 3 characters or
+    more is matched from the index
+        SQLite triggers keep it in sync with the drink table, whatever writes
+        to it (Drink.insert/update/delete, the bulk helpers, raw SQL)
+        it is created and dropped with the drink table
+    databases without FTS5 trigram support (and queries shorter than 3
+    characters) fall back to a LIKE scan of the drink table
+'''
+
+SEARCH_TABLE = 'drink_search'
+# Weight of a title match against an ingredient match in the ranking.
+SEARCH_TITLE_WEIGHT = 10.0
+
+SEARCH_INGREDIENTS = '''(
+    SELECT group_concat(json_extract(value, '$.name'), ' ')
+    FROM json_each(CASE WHEN json_valid(new.recipe) THEN new.recipe
+                   ELSE '[]' END))'''
+
+SEARCH_TRIGGERS = {
+    'drink_search_insert': f'''
+        CREATE TRIGGER drink_search_insert AFTER INSERT ON drink BEGIN
+            INSERT INTO {SEARCH_TABLE} (rowid, title, ingredients)
+            VALUES (new.id, new.title, {SEARCH_INGREDIENTS});
+        END''',
+    'drink_search_update': f'''
+        CREATE TRIGGER drink_search_update AFTER UPDATE OF title, recipe
+        ON drink BEGIN
+            DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+            INSERT INTO {SEARCH_TABLE} (rowid, title, ingredients)
+            VALUES (new.id, new.title, {SEARCH_INGREDIENTS});
+        END''',
+    'drink_search_delete': f'''
+        CREATE TRIGGER drink_search_delete AFTER DELETE ON drink BEGIN
+            DELETE FROM {SEARCH_TABLE} WHERE rowid = old.id;
+        END'''
+}
+
+
+def search_index_supported(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+
+    try:
+        connection.exec_driver_sql(
+            "CREATE VIRTUAL TABLE temp.search_probe "
+            "USING fts5(x, tokenize='trigram')")
+        connection.exec_driver_sql('DROP TABLE temp.search_probe')
+    except OperationalError:
+        return False
+
+    return True
+
+
+'''
+create_search_index(connection, rebuild)
+    creates drink_search and its triggers if they are missing
+    the index is filled from the drink table when it is created, or always
+    when rebuild is True
+'''
+
+
+def create_search_index(connection, rebuild=False):
+    if not search_index_supported(connection):
+        return
+
+    created = not inspect(connection).has_table(SEARCH_TABLE)
+
+    if created:
+        connection.exec_driver_sql(
+            f"CREATE VIRTUAL TABLE {SEARCH_TABLE} "
+            f"USING fts5(title, ingredients, tokenize='trigram')")
+
+    for name, trigger in SEARCH_TRIGGERS.items():
+        # A rebuilt drink table can leave triggers of the same name behind
+        # on the old one.
+        connection.exec_driver_sql(f'DROP TRIGGER IF EXISTS {name}')
+        connection.exec_driver_sql(trigger)
+
+    if created or rebuild:
+        connection.exec_driver_sql(f'DELETE FROM {SEARCH_TABLE}')
+        connection.exec_driver_sql(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, title, ingredients) '
+            f'SELECT id, title, {SEARCH_INGREDIENTS} FROM drink AS new')
+
+
+@event.listens_for(Drink.__table__, 'after_create')
+def drink_table_created(table, connection, **kw):
+    create_search_index(connection, rebuild=True)
+
+
+@event.listens_for(Drink.__table__, 'before_drop')
+def drink_table_dropped(table, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.exec_driver_sql(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def search_index_available(session):
+    bind = session.get_bind()
+    # Kept with the app, which owns its engines: a dict of the module would
+    # keep the engines of every app ever created alive.
+    available = current_app.extensions.setdefault('search_index', {})
+
+    if bind not in available:
+        available[bind] = inspect(bind).has_table(SEARCH_TABLE)
+
+    return available[bind]
+
+
+'''
+search_drinks(query, limit, session)
+    returns up to limit drinks whose title or ingredient names contain query
+    (case insensitive), read through session (db.session by default)
+    best matches first: drinks whose title starts with query, then by FTS5
+    rank (title matches weigh more than ingredient matches)
+'''
+
+
+def search_drinks(query, limit, session=None):
+    session = session or db.session
+    table = Drink.__table__
+    columns = (table.c.id, table.c.title, table.c.recipe)
+    prefix = like_pattern(query, prefix=True)
+
+    if len(query) >= 3 and search_index_available(session):
+        # One quoted phrase: with the trigram tokenizer it matches query as a
+        # substring, like the LIKE fallback, and no FTS5 syntax gets in.
+        match = '"{}"'.format(query.replace('"', '""'))
+
+        return session.execute(
+            text(f'''
+                SELECT drink.id, drink.title, drink.recipe
+                FROM {SEARCH_TABLE} JOIN drink
+                    ON drink.id = {SEARCH_TABLE}.rowid
+                WHERE {SEARCH_TABLE} MATCH :match
+                ORDER BY drink.title LIKE :prefix ESCAPE '\\' DESC,
+                    bm25({SEARCH_TABLE}, {SEARCH_TITLE_WEIGHT}, 1.0),
+                    drink.id
+                LIMIT :limit'''),
+            {'match': match, 'prefix': prefix, 'limit': limit}).all()
+
+    pattern = like_pattern(query)
+    in_title = table.c.title.ilike(pattern, escape='\\')
+    rank = case((table.c.title.ilike(prefix, escape='\\'), 0),
+                (in_title, 1), else_=2)
+
+    rows = session.execute(
+        select(*columns)
+        .where(in_title | table.c.recipe.ilike(pattern, escape='\\'))
+        .order_by(rank, table.c.id)
+        .execution_options(yield_per=BULK_CHUNK_SIZE))
+
+    # The recipe matched as text, which includes the colors and the JSON
+    # itself: keep the drinks where an ingredient name matches.
+    needle = query.lower()
+    found = []
+
+    for row in rows:
+        if needle in row.title.lower() or any(
+                needle in part.get('name', '').lower()
+                for part in recipe_parts(row.recipe)):
+            found.append(row)
+
+            if len(found) == limit:
+                break
+
+    rows.close()
+
+    return found
+
+
+def like_pattern(query, prefix=False):
+    escaped = re.sub(r'([\\%_])', r'\\\1', query)
+
+    return escaped + '%' if prefix else '%' + escaped + '%'
+
+
+def recipe_parts(recipe):
+    try:
+        parts = codec.loads(recipe)
+    except (TypeError, ValueError):
+        return []
+
+    return [part for part in parts if isinstance(part, dict)] \
+        if isinstance(parts, list) else []
@@ -0,0 +1,188 @@
+import os
+import threading
+import time
+from collections import deque
+
+'''
+Drink events
+    in-process publish / subscribe behind GET /drinks/events (Server-Sent
+    Events)
+    an event is encoded once, when published, in every form ('short' and
+    'long'): subscribers only write the bytes of their form
+    each subscriber has a bounded queue, a subscriber falling queue_size
+        events behind has its stream closed, it reconnects with the id of
+        the last event it got (Last-Event-ID) and catches up from history
+    the last history_size events are kept for those reconnections, a client
+        further behind gets a 'reset' event: it should reload the drinks
+    ids are <boot>-<sequence>: an id from before a restart is never mistaken
+        for a recent one
+    a stream ends with an 'expired' event (no id) once the token it was
+        opened with expires: the client reconnects with a new token and the
+        Last-Event-ID of the last event it got
+    with several server processes, each one only sees its own writes
+'''
+
+# Returned by Subscription.next() once the stream has to end.
+CLOSED = object()
+
+
+class Subscription:
+    def __init__(self, form, maxsize):
+        self.form = form
+        self.maxsize = maxsize
+        self.overflowed = False
+        self.closed = False
+
+        self._frames = deque()
+        self._condition = threading.Condition()
+
+    def push(self, frame):
+        with self._condition:
+            if len(self._frames) >= self.maxsize:
+                self.overflowed = True
+            else:
+                self._frames.append(frame)
+
+            self._condition.notify()
+
+    def next(self, timeout=None):
+        """
+        Returns the next frame, None if there was none within timeout
+        seconds, or CLOSED.
+        """
+
+        with self._condition:
+            if not self._frames and not self.overflowed and not self.closed:
+                # Idle subscribers sleep here, costing no CPU.
+                self._condition.wait(timeout)
+
+            if self.overflowed or self.closed:
+                return CLOSED
+
+            return self._frames.popleft() if self._frames else None
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+
+class EventBroker:
+    FORMS = ('short', 'long')
+
+    def __init__(self, history_size=1000, queue_size=100,
+                 max_subscribers=1000):
+        self.history_size = history_size
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.boot = os.urandom(4).hex()
+
+        self._sequence = 0
+        # (sequence, {form: frame}) of the last history_size events.
+        self._history = deque(maxlen=history_size)
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def event_id(self, sequence):
+        return f'{self.boot}-{sequence}'
+
+    def frame(self, sequence, kind, data):
+        return (f'id: {self.event_id(sequence)}\nevent: {kind}\n'
+                f'data: {data}\n\n').encode('utf-8')
+
+    def publish(self, kind, data):
+        """
+        Sends an event to every subscriber. data maps each form to the JSON
+        text of the event in that form.
+        """
+
+        with self._lock:
+            self._sequence += 1
+            frames = {form: self.frame(self._sequence, kind, data[form])
+                      for form in self.FORMS}
+            self._history.append((self._sequence, frames))
+
+            # Under the lock, so every subscriber gets the events in order.
+            for subscription in self._subscriptions:
+                subscription.push(frames[subscription.form])
+
+    def subscribe(self, form, last_event_id=None):
+        """
+        Returns a new subscription and the frames it missed since
+        last_event_id, or None if there are too many subscribers.
+        """
+
+        with self._lock:
+            if len(self._subscriptions) >= self.max_subscribers:
+                return None, []
+
+            subscription = Subscription(form, self.queue_size)
+            self._subscriptions.add(subscription)
+
+            return subscription, self.missed(form, last_event_id)
+
+    def missed(self, form, last_event_id):
+        if last_event_id is None:
+            return []
+
+        boot, _, sequence = last_event_id.partition('-')
+        oldest = self._history[0][0] if self._history else self._sequence + 1
+
+        if boot == self.boot and sequence.isdigit() and \
+                oldest - 1 <= int(sequence) <= self._sequence:
+            return [frames[form] for seq, frames in self._history
+                    if seq > int(sequence)]
+
+        # Too far behind, or from before a restart.
+        return [self.frame(self._sequence, 'reset', '{}')]
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def close(self):
+        with self._lock:
+            subscriptions, self._subscriptions = self._subscriptions, set()
+
+        for subscription in subscriptions:
+            subscription.close()
+
+    def stream(self, subscription, missed, heartbeat=15, retry=3000,
+               expires_at=None, clock=time.time):
+        """
+        The body of an event stream: the missed frames, then every new one
+        as it comes. A comment line is sent after heartbeat idle seconds, so
+        dead connections are noticed and proxies keep the stream open. The
+        stream ends with an 'expired' event at expires_at (seconds since the
+        epoch), if any.
+        """
+
+        try:
+            yield f'retry: {retry}\n\n'.encode('ascii')
+
+            for frame in missed:
+                yield frame
+
+            while True:
+                timeout = heartbeat
+
+                if expires_at is not None:
+                    timeout = min(heartbeat, expires_at - clock())
+
+                    if timeout <= 0:
+                        yield b'event: expired\ndata: {}\n\n'
+                        return
+
+                frame = subscription.next(timeout)
+
+                if frame is CLOSED:
+                    return
+
+                yield b': keep-alive\n\n' if frame is None else frame
+        finally:
+            self.unsubscribe(subscription)
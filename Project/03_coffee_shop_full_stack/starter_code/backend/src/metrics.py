@@ -0,0 +1,239 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+'''
+Metrics
+    counters and histograms kept in process and rendered in the Prometheus
+    text exposition format (version 0.0.4) by GET /metrics
+    no client library needed: a metric is a dict of label values to numbers
+    behind a lock
+    with several worker processes, each one reports its own values
+'''
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds, from half a millisecond to 10 seconds.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                   0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n') \
+        .replace('"', r'\"')
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+
+    if not pairs:
+        return ''
+
+    return '{' + ','.join(f'{name}="{escape(value)}"'
+                          for name, value in pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} takes the labels {self.labelnames}.')
+
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}',
+                 f'# TYPE {self.name} {self.type}']
+
+        with self._lock:
+            values = sorted(self._values.items())
+
+        for key, value in values:
+            lines.extend(self.samples(key, value))
+
+        return lines
+
+    def samples(self, key, value):
+        raise NotImplementedError
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+'''
+Counter
+    a value that only goes up, e.g. cache_requests_total
+'''
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        return self._values.get(self.key(labels), 0)
+
+    def samples(self, key, value):
+        yield (f'{self.name}{format_labels(self.labelnames, key)} '
+               f'{format_value(value)}')
+
+
+'''
+Histogram
+    observations counted in buckets, plus their sum and count
+    timer(**labels) observes the duration of a with block
+'''
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name, description, labelnames=(),
+                 buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        # Each observation goes to its smallest bucket only, the
+        # cumulative counts are added up when rendered.
+        index = bisect_left(self.buckets, value)
+
+        with self._lock:
+            entry = self._values.get(key)
+
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1),
+                                             0.0, 0]
+
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def timer(self, **labels):
+        start = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def get(self, **labels):
+        """
+        Returns (sum, count) of the observations with these labels.
+        """
+
+        entry = self._values.get(self.key(labels))
+
+        return (entry[1], entry[2]) if entry else (0.0, 0)
+
+    def samples(self, key, value):
+        counts, total, count = value
+        cumulative = 0
+
+        for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket
+            labels = format_labels(self.labelnames, key,
+                                   [('le', format_value(bound))])
+            yield f'{self.name}_bucket{labels} {cumulative}'
+
+        labels = format_labels(self.labelnames, key)
+        yield f'{self.name}_sum{labels} {format_value(total)}'
+        yield f'{self.name}_count{labels} {count}'
+
+
+'''
+Registry
+    the metrics rendered together by GET /metrics
+'''
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, description, labelnames=()):
+        return self.register(Counter(name, description, labelnames))
+
+    def histogram(self, name, description, labelnames=(),
+                  buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, description, labelnames,
+                                       buckets))
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+        return metric
+
+    def render(self):
+        lines = []
+
+        for metric in self.metrics:
+            lines.extend(metric.render())
+
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+# Requests, by route pattern (e.g. /drinks/<id>), method and status code.
+request_duration = registry.histogram(
+    'http_request_duration_seconds', 'Time to serve a request.',
+    ('route', 'method', 'status'))
+
+# Token verification: 'jwks' is the signing key lookup, including any
+# download of the key set, 'verify' the signature and claims checks.
+auth_duration = registry.histogram(
+    'auth_duration_seconds', 'Time spent verifying tokens, by stage.',
+    ('stage',))
+
+auth_failures = registry.counter(
+    'auth_failures_total', 'Requests rejected by requires_auth, by code.',
+    ('code',))
+
+db_duration = registry.histogram(
+    'db_duration_seconds', 'Time spent in database queries per request.',
+    ('route',))
+
+db_queries = registry.counter(
+    'db_queries_total', 'Database queries run, by route.', ('route',))
+
+# Turning drinks into their short() / long() form and then into JSON.
+serialization_duration = registry.histogram(
+    'serialization_duration_seconds',
+    'Time spent serializing drinks per response, by representation.',
+    ('representation',))
+
+# cache is 'drinks' (serialized listings), 'token' (verified tokens) or
+# 'rejected' (recently rejected tokens).
+cache_requests = registry.counter(
+    'cache_requests_total', 'Cache lookups, by cache and result.',
+    ('cache', 'result'))
@@ -0,0 +1,74 @@
+import pytest
+
+from src.api import create_app
+from src.auth import local_issuer
+from src.auth.config import AuthConfig
+from src.auth.jwks import JWKSStore
+
+'''
+Fixtures of the test suite
+    every app is built by create_app on its own in-memory database, with an
+    AuthConfig trusting a locally generated key instead of Auth0: nothing
+    talks to the network
+    app runs each test twice, with the sync views and with AUTH_ASYNC
+'''
+
+ALL_PERMISSIONS = ('get:drinks', 'get:drinks-detail', 'post:drinks',
+                   'patch:drinks', 'delete:drinks')
+
+RECIPE = [{'name': 'espresso', 'color': 'brown', 'parts': 1}]
+
+signing_key = local_issuer.generate_key('RS256')
+JWKS = {'keys': [local_issuer.public_jwk(signing_key)]}
+
+
+def auth_config(**settings):
+    config = AuthConfig(**settings)
+    config.add_issuer(config.issuer, JWKSStore(
+        lambda: (JWKS, None), key_loader=config.verifier.load_key))
+
+    return config
+
+
+def bearer(app, permissions=ALL_PERMISSIONS, subject='test|user', **claims):
+    """
+    Returns the Authorization header of a token app accepts.
+    """
+
+    config = app.extensions['auth_config']
+    token = local_issuer.mint(signing_key, config.issuer, config.audience,
+                              subject, permissions, **claims)
+
+    return {'Authorization': 'Bearer ' + token}
+
+
+def add_drinks(client, count, first=0):
+    """
+    Inserts drinks number first to count - 1 through POST /drinks/bulk.
+    """
+
+    response = client.post('/drinks/bulk', headers=bearer(client.application),
+                           json={'drinks': [
+                               {'title': f'drink {i}', 'recipe': RECIPE}
+                               for i in range(first, count)]})
+    assert response.status_code == 200, response.get_json()
+    assert response.get_json()['inserted'] == count - first
+
+
+@pytest.fixture
+def make_app():
+    def make(**config):
+        return create_app(dict({'SQLALCHEMY_DATABASE_URI': 'sqlite://',
+                                'AUTH_CONFIG': auth_config()}, **config))
+
+    return make
+
+
+@pytest.fixture(params=[False, True], ids=['sync', 'async'])
+def app(request, make_app):
+    return make_app(AUTH_ASYNC=request.param)
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
@@ -0,0 +1,100 @@
+import asyncio
+import time
+
+from src import metrics
+
+from .conftest import RECIPE, add_drinks, bearer
+
+
+def test_auth_async_from_config(make_app):
+    sync_app = make_app()
+    async_app = make_app(AUTH_ASYNC=True)
+
+    assert not asyncio.iscoroutinefunction(
+        sync_app.view_functions['api.get_drinks'])
+    assert asyncio.iscoroutinefunction(
+        async_app.view_functions['api.get_drinks'])
+    # Routes without auth stay as they are.
+    assert async_app.view_functions['api.get_metrics'] is \
+        sync_app.view_functions['api.get_metrics']
+
+
+def test_drinks_crud(app, client):
+    headers = bearer(app)
+
+    response = client.post('/drinks', headers=headers,
+                           json={'title': 'mocha', 'recipe': RECIPE})
+    assert response.status_code == 200
+    drink = response.get_json()['drinks'][0]
+    assert drink['recipe'] == RECIPE
+
+    response = client.get('/drinks', headers=headers)
+    assert response.get_json()['drinks'] == [
+        {'id': drink['id'], 'title': 'mocha',
+         'recipe': [{'color': 'brown', 'parts': 1}]}]
+
+    response = client.patch(f'/drinks/{drink["id"]}', headers=headers,
+                            json={'title': 'dark mocha'})
+    assert response.get_json()['drinks'][0]['title'] == 'dark mocha'
+
+    response = client.get('/drinks-detail', headers=headers)
+    assert response.get_json()['drinks'][0]['recipe'] == RECIPE
+
+    response = client.delete(f'/drinks/{drink["id"]}', headers=headers)
+    assert response.get_json() == {'success': True, 'delete': str(drink['id'])}
+    assert client.get('/drinks', headers=headers).status_code == 404
+
+
+def test_search_and_bulk(app, client):
+    add_drinks(client, 30)
+    headers = bearer(app)
+
+    response = client.get('/drinks/search?q=drink 2', headers=headers)
+    assert response.get_json()['drinks'][0]['title'] == 'drink 2'
+    # Whether the index exists is known per app, for each of its engines.
+    assert list(app.extensions['search_index'].values()) == [True]
+
+    response = client.delete('/drinks/bulk', headers=headers,
+                             json={'ids': [1, 2, 3]})
+    assert response.get_json()['deleted'] == 3
+
+
+def test_auth_errors(app, client):
+    assert client.get('/drinks').status_code == 401
+    assert client.get('/drinks', headers={
+        'Authorization': 'Bearer not-a-token'}).status_code == 401
+    assert client.get('/drinks-detail', headers=bearer(
+        app, ['get:drinks'])).status_code == 401
+
+
+def test_streamed_request_timed_to_its_end(app, client):
+    def slow():
+        def generate():
+            yield 'slow'
+            time.sleep(0.3)
+            yield ' body'
+
+        return app.response_class(generate())
+
+    app.add_url_rule('/slow', 'slow', slow)
+    labels = {'route': '/slow', 'method': 'GET', 'status': 200}
+    before = metrics.request_duration.get(**labels)
+
+    # Closed as a server closes it, once the body is sent.
+    with client.get('/slow') as response:
+        assert response.get_data() == b'slow body'
+
+    total, count = metrics.request_duration.get(**labels)
+    assert count == before[1] + 1
+    assert total - before[0] >= 0.3
+
+
+def test_event_stream_timed_until_it_starts(app, client):
+    labels = {'route': '/drinks/events', 'method': 'GET', 'status': 200}
+    before = metrics.request_duration.get(**labels)[1]
+
+    response = client.get('/drinks/events', headers=bearer(app),
+                          buffered=False)
+    assert metrics.request_duration.get(**labels)[1] == before + 1
+    response.close()
+    assert metrics.request_duration.get(**labels)[1] == before + 1
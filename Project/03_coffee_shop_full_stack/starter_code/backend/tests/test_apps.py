@@ -0,0 +1,62 @@
+import threading
+
+from src.database.models import (db, read_session, read_session_for,
+                                 write_pins)
+
+from .conftest import add_drinks, bearer
+
+
+def test_apps_on_their_own_memory_databases(make_app):
+    first, second = make_app(), make_app()
+    add_drinks(first.test_client(), 3)
+
+    assert len(first.test_client().get('/drinks', headers=bearer(
+        first)).get_json()['drinks']) == 3
+    assert second.test_client().get('/drinks', headers=bearer(
+        second)).status_code == 404
+
+
+def test_apps_side_by_side(make_app, tmp_path):
+    # As pytest-xdist workers would run them, in one process here.
+    apps = [make_app(SQLALCHEMY_DATABASE_URI=(
+        f'sqlite:///{tmp_path}/{n}.db' if n % 2 else 'sqlite://'))
+        for n in range(4)]
+    counts = {}
+
+    def worker(n):
+        client = apps[n].test_client()
+        add_drinks(client, 10 + n)
+        counts[n] = len(client.get('/drinks', headers=bearer(
+            apps[n])).get_json()['drinks'])
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert counts == {n: 10 + n for n in range(4)}
+    # Nor do they share their caches and auth configs.
+    assert len({id(app.extensions['drinks_cache']) for app in apps}) == 4
+    assert len({id(app.extensions['auth_config']) for app in apps}) == 4
+
+
+def test_write_pins_per_app(make_app, tmp_path):
+    first, second = [make_app(
+        SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/{name}.db',
+        SQLALCHEMY_REPLICA_URI='readonly', **config)
+        for name, config in (('first', {}),
+                             ('second', {'READ_YOUR_WRITES_SECONDS': 0}))]
+
+    with first.app_context():
+        write_pins.pin('test|user')
+        assert read_session_for('test|user') is db.session
+        assert read_session_for('other|user') is read_session
+
+    # Not pinned by the write to first, nor by its own: the window is 0.
+    with second.app_context():
+        assert read_session_for('test|user') is read_session
+        write_pins.pin('test|user')
+        assert read_session_for('test|user') is read_session
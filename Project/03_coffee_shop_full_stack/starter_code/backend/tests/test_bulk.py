@@ -0,0 +1,32 @@
+import json
+
+from .conftest import RECIPE, add_drinks, bearer
+
+
+def test_bulk_insert_reports_errors(app, client):
+    response = client.post('/drinks/bulk', headers=bearer(app), json={
+        'drinks': [{'title': 'first', 'recipe': RECIPE},
+                   {'title': 'first', 'recipe': RECIPE},
+                   {'title': 'no recipe'}]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['inserted'] == 1
+    assert [error['index'] for error in body['errors']] == [1, 2]
+
+
+def test_export(app, client):
+    add_drinks(client, 1200)
+    headers = bearer(app)
+
+    response = client.get('/drinks/export', headers=headers)
+    assert response.status_code == 200
+    assert response.is_streamed
+    assert response.mimetype == 'application/x-ndjson'
+    lines = response.get_data(as_text=True).splitlines()
+    assert [json.loads(line) for line in lines] == client.get(
+        '/drinks-detail', headers=headers).get_json()['drinks']
+
+
+def test_export_requires_detail(app, client):
+    assert client.get('/drinks/export', headers=bearer(
+        app, ['get:drinks'])).status_code == 401
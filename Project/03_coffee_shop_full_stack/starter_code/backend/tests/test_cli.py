@@ -0,0 +1,42 @@
+from .conftest import auth_config
+
+
+def keygen(runner, tmp_path, name='internal-key.pem', *args):
+    result = runner.invoke(args=['auth', 'keygen', str(tmp_path / name),
+                                 *args])
+    assert result.exit_code == 0, result.output
+
+
+def test_mint_needs_local_issuing(make_app, tmp_path):
+    app = make_app()
+    runner = app.test_cli_runner()
+    keygen(runner, tmp_path, 'internal-key.pem', '--jwks',
+           str(tmp_path / 'internal-jwks.json'))
+
+    result = runner.invoke(args=['auth', 'mint', '--subject', 'svc|batch',
+                                 '--key', str(tmp_path / 'internal-key.pem')])
+    assert result.exit_code == 2
+    assert 'Local issuing is not enabled' in result.output
+
+
+def test_mint_and_use_a_token(make_app, tmp_path):
+    jwks_file = str(tmp_path / 'internal-jwks.json')
+    app = make_app(AUTH_CONFIG=auth_config(local_jwks_file=jwks_file))
+    runner = app.test_cli_runner()
+    keygen(runner, tmp_path)
+
+    # A key missing from the key set of the local issuer.
+    keygen(runner, tmp_path, 'other-key.pem', '--jwks',
+           str(tmp_path / 'other-jwks.json'))
+    result = runner.invoke(args=['auth', 'mint', '--subject', 'svc|batch',
+                                 '--key', str(tmp_path / 'other-key.pem')])
+    assert result.exit_code == 2
+    assert 'is not in' in result.output
+
+    result = runner.invoke(args=[
+        'auth', 'mint', '--subject', 'svc|batch', '--permission',
+        'get:drinks', '--key', str(tmp_path / 'internal-key.pem')])
+    assert result.exit_code == 0, result.output
+    response = app.test_client().get('/drinks', headers={
+        'Authorization': 'Bearer ' + result.output.strip()})
+    assert response.status_code == 404
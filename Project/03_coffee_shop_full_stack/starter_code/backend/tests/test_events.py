@@ -0,0 +1,126 @@
+import json
+import time
+
+from .conftest import RECIPE, bearer
+
+'''
+GET /drinks/events through the test client: the body of an unbuffered
+response is read frame by frame, the drinks being posted beforehand so that
+no read waits for an event
+'''
+
+
+def subscribe(client, headers, last_event_id=None):
+    if last_event_id is not None:
+        headers = dict(headers, **{'Last-Event-ID': last_event_id})
+
+    response = client.get('/drinks/events', headers=headers, buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    return response
+
+
+def read_events(response, count):
+    """
+    Returns the next count events of response, as dicts of their fields.
+    """
+
+    events = []
+    frames = iter(response.response)
+
+    while len(events) < count:
+        frame = next(frames).decode('utf-8')
+        fields = dict(line.split(': ', 1) for line in frame.split('\n')
+                      if ': ' in line and not line.startswith(':'))
+
+        if 'event' in fields:
+            events.append(fields)
+
+    return events
+
+
+def post_drinks(client, headers, titles):
+    for title in titles:
+        response = client.post('/drinks', headers=headers, json={
+            'title': title, 'recipe': RECIPE})
+        assert response.status_code == 200
+
+
+def test_events_fan_out(app, client):
+    headers = bearer(app)
+    events = app.extensions['drink_events']
+    detail = subscribe(client, headers)
+    short = subscribe(client, bearer(app, ['get:drinks']))
+    assert len(events) == 2
+
+    post_drinks(client, headers, ['first', 'second'])
+    drink_id = client.get('/drinks', headers=headers).get_json()[
+        'drinks'][0]['id']
+    client.delete(f'/drinks/{drink_id}', headers=headers)
+
+    for response, recipe in ((detail, RECIPE),
+                             (short, [{'color': 'brown', 'parts': 1}])):
+        received = read_events(response, 3)
+        assert [event['event'] for event in received] == [
+            'insert', 'insert', 'delete']
+        drinks = [json.loads(event['data'])['drink'] for event in received]
+        assert [drink['title'] for drink in drinks] == [
+            'first', 'second', 'first']
+        assert drinks[0]['recipe'] == recipe
+
+    detail.close()
+    short.close()
+    assert len(events) == 0
+
+
+def test_events_replay(app, client):
+    headers = bearer(app)
+    stream = subscribe(client, headers)
+    post_drinks(client, headers, [f'drink {n}' for n in range(5)])
+    first = read_events(stream, 1)[0]
+    stream.close()
+
+    # Reconnecting after the first event: the other ones are replayed.
+    replay = subscribe(client, headers, first['id'])
+    titles = [json.loads(event['data'])['drink']['title']
+              for event in read_events(replay, 4)]
+    assert titles == [f'drink {n}' for n in range(1, 5)]
+    replay.close()
+
+    # An id from another boot: the client has to reload the drinks.
+    reset = subscribe(client, headers, 'unknown-3')
+    assert read_events(reset, 1)[0]['event'] == 'reset'
+    reset.close()
+
+
+def test_events_bulk_write_resets(app, client):
+    headers = bearer(app)
+    stream = subscribe(client, headers)
+    client.post('/drinks/bulk', headers=headers, json={'drinks': [
+        {'title': 'bulk', 'recipe': RECIPE}]})
+
+    assert read_events(stream, 1)[0]['event'] == 'reset'
+    stream.close()
+
+
+def test_events_too_many_subscribers(make_app):
+    app = make_app(DRINK_EVENTS_MAX_SUBSCRIBERS=1)
+    client = app.test_client()
+    stream = subscribe(client, bearer(app))
+
+    assert client.get('/drinks/events', headers=bearer(app)).status_code == \
+        503
+    stream.close()
+
+
+def test_events_end_when_the_token_expires(app, client):
+    stream = subscribe(client, bearer(app, exp=time.time() + 0.5))
+    started = time.monotonic()
+
+    assert read_events(stream, 1)[0]['event'] == 'expired'
+    assert time.monotonic() - started >= 0.3
+    # The stream is over, and its subscription gone.
+    assert list(stream.response) == []
+    assert len(app.extensions['drink_events']) == 0
+    stream.close()
@@ -0,0 +1,135 @@
+import json
+import re
+import sqlite3
+from datetime import datetime, timedelta
+
+from werkzeug.http import http_date
+
+from src.database.models import (Drink, TableVersion, db,
+                                 db_drop_and_create_all)
+
+from .conftest import add_drinks, bearer
+
+
+def age_table_version(app, seconds):
+    """
+    Moves the last write to the drinks back by seconds.
+    """
+
+    with app.app_context():
+        db.session.query(TableVersion).filter(
+            TableVersion.name == Drink.__tablename__).update(
+            {'updated_at': datetime.utcnow().replace(microsecond=0) -
+             timedelta(seconds=seconds)})
+        db.session.commit()
+
+
+def test_etag_not_modified(app, client):
+    add_drinks(client, 3)
+    headers = bearer(app)
+
+    response = client.get('/drinks', headers=headers)
+    etag = response.headers['ETag']
+    assert client.get('/drinks', headers=dict(
+        headers, **{'If-None-Match': etag})).status_code == 304
+
+    client.post('/drinks/bulk', headers=headers, json={'drinks': [
+        {'title': 'another', 'recipe': [{'name': 'x', 'color': 'y',
+                                         'parts': 1}]}]})
+    response = client.get('/drinks', headers=dict(
+        headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert len(response.get_json()['drinks']) == 4
+
+
+def test_last_modified_once_its_second_is_over(app, client):
+    add_drinks(client, 3)
+    headers = bearer(app)
+
+    # Written within this second: another write may still share the date.
+    response = client.get('/drinks', headers=headers)
+    assert 'Last-Modified' not in response.headers
+    response = client.get('/drinks', headers=dict(
+        headers, **{'If-Modified-Since': http_date(datetime.utcnow())}))
+    assert response.status_code == 200
+
+    age_table_version(app, 5)
+    response = client.get('/drinks', headers=headers)
+    last_modified = response.headers['Last-Modified']
+    assert client.get('/drinks', headers=dict(
+        headers, **{'If-Modified-Since': last_modified})).status_code == 304
+
+
+def test_etag_wins_over_if_modified_since(app, client):
+    add_drinks(client, 3)
+    age_table_version(app, 5)
+    headers = bearer(app)
+    last_modified = client.get('/drinks', headers=headers).headers[
+        'Last-Modified']
+
+    response = client.get('/drinks', headers=dict(headers, **{
+        'If-None-Match': '"drinks-short-0"',
+        'If-Modified-Since': last_modified}))
+    assert response.status_code == 200
+
+
+def test_stream_matches_listing(app, client):
+    # More drinks than a batch, so that the body comes in several chunks.
+    add_drinks(client, 1200)
+    headers = bearer(app)
+
+    for path in ('/drinks', '/drinks-detail', '/drinks?fields=id,title'):
+        listing = client.get(path, headers=headers).get_json()
+        response = client.get(path + ('&' if '?' in path else '?') +
+                              'stream=true', headers=headers)
+        assert response.status_code == 200
+        assert response.is_streamed
+        assert json.loads(response.get_data()) == listing
+
+
+def test_stream_without_drinks(app, client):
+    response = client.get('/drinks?stream=true', headers=bearer(app))
+    assert response.status_code == 404
+
+
+def test_etag_of_a_reset_database(app, client):
+    add_drinks(client, 1)
+    add_drinks(client, 2, first=1)
+    headers = bearer(app)
+    etag = client.get('/drinks', headers=headers).headers['ETag']
+
+    generation = app.extensions['drinks_cache'].generation
+
+    # Two inserts: the version is back to the number it had.
+    with app.app_context():
+        db_drop_and_create_all()
+
+    assert app.extensions['drinks_cache'].generation > generation
+
+    response = client.get('/drinks', headers=dict(
+        headers, **{'If-None-Match': etag}))
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    # Nor is the listing of the former database served from the cache.
+    response = client.get('/drinks', headers=headers)
+    assert [drink['title'] for drink in response.get_json()['drinks']] == [
+        'water', 'latte']
+
+
+def test_epoch_added_to_an_older_database(make_app, tmp_path):
+    path = tmp_path / 'old.db'
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE table_versions (name VARCHAR(80) '
+                       'PRIMARY KEY, version INTEGER NOT NULL, '
+                       'updated_at DATETIME NOT NULL)')
+    connection.execute("INSERT INTO table_versions VALUES "
+                       "('drink', 2, '2020-01-01 00:00:00')")
+    connection.commit()
+    connection.close()
+
+    app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{path}')
+    client = app.test_client()
+    add_drinks(client, 1)
+    response = client.get('/drinks', headers=bearer(app))
+    assert re.fullmatch(r'"drinks-short-3-[0-9a-f]{16}"',
+                        response.headers['ETag'])
@@ -0,0 +1,125 @@
+import threading
+
+import pytest
+
+from src.database.models import (Drink, bulk_delete_drinks, bulk_save_drinks,
+                                 db)
+
+from .conftest import RECIPE, add_drinks, bearer
+
+
+@pytest.fixture(params=[False, True], ids=['sync', 'async'])
+def file_app(request, make_app, tmp_path):
+    # A pool that counts its connections: sqlite:// shares a single one.
+    return make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/test.db',
+                    AUTH_ASYNC=request.param, DRINKS_CACHE_ENABLED=False)
+
+
+def test_connections_back_to_the_pool(file_app):
+    app = file_app
+    client = app.test_client()
+    add_drinks(client, 600)
+    headers = bearer(app)
+    statuses = {}
+    errors = []
+
+    def worker(index):
+        client = app.test_client()
+
+        try:
+            for number in range(40):
+                kind = number % 7
+
+                if kind == 0:
+                    response = client.post('/drinks', headers=headers, json={
+                        'title': f'drink {index}-{number}',
+                        'recipe': RECIPE})
+                elif kind == 1:
+                    # Taken title: rolled back with a 422.
+                    response = client.post('/drinks', headers=headers, json={
+                        'title': 'drink 1', 'recipe': RECIPE})
+                elif kind == 2:
+                    response = client.delete('/drinks/0', headers=headers)
+                elif kind == 3:
+                    response = client.get('/drinks?stream=true',
+                                          headers=headers)
+                elif kind == 4:
+                    response = client.get('/drinks/export', headers=headers)
+                else:
+                    response = client.get('/drinks?limit=50',
+                                          headers=headers)
+
+                response.get_data()
+                assert response.headers.get('Server-Timing', '').startswith(
+                    'db;dur=') or response.is_streamed
+                statuses[response.status_code] = \
+                    statuses.get(response.status_code, 0) + 1
+        except Exception as error:
+            errors.append(error)
+
+    workers = [threading.Thread(target=worker, args=(index,))
+               for index in range(4)]
+
+    for thread in workers:
+        thread.start()
+
+    for thread in workers:
+        thread.join()
+
+    assert errors == []
+    assert set(statuses) == {200, 404, 422}
+
+    with app.app_context():
+        assert db.engine.pool.checkedout() == 0
+
+
+def test_failed_request_rolls_back(app, client):
+    headers = bearer(app)
+    add_drinks(client, 1)
+
+    response = client.post('/drinks', headers=headers, json={
+        'title': 'drink 0', 'recipe': RECIPE})
+    assert response.status_code == 422
+    # The session of the next request is not left in a failed transaction.
+    response = client.post('/drinks', headers=headers, json={
+        'title': 'another', 'recipe': RECIPE})
+    assert response.status_code == 200
+    assert len(client.get('/drinks', headers=headers).get_json()[
+        'drinks']) == 2
+
+
+def test_failed_queries_leave_no_timer_behind(app, client):
+    headers = bearer(app)
+    add_drinks(client, 1)
+
+    for _ in range(5):
+        assert client.post('/drinks', headers=headers, json={
+            'title': 'drink 0', 'recipe': RECIPE}).status_code == 422
+
+    # sqlite:// runs every request on its one connection.
+    with app.app_context(), db.engine.connect() as connection:
+        assert 'query_started' not in connection.info
+
+    # The queries of the next request are still timed.
+    response = client.get('/drinks', headers=headers)
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert '"0 queries"' not in response.headers['Server-Timing']
+
+
+def test_bulk_writes_in_the_request_transaction(make_app, tmp_path):
+    app = make_app(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/test.db')
+    add_drinks(app.test_client(), 1)
+
+    # A request whose response fails: the unit of work rolls back the
+    # bulk writes of the view, chunks and savepoints included.
+    with app.test_request_context():
+        app.preprocess_request()
+        result = bulk_save_drinks(
+            [{'title': f'bulk {n}', 'recipe': RECIPE} for n in range(5)] +
+            [{'title': 'drink 0', 'recipe': RECIPE}], chunk_size=2)
+        assert result['inserted'] == 5
+        assert bulk_delete_drinks([1])['deleted'] == 1
+        app.process_response(app.response_class(status=500))
+
+    with app.app_context():
+        assert [drink.title for drink in Drink.query.all()] == ['drink 0']
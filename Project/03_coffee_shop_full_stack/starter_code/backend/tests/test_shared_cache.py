@@ -0,0 +1,48 @@
+import sqlite3
+import threading
+
+import pytest
+
+from src.auth import shared
+from src.auth.shared import SharedCache
+
+from .conftest import auth_config, bearer
+
+
+def test_prunes_counted_across_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(shared, 'PRUNE_EVERY', 100)
+    cache = SharedCache(str(tmp_path / 'cache.db'), maxsize=10)
+
+    def writer(number):
+        for n in range(100):
+            cache.put(f'{number}-{n}'.encode(), 'value', 2e9 + n)
+
+    threads = [threading.Thread(target=writer, args=(number,))
+               for number in range(4)]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    # The 400th write, whichever thread made it, pruned the surplus.
+    assert len(cache) == 10
+
+
+@pytest.mark.parametrize('auth_async', [False, True], ids=['sync', 'async'])
+def test_failing_shared_cache_falls_back(make_app, tmp_path, caplog,
+                                         auth_async):
+    config = auth_config(shared_cache=str(tmp_path / 'cache.db'))
+    app = make_app(AUTH_CONFIG=config, AUTH_ASYNC=auth_async)
+    client = app.test_client()
+
+    def locked(*args):
+        raise sqlite3.OperationalError('database is locked')
+
+    config.shared_cache.get = config.shared_cache.put = locked
+
+    for _ in range(2):
+        assert client.get('/drinks-detail',
+                          headers=bearer(app)).status_code == 404
+    assert 'Shared token cache unavailable' in caplog.text
@@ -0,0 +1,94 @@
+import time
+
+import pytest
+
+from src.auth import local_issuer
+from src.auth.auth import AuthError, verify_decode_jwt
+from src.auth.config import AuthConfig
+from src.auth.jwks import JWKSStore
+from src.auth.verifiers import VERIFIERS
+
+'''
+Conformance of the verifier backends
+    every backend of VERIFIERS gets the same tokens through
+    verify_decode_jwt and must accept the same ones, and reject the others
+    with the same AuthError code and status
+'''
+
+rsa_key = local_issuer.generate_key('RS256')
+ec_key = local_issuer.generate_key('ES256')
+unknown_key = local_issuer.generate_key('RS256')
+
+# The kid of ec_key names an RSA key: its tokens pass get_token_issuer, the
+# backend has to refuse the key for ES256.
+JWKS = {'keys': [local_issuer.public_jwk(rsa_key),
+                 dict(local_issuer.public_jwk(rsa_key),
+                      kid=local_issuer.public_jwk(ec_key)['kid'])]}
+
+
+def claims(**overrides):
+    now = int(time.time())
+    config = AuthConfig()
+    payload = {'iss': config.issuer, 'aud': config.audience,
+               'sub': 'test|user', 'iat': now, 'exp': now + 3600,
+               'permissions': ['get:drinks']}
+    payload.update(overrides)
+
+    return payload
+
+
+def bad_signature():
+    header, payload, _ = local_issuer.sign(claims(), rsa_key).split('.')
+    other = local_issuer.sign(claims(sub='test|other'), rsa_key)
+
+    return f'{header}.{payload}.{other.split(".")[2]}'
+
+
+CASES = {
+    'valid': (lambda: local_issuer.sign(claims(), rsa_key), None),
+    'expired': (lambda: local_issuer.sign(
+        claims(exp=int(time.time()) - 60), rsa_key),
+        ('token_expired', 401)),
+    'wrong audience': (lambda: local_issuer.sign(
+        claims(aud='another-api'), rsa_key), ('invalid_claims', 401)),
+    'wrong issuer': (lambda: local_issuer.sign(
+        claims(iss='https://elsewhere.example/'), rsa_key),
+        ('invalid_claims', 401)),
+    'unknown kid': (lambda: local_issuer.sign(claims(), unknown_key),
+                    ('invalid_header', 400)),
+    'bad signature': (bad_signature, ('invalid_header', 400)),
+    'alg mismatch': (lambda: local_issuer.sign(claims(), ec_key),
+                     ('invalid_header', 400)),
+    'float exp': (lambda: local_issuer.sign(
+        claims(exp=time.time() + 3600.5, iat=time.time()), rsa_key), None),
+    'float exp expired': (lambda: local_issuer.sign(
+        claims(exp=time.time() - 60.5), rsa_key), ('token_expired', 401)),
+}
+
+
+def verify(backend, token):
+    config = AuthConfig(backend=backend, algorithms=('RS256', 'ES256'))
+    config.add_issuer(config.issuer, JWKSStore(
+        lambda: (JWKS, None), key_loader=config.verifier.load_key))
+
+    try:
+        verify_decode_jwt(token, config)
+    except AuthError as error:
+        return error.error['code'], error.status_code
+
+    return None
+
+
+@pytest.mark.parametrize('case', CASES)
+@pytest.mark.parametrize('backend', VERIFIERS)
+def test_backends_agree(backend, case):
+    make_token, expected = CASES[case]
+
+    assert verify(backend, make_token()) == expected
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_same_error_from_every_backend(case):
+    token = CASES[case][0]()
+
+    assert len({verify(backend, token) for backend in VERIFIERS}) == 1
@@ -1,35 +1,82 @@
 #!/usr/bin/python
 # -*- coding: iso-8859-15 -*-
+import hashlib
+import json
+import threading
+from types import MappingProxyType
+
 from flask import Flask, request, jsonify, abort
 
 app = Flask(__name__)
 
-greetings = {
-            'en': 'hello', 
-            'es': 'Hola', 
+# One version of the greetings, never modified once built. The body of
+# GET /greeting is encoded once per snapshot (the bytes jsonify writes
+# outside of debug mode), its ETag is a digest of the body.
+class Snapshot:
+    def __init__(self, version, greetings):
+        self.version = version
+        self.greetings = MappingProxyType(greetings)
+        self.body = json.dumps({'greetings': greetings}, sort_keys=True,
+                               separators=(',', ':')) + '\n'
+        self.etag = hashlib.sha1(self.body.encode('utf-8')).hexdigest()
+
+# Readers take the current snapshot without locking, writers copy it and
+# swap the copy in, one writer at a time.
+class GreetingStore:
+    def __init__(self, greetings):
+        self.snapshot = Snapshot(1, dict(greetings))
+        self._lock = threading.Lock()
+
+    def add(self, greetings):
+        with self._lock:
+            current = self.snapshot
+            updated = dict(current.greetings)
+            updated.update(greetings)
+            self.snapshot = Snapshot(current.version + 1, updated)
+            return self.snapshot
+
+greetings = GreetingStore({
+            'en': 'hello',
+            'es': 'Hola',
             'ar': 'مرحبا',
             'ru': 'Привет',
             'fi': 'Hei',
             'he': 'שלום',
             'ja': 'こんにちは'
-            }
+            })
+
+def greetings_response(snapshot):
+    response = app.response_class(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    return response.make_conditional(request)
 
 @app.route('/greeting', methods=['GET'])
 def greeting_all():
-    return jsonify({'greetings': greetings})
+    return greetings_response(greetings.snapshot)
 
 @app.route('/greeting/<lang>', methods=['GET'])
 def greeting_one(lang):
     print(lang)
-    if(lang not in greetings):
+    snapshot = greetings.snapshot
+    if(lang not in snapshot.greetings):
         abort(404)
-    return jsonify({'greeting': greetings[lang
+    return jsonify({'greeting': snapshot.greetings[lang
     ]})
 
+# Takes {"lang": ..., "greeting": ...}, or {"greetings": {lang: greeting}}
+# to add many languages at once.
 @app.route('/greeting', methods=['POST'])
 def greeting_add():
-    info = request.get_json()
-    if('lang' not in info or 'greeting' not in info):
+    info = request.get_json(silent=True)
+    if(not isinstance(info, dict)):
+        abort(422)
+    if('greetings' in info):
+        new_greetings = info['greetings']
+    elif('lang' in info and 'greeting' in info):
+        new_greetings = {info['lang']: info['greeting']}
+    else:
+        abort(422)
+    if(not isinstance(new_greetings, dict) or not all(
+            isinstance(lang, str) for lang in new_greetings)):
         abort(422)
-    greetings[info['lang']] = info['greeting']
-    return jsonify({'greetings':greetings})
+    return greetings_response(greetings.add(new_greetings))
@@ -0,0 +1,91 @@
+#!/usr/bin/python
+# Read throughput of GET /greeting with and without writers posting
+# greetings, one at a time and in bulk. What readers see while the writers
+# run is checked by test_FlaskRecap.py.
+#
+#     python bench_greetings.py [readers] [--seconds 2] [--languages 1000]
+import argparse
+import json
+import threading
+import time
+
+from flask import jsonify
+
+from FlaskRecap import app, greetings
+
+def reader(stop, results):
+    client = app.test_client()
+    reads = 0
+    while not stop.is_set():
+        response = client.get('/greeting')
+        assert response.status_code == 200, response.status_code
+        json.loads(response.get_data(as_text=True))
+        reads += 1
+    results.append(reads)
+
+def writer(stop, number, results):
+    client = app.test_client()
+    writes = 0
+    while not stop.is_set():
+        key = '{}-{}'.format(number, writes)
+        if(writes % 2):
+            response = client.post('/greeting', json={'greetings': {
+                'bulk-a-' + key: key, 'bulk-b-' + key: key}})
+        else:
+            response = client.post('/greeting', json={
+                'lang': 'one-' + key, 'greeting': key})
+        assert response.status_code == 200, response.status_code
+        writes += 1
+    results.append(writes)
+
+def run(readers, writers, seconds):
+    stop = threading.Event()
+    reads = []
+    writes = []
+    threads = [threading.Thread(target=reader, args=(stop, reads))
+               for _ in range(readers)]
+    threads += [threading.Thread(target=writer, args=(stop, n, writes))
+                for n in range(writers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    assert len(reads) == readers and len(writes) == writers
+    print('  {} readers, {} writers: {:>8.0f} reads/s, {:>6.0f} writes/s'
+          .format(readers, writers, sum(reads) / seconds,
+                  sum(writes) / seconds))
+
+def encode(rounds=200):
+    snapshot = greetings.snapshot
+    with app.app_context():
+        start = time.perf_counter()
+        for _ in range(rounds):
+            jsonify({'greetings': dict(snapshot.greetings)})
+        per_request = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        app.response_class(snapshot.body, mimetype='application/json')
+    cached = (time.perf_counter() - start) / rounds
+    print('  {} languages: jsonify {:.1f} us, cached body {:.1f} us'
+          .format(len(snapshot.greetings), per_request * 1e6, cached * 1e6))
+
+def main(readers=4, seconds=2.0, languages=1000):
+    app.logger.disabled = True
+    print('GET /greeting')
+    run(readers, 0, seconds)
+    run(readers, 2, seconds)
+    print('encoding the greetings')
+    encode()
+    greetings.add({'lang-{}'.format(n): 'hello {}'.format(n)
+                   for n in range(languages)})
+    encode()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('readers', nargs='?', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=2.0)
+    parser.add_argument('--languages', type=int, default=1000)
+    args = parser.parse_args()
+    main(args.readers, args.seconds, args.languages)
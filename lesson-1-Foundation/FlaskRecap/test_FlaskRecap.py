@@ -0,0 +1,86 @@
+# Tests of the greeting routes, with readers and writers running together.
+#
+#     python -m pytest test_FlaskRecap.py
+import json
+import threading
+
+import pytest
+
+import FlaskRecap
+from FlaskRecap import GreetingStore, app
+
+@pytest.fixture
+def client(monkeypatch):
+    # A store of its own per test: the greetings added do not leak.
+    monkeypatch.setattr(FlaskRecap, 'greetings',
+                        GreetingStore({'en': 'hello', 'fi': 'Hei'}))
+    return app.test_client()
+
+def test_greetings_etag(client):
+    response = client.get('/greeting')
+    assert response.get_json() == {'greetings': {'en': 'hello', 'fi': 'Hei'}}
+    etag = response.headers['ETag']
+    assert client.get('/greeting', headers={
+        'If-None-Match': etag}).status_code == 304
+
+    client.post('/greeting', json={'lang': 'es', 'greeting': 'Hola'})
+    response = client.get('/greeting', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json()['greetings']['es'] == 'Hola'
+
+def test_add_greetings(client):
+    response = client.post('/greeting', json={'greetings': {
+        'es': 'Hola', 'ja': 'こんにちは'}})
+    assert response.status_code == 200
+    assert client.get('/greeting/ja').get_json() == {'greeting': 'こんにちは'}
+    assert client.get('/greeting/xx').status_code == 404
+    for body in ([], {'lang': 'es'}, {'greetings': ['es']}):
+        assert client.post('/greeting', json=body).status_code == 422
+
+def test_readers_and_writers(client):
+    errors = []
+
+    def reader():
+        client = app.test_client()
+        seen = 0
+        try:
+            for _ in range(200):
+                current = json.loads(client.get('/greeting').get_data(
+                    as_text=True))['greetings']
+                # Greetings are only ever added: a reader never sees fewer.
+                assert len(current) >= seen, (len(current), seen)
+                seen = len(current)
+                # Both languages of a bulk POST show up in the same response.
+                for lang, greeting in current.items():
+                    if(lang.startswith('bulk-a-')):
+                        pair = 'bulk-b-' + lang[len('bulk-a-'):]
+                        assert current.get(pair) == greeting, (lang, pair)
+        except AssertionError as error:
+            errors.append(error)
+
+    def writer(number):
+        client = app.test_client()
+        for n in range(100):
+            key = '{}-{}'.format(number, n)
+            if(n % 2):
+                response = client.post('/greeting', json={'greetings': {
+                    'bulk-a-' + key: key, 'bulk-b-' + key: key}})
+            else:
+                response = client.post('/greeting', json={
+                    'lang': 'one-' + key, 'greeting': key})
+            if(response.status_code != 200):
+                errors.append(response.status_code)
+
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    threads += [threading.Thread(target=writer, args=(number,))
+                for number in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    # No write lost: 2 writers, 50 single and 50 bulk (2 languages) each.
+    snapshot = FlaskRecap.greetings.snapshot
+    assert len(snapshot.greetings) == 2 + 2 * (50 + 2 * 50)
+    assert snapshot.version == 1 + 2 * 100
@@ -1,5 +1,6 @@
 from flask import Flask, request, abort
 import json
+import os
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
@@ -7,9 +8,58 @@ from urllib.request import urlopen
 
 app = Flask(__name__)
 
-AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
-ALGORITHMS = ['RS256']
-API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
+
+class AuthConfig:
+    """The Auth0 settings, under the names the coffee shop backend uses
+    (see src/auth/config.py), read from the app config or the environment,
+    e.g.
+        export AUTH0_DOMAIN=your-tenant.us.auth0.com
+        export API_AUDIENCE=your-api-audience
+    The issuer and key set URL are built here, not on every request.
+    """
+
+    def __init__(self, domain, audience, jwks_url=None,
+                 algorithms=('RS256',)):
+        self.domain = domain
+        self.audience = audience
+        self.algorithms = list(algorithms)
+        self.issuer = 'https://' + domain + '/'
+        self.jwks_url = jwks_url or f'https://{domain}/.well-known/jwks.json'
+
+    @classmethod
+    def from_app(cls, app):
+        def setting(name, default=None, required=True):
+            value = app.config.get(name, os.environ.get(name, default))
+
+            if not value and required:
+                raise RuntimeError(f'Set {name}, in the app config or the '
+                                   f'environment.')
+
+            return value
+
+        return cls(setting('AUTH0_DOMAIN'), setting('API_AUDIENCE'),
+                   setting('AUTH0_JWKS_URL', required=False),
+                   [algorithm.strip() for algorithm in
+                    setting('AUTH_ALGORITHMS', 'RS256').split(',')])
+
+
+def get_auth_config():
+    """Builds the AuthConfig of the app on first use, so that the app can be
+    imported (and configured) before the settings are there.
+    """
+    config = app.extensions.get('auth_config')
+
+    if config is None:
+        config = app.extensions['auth_config'] = AuthConfig.from_app(app)
+
+    return config
+
+
+@app.before_request
+def load_auth_config():
+    # Here rather than in requires_auth, which turns every error into a 401:
+    # missing settings show up as a server error naming them.
+    get_auth_config()
 
 
 class AuthError(Exception):
@@ -52,7 +102,8 @@ def get_token_auth_header():
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+    auth_config = get_auth_config()
+    jsonurl = urlopen(auth_config.jwks_url)
     jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
     rsa_key = {}
@@ -76,9 +127,9 @@ def verify_decode_jwt(token):
             payload = jwt.decode(
                 token,
                 rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
+                algorithms=auth_config.algorithms,
+                audience=auth_config.audience,
+                issuer=auth_config.issuer
             )
 
             return payload